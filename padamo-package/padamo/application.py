@@ -11,6 +11,7 @@ import tkinter as tk
 from .tools import Toolbox,Viewer,ProcessingEditor,Quicklook,RemoteExplorer,Bookmarker,DeviceEditor,Trigger
 from .node_lib.index import load_addons
 from .utilities.workspace import Workspace
+from .lazy_array_operations.precision import PRECISIONS, PRECISION_KEY, get_compute_precision
 from .build import APP_NAME
 
 print(f"Threading layer chosen: {threading_layer()}")
@@ -43,6 +44,12 @@ class Application(tk.Tk):
 
         settings_menu = tk.Menu(topmenu, tearoff=0)
         settings_menu.add_command(command=self.on_settings_setup, label="Setup workspace")
+        precision_menu = tk.Menu(settings_menu, tearoff=0)
+        self.precision_var = tk.StringVar(self, value=get_compute_precision())
+        for precision in PRECISIONS:
+            precision_menu.add_radiobutton(label=precision, value=precision, variable=self.precision_var,
+                                           command=self.on_precision_change)
+        settings_menu.add_cascade(label="Compute precision", menu=precision_menu)
 
         topmenu.add_cascade(label="File", menu=filemenu)
         topmenu.add_cascade(label="Run", menu=runmenu)
@@ -61,6 +68,10 @@ class Application(tk.Tk):
     def on_settings_setup(self):
         Workspace.initialize_workspace(True)
 
+    def on_precision_change(self):
+        self.toolbox.globals[PRECISION_KEY] = self.precision_var.get()
+        self.toolbox.trigger_globals_update()
+
     def on_run(self):
         self.editor:ProcessingEditor
         self.editor.on_run()
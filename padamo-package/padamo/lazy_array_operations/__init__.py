@@ -1 +1,3 @@
-from .base import LazyArrayOperation
\ No newline at end of file
+from .base import LazyArrayOperation
+from .caching import CachedLazyArray
+from .prefetching import PrefetchedLazyArray
@@ -1,3 +1,6 @@
+import bisect
+import copy
+import functools
 import typing
 import inspect
 import warnings
@@ -6,6 +9,8 @@ import numpy as np
 
 from .slice_combination import *
 from padamo.lazy_array_operations.slice_combination import normalize_slice
+from .evaluation import evaluated, evaluated_into, time_part
+from .precision import compute_dtype, get_compute_precision
 
 
 class AutoRequest(object):
@@ -22,7 +27,47 @@ class AutoRequest(object):
     def shape(self):
         return self.accessor.shape()
 
+METADATA_METHODS = ("shape", "dtype", "chunks")
+
+# Default amount of data requested at once by chunked iteration
+DEFAULT_CHUNK_BYTES = 64*1024**2
+
+
+def memoized_metadata(method):
+    '''
+    Caches result of metadata method in instance. Lazy trees are immutable,
+    so metadata is computed once per node instead of walking the tree on every call.
+    '''
+    if getattr(method, "_memoized", False):
+        return method
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self):
+        cache = self.__dict__.get("_metadata")
+        if cache is None:
+            cache = dict()
+            self.__dict__["_metadata"] = cache
+        if name not in cache:
+            cache[name] = method(self)
+        return cache[name]
+
+    wrapper._memoized = True
+    return wrapper
+
+
 class LazyArrayOperation(object):
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if "request_data" in cls.__dict__:
+            cls.request_data = evaluated(cls.__dict__["request_data"])
+        if "request_into" in cls.__dict__:
+            cls.request_into = evaluated_into(cls.__dict__["request_into"])
+        for name in METADATA_METHODS:
+            if name in cls.__dict__:
+                setattr(cls, name, memoized_metadata(cls.__dict__[name]))
+
+    @evaluated
     def request_data(self, interesting_slices:slice_t):
         if isinstance(interesting_slices,int):
             return self.request_single(interesting_slices)
@@ -33,6 +78,16 @@ class LazyArrayOperation(object):
         else:
             raise IndexError(f"Unknown index type {type(interesting_slices)}")
 
+    @evaluated_into
+    def request_into(self, interesting_slices:slice_t, out:np.ndarray):
+        '''
+        Writes requested data into preallocated array out and returns it.
+        Operations that can fill out without intermediate arrays override this,
+        others fall back to request_data.
+        '''
+        out[...] = self.request_data(interesting_slices)
+        return out
+
     def request_single(self,i:int):
         raise NotImplementedError
 
@@ -58,8 +113,134 @@ class LazyArrayOperation(object):
     def shape(self):
         raise NotImplementedError
 
+    @memoized_metadata
+    def dtype(self):
+        '''
+        Type of produced data. By default it is found by requesting first element.
+        '''
+        if self.shape()[0] == 0:
+            return np.dtype(np.float64)
+        return np.asarray(self.request_data(0)).dtype
+
+    @memoized_metadata
+    def chunks(self):
+        '''
+        Chunk layout of underlying storage as in h5py (None if there is no preferred layout).
+        By default it is inherited from first operand of same shape.
+        '''
+        shape = self.shape()
+        for op in self.operands():
+            chunks = op.chunks()
+            if chunks is not None and op.shape() == shape:
+                return chunks
+        return None
+
+    def describe(self):
+        return dict(shape=self.shape(), dtype=self.dtype(), chunks=self.chunks())
+
+    def chunk_layout(self, chunk_len=None, align=None):
+        '''
+        Returns (chunk_len, align) for chunked iteration.
+        By default boundaries follow storage chunks and chunk holds about DEFAULT_CHUNK_BYTES.
+        chunk_len is rounded down to multiple of align (but not less than align).
+        '''
+        if align is None:
+            chunks = self.chunks()
+            align = chunks[0] if chunks else 1
+        if chunk_len is None:
+            shape = self.shape()
+            frame_bytes = max(1, int(np.prod(shape[1:], dtype=np.int64))*self.dtype().itemsize)
+            chunk_len = max(1, DEFAULT_CHUNK_BYTES//frame_bytes)
+        chunk_len = max(align, chunk_len//align*align)
+        return chunk_len, align
+
+    def iter_chunks(self, start=0, stop=None, chunk_len=None, halo=(0, 0), align=None, reuse_buffer=False):
+        '''
+        Iterates over [start, stop) along axis 0 yielding (index_range, array) pairs.
+        Chunk boundaries are multiples of chunk_len (see chunk_layout) so reads do not straddle storage chunks.
+        If halo=(left, right) is given, array additionally contains up to left preceding and up to right
+        following samples. Halo is clipped only by array bounds, so array starts at
+        index_range.start - min(left, index_range.start).
+        If reuse_buffer is set, all chunks are written into one buffer with request_into;
+        yielded array is valid only until next iteration then.
+        '''
+        length = self.shape()[0]
+        if stop is None:
+            stop = length
+        start = max(0, start)
+        stop = min(stop, length)
+        left, right = halo
+        chunk_len, align = self.chunk_layout(chunk_len, align)
+        buffer = None
+        if reuse_buffer:
+            buffer = np.empty((min(chunk_len, max(stop-start, 0))+left+right,)+self.shape()[1:], dtype=self.dtype())
+        i = start
+        while i < stop:
+            end = min((i//chunk_len+1)*chunk_len, stop)
+            data_start = max(0, i-left)
+            data_end = min(length, end+right)
+            request = slice(data_start, data_end)
+            if buffer is None:
+                data = self.request_data(request)
+            else:
+                data = self.request_into(request, buffer[:data_end-data_start])
+            yield range(i, end), data
+            i = end
+
+    def request_chunked(self, start=0, stop=None, chunk_len=None):
+        '''
+        Same as request_data(slice(start, stop)) but tree is evaluated chunk by chunk,
+        so intermediate arrays of the tree never hold whole range.
+        '''
+        length = self.shape()[0]
+        if stop is None:
+            stop = length
+        start, stop, _ = normalize_slice(length, slice(start, stop))
+        res = np.empty((max(stop-start, 0),)+self.shape()[1:], dtype=self.dtype())
+        for index_range, data in self.iter_chunks(start, stop, chunk_len):
+            res[index_range.start-start:index_range.stop-start] = data
+        return res
+
+    def operands(self):
+        '''
+        Lazy arrays this operation reads from
+        '''
+        return [v for v in self.__dict__.values() if isinstance(v, LazyArrayOperation)]
+
+    def with_operands(self, replace):
+        '''
+        Shallow copy of operation with every operand substituted by replace(operand).
+        Returns self if nothing has changed.
+        '''
+        changed = dict()
+        for k, v in self.__dict__.items():
+            if isinstance(v, LazyArrayOperation):
+                new_v = replace(v)
+                if new_v is not v:
+                    changed[k] = new_v
+        if not changed:
+            return self
+        res = copy.copy(self)
+        res.__dict__.update(changed)
+        res.__dict__.pop("_metadata", None)
+        return res
+
+    def dependencies(self, interesting_slices:slice_t):
+        '''
+        List of (operand, slices) that will be requested to serve interesting_slices.
+        None if operation cannot tell it in advance.
+        '''
+        return None
+
+    def fuse(self, fuser):
+        '''
+        Expression of elementwise operation for padamo.lazy_array_operations.fusion.
+        None if operation is not elementwise.
+        '''
+        return None
+
     def extend(self, other):
-        return LazyArrayConcat(self,other)
+        return LazyArrayMultiConcat([self, other])
 
     def __add__(self, other):
         return ArrayAdd(self,other)
@@ -161,6 +342,141 @@ class LazyArrayConcat(LazyArrayOperation):
             subarray2 = self.right.request_data(subslice2)
             return np.concatenate([subarray1, subarray2], axis=0)
 
+class LazyArrayMultiConcat(LazyArrayOperation):
+    '''
+    Concatenation of any number of arrays along axis 0.
+    Parts are located by binary search over cumulative offsets computed once.
+    Nested concatenations are flattened.
+    '''
+    def __init__(self, parts:typing.List[LazyArrayOperation]):
+        flat_parts = []
+        lengths = []
+        for part in parts:
+            if isinstance(part, LazyArrayMultiConcat):
+                flat_parts.extend(part.parts)
+                lengths.extend(b-a for a, b in zip(part.offsets[:-1], part.offsets[1:]))
+            else:
+                flat_parts.append(part)
+                lengths.append(None)
+        if not flat_parts:
+            raise ValueError("Nothing to concatenate")
+        self.parts = flat_parts
+        self.item_shape = None
+        self.offsets = [0]
+        for part, length in zip(flat_parts, lengths):
+            if length is None or self.item_shape is None:
+                part_shape = part.shape()
+                if self.item_shape is None:
+                    self.item_shape = part_shape[1:]
+                elif part_shape[1:] != self.item_shape:
+                    raise ValueError("Shapes mismatch")
+                length = part_shape[0]
+            self.offsets.append(self.offsets[-1]+length)
+
+    def operands(self):
+        return list(self.parts)
+
+    def with_operands(self, replace):
+        parts = [replace(part) for part in self.parts]
+        if all(a is b for a, b in zip(parts, self.parts)):
+            return self
+        return LazyArrayMultiConcat(parts)
+
+    def shape(self):
+        return (self.offsets[-1],)+self.item_shape
+
+    def dtype(self):
+        return np.result_type(*[part.dtype() for part in self.parts])
+
+    def chunks(self):
+        return self.parts[0].chunks()
+
+    def locate(self, i:int):
+        '''
+        Index of part containing i-th element
+        '''
+        return bisect.bisect_right(self.offsets, i)-1
+
+    def request_single(self, i:int):
+        length = self.offsets[-1]
+        if i < 0:
+            i = length + i
+        if i < 0 or i >= length:
+            raise IndexError(f"index {i} is out of bounds for axis 0 with size {length}")
+        k = self.locate(i)
+        return self.parts[k].request_data(i - self.offsets[k])
+
+    def request_slice(self, s:slice):
+        start, end, step = normalize_slice(self.offsets[-1], s)
+        count = len(range(start, end, step))
+        if count == 0:
+            return self.parts[0].request_data(slice(0, 0))
+        first = self.locate(start)
+        last = self.locate(start+(count-1)*step)
+        if first == last:
+            offset = self.offsets[first]
+            return self.parts[first].request_data(slice(start-offset, end-offset, step))
+        res = None
+        pointer = 0
+        i = start
+        for k in range(first, last+1):
+            part_start = self.offsets[k]
+            part_end = self.offsets[k+1]
+            if i >= part_end:
+                continue
+            piece = self.parts[k].request_data(slice(i-part_start, min(end, part_end)-part_start, step))
+            n = piece.shape[0]
+            if res is None:
+                res = np.empty(shape=(count,)+piece.shape[1:], dtype=piece.dtype)
+            res[pointer:pointer+n] = piece
+            pointer += n
+            i += n*step
+        assert pointer == count
+        return res
+
+    def request_into(self, interesting_slices:slice_t, out:np.ndarray):
+        if isinstance(interesting_slices, tuple):
+            x0 = interesting_slices[0] if interesting_slices else slice(None)
+            rest = interesting_slices[1:]
+        else:
+            x0 = interesting_slices
+            rest = ()
+        length = self.offsets[-1]
+        if isinstance(x0, int):
+            i = x0 + length if x0 < 0 else x0
+            if i < 0 or i >= length:
+                raise IndexError(f"index {x0} is out of bounds for axis 0 with size {length}")
+            k = self.locate(i)
+            return self.parts[k].request_into((i - self.offsets[k],)+rest, out)
+        if not isinstance(x0, slice):
+            return super().request_into(interesting_slices, out)
+        start, end, step = normalize_slice(length, x0)
+        count = len(range(start, end, step))
+        if count != out.shape[0]:
+            raise ValueError(f"Output of length {out.shape[0]} cannot hold {count} elements")
+        if count == 0:
+            return out
+        first = self.locate(start)
+        last = self.locate(start+(count-1)*step)
+        pointer = 0
+        i = start
+        for k in range(first, last+1):
+            part_start = self.offsets[k]
+            part_end = self.offsets[k+1]
+            if i >= part_end:
+                continue
+            n = len(range(i, min(end, part_end), step))
+            sub = slice(i-part_start, min(end, part_end)-part_start, step)
+            self.parts[k].request_into((sub,)+rest, out[pointer:pointer+n])
+            pointer += n
+            i += n*step
+        assert pointer == count
+        return out
+
+    def __repr__(self):
+        return f"LazyArrayMultiConcat({len(self.parts)} parts)"
+
+
 class ArrayUnaryOperation(LazyArrayOperation):
     def __init__(self, a):
         self.a = a
@@ -172,6 +488,17 @@ class ArrayUnaryOperation(LazyArrayOperation):
         a = self.a.request_data(interesting_slices)
         return self.perform(a)
 
+    def perform_into(self, out):
+        out[...] = self.perform(out)
+
+    def request_into(self, interesting_slices:slice_t, out:np.ndarray):
+        self.a.request_into(interesting_slices, out)
+        self.perform_into(out)
+        return out
+
+    def dependencies(self, interesting_slices:slice_t):
+        return [(self.a, interesting_slices)]
+
     def shape(self):
         return self.a.shape()
 
@@ -196,6 +523,9 @@ class ArrayBinaryOperation(LazyArrayOperation):
             raise IndexError(f"Shapes mismatch {s1} and {s2}")
         return s1
 
+    def dtype(self):
+        return np.result_type(self.a.dtype(), self.b.dtype())
+
 
     def request_data(self, interesting_slices:slice_t):
         #print(f"SLICES for {type(self).__name__}", interesting_slices)
@@ -203,6 +533,18 @@ class ArrayBinaryOperation(LazyArrayOperation):
         b = self.b.request_data(interesting_slices)
         return self.perform(a,b)
 
+    def perform_into(self, out, b):
+        out[...] = self.perform(out, b)
+
+    def request_into(self, interesting_slices:slice_t, out:np.ndarray):
+        self.a.request_into(interesting_slices, out)
+        b = self.b.request_data(interesting_slices)
+        self.perform_into(out, b)
+        return out
+
+    def dependencies(self, interesting_slices:slice_t):
+        return [(self.a, interesting_slices), (self.b, interesting_slices)]
+
     def __repr__(self):
         return f"{type(self).__name__}({self.a}, {self.b})"
 
@@ -211,23 +553,57 @@ class ArrayAdd(ArrayBinaryOperation):
     def perform(self,a,b):
         return a+b
 
+    def perform_into(self, out, b):
+        np.add(out, b, out=out, casting="unsafe")
+
+    def fuse(self, fuser):
+        return f"{fuser.operand(self.a)} + {fuser.operand(self.b)}"
+
 
 class ArraySub(ArrayBinaryOperation):
     def perform(self,a,b):
         return a-b
 
+    def perform_into(self, out, b):
+        np.subtract(out, b, out=out, casting="unsafe")
+
+    def fuse(self, fuser):
+        return f"{fuser.operand(self.a)} - {fuser.operand(self.b)}"
+
 
 class ArrayMul(ArrayBinaryOperation):
     def perform(self,a, b):
         return a * b
 
+    def perform_into(self, out, b):
+        np.multiply(out, b, out=out, casting="unsafe")
+
+    def fuse(self, fuser):
+        return f"{fuser.operand(self.a)} * {fuser.operand(self.b)}"
+
 
 class ArrayDiv(ArrayBinaryOperation):
+    def __init__(self, a, b):
+        super().__init__(a, b)
+        self.precision = get_compute_precision()
+
+    def dtype(self):
+        return compute_dtype(np.result_type(self.a.dtype(), self.b.dtype()), self.precision)
+
     def perform(self, a, b):
-        result = np.zeros(a.shape)
+        dtype = compute_dtype(np.result_type(a, b), self.precision)
+        result = np.zeros(np.broadcast(a, b).shape, dtype=dtype)
         np.divide(a, b, out=result, where=(b != 0))
         return result
 
+    def perform_into(self, out, b):
+        zeros = np.broadcast_to(b == 0, out.shape)
+        np.divide(out, b, out=out, where=~zeros, casting="unsafe")
+        out[zeros] = 0
+
+    def fuse(self, fuser):
+        return f"safe_div({fuser.operand(self.a)}, {fuser.operand(self.b)})"
+
 
 
 
@@ -248,12 +624,27 @@ class ConstantSlice(LazyArrayOperation):
         # #print("REQUESTED FOR ARRAY", interesting_slices)
         # return src[interesting_slices]
 
+    def request_into(self, interesting_slices:slice_t, out:np.ndarray):
+        combined_slices = combine_slices(self.source.shape(), self.slices, interesting_slices)
+        return self.source.request_into(combined_slices, out)
+
+    def dependencies(self, interesting_slices:slice_t):
+        return [(self.source, combine_slices(self.source.shape(), self.slices, interesting_slices))]
+
     def shape(self):
         src_shape = self.source.shape()
         #print("SRC_SHAPE",src_shape)
         #print(self.slices)
         return shape_transform(src_shape, self.slices)
 
+    def dtype(self):
+        return self.source.dtype()
+
+    def chunks(self):
+        if self.shape() == self.source.shape():
+            return self.source.chunks()
+        return None
+
 
 class ConstantMultiply(LazyArrayOperation):
     def __init__(self, array, constant):
@@ -264,5 +655,21 @@ class ConstantMultiply(LazyArrayOperation):
         x = self.array.request_data(interesting_slices)
         return x*self.constant
 
+    def request_into(self, interesting_slices:slice_t, out:np.ndarray):
+        self.array.request_into(interesting_slices, out)
+        np.multiply(out, self.constant, out=out, casting="unsafe")
+        return out
+
+    def dependencies(self, interesting_slices:slice_t):
+        return [(self.array, interesting_slices)]
+
+    def fuse(self, fuser):
+        if not fuser.is_scalar(self.constant):
+            return None
+        return f"{fuser.operand(self.array)} * {fuser.scalar(self.constant)}"
+
     def shape(self):
-        return self.array.shape()
\ No newline at end of file
+        return self.array.shape()
+
+    def dtype(self):
+        return np.result_type(self.array.dtype(), np.asarray(self.constant).dtype)
\ No newline at end of file
@@ -9,3 +9,6 @@ class ConstantArray(LazyArrayOperation):
 
     def shape(self):
         return self.source.shape
+
+    def dtype(self):
+        return self.source.dtype
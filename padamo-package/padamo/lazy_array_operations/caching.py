@@ -0,0 +1,135 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .base import LazyArrayOperation
+from .slice_combination import normalize_slice
+
+
+class CachedLazyArray(LazyArrayOperation):
+    '''
+    Keeps time-aligned chunks of source in LRU cache.
+    Requests are split into chunks of chunk_size samples; chunks are computed once and reused
+    until they are evicted to keep cache size under max_bytes.
+    Cached chunks are read-only; single frames are returned as copies.
+    '''
+    def __init__(self, source:LazyArrayOperation, chunk_size=1024, max_bytes=256*1024**2):
+        if chunk_size <= 0:
+            raise ValueError("Chunk size must be positive")
+        self.source = source
+        self.chunk_size = chunk_size
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._chunks = OrderedDict()
+        self._used_bytes = 0
+        self._lock = threading.RLock()
+
+    def shape(self):
+        return self.source.shape()
+
+    def dtype(self):
+        return self.source.dtype()
+
+    def chunks(self):
+        return (self.chunk_size,)+self.shape()[1:]
+
+    def used_bytes(self):
+        return self._used_bytes
+
+    def clear(self):
+        with self._lock:
+            self._chunks.clear()
+            self._used_bytes = 0
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def _store(self, key, data):
+        nbytes = data.nbytes
+        if nbytes > self.max_bytes:
+            return
+        while self._chunks and self._used_bytes+nbytes > self.max_bytes:
+            _, evicted = self._chunks.popitem(last=False)
+            self._used_bytes -= evicted.nbytes
+        # Consumers must not change cached data in place. Flag is set on view, so source array stays writable
+        data = data.view()
+        data.setflags(write=False)
+        self._chunks[key] = data
+        self._used_bytes += nbytes
+
+    def get_chunk(self, key:int):
+        with self._lock:
+            if key in self._chunks:
+                self.hits += 1
+                self._chunks.move_to_end(key)
+                return self._chunks[key]
+            self.misses += 1
+        start = key*self.chunk_size
+        end = min(start+self.chunk_size, self.shape()[0])
+        data = np.asarray(self.source.request_data(slice(start, end)))
+        with self._lock:
+            if key not in self._chunks:
+                self._store(key, data)
+            # Read-only cached view is returned if chunk was stored
+            data = self._chunks.get(key, data)
+        return data
+
+    def request_single(self, i:int):
+        length = self.shape()[0]
+        if i < 0:
+            i = length + i
+        if i < 0 or i >= length:
+            raise IndexError(f"index {i} is out of bounds for axis 0 with size {length}")
+        key = i//self.chunk_size
+        return self.get_chunk(key)[i-key*self.chunk_size].copy()
+
+    def request_slice(self, s:slice):
+        length = self.shape()[0]
+        start, end, step = normalize_slice(length, s)
+        count = len(range(start, end, step))
+        if count == 0 or step >= self.chunk_size:
+            # Sparse requests would pull whole chunks for a single frame each
+            return self.source.request_data(s)
+        res = None
+        pointer = 0
+        i = start
+        while i < end:
+            key = i//self.chunk_size
+            chunk_start = key*self.chunk_size
+            chunk_end = min(chunk_start+self.chunk_size, end)
+            chunk = self.get_chunk(key)
+            part = chunk[i-chunk_start:chunk_end-chunk_start:step]
+            if res is None:
+                res = np.empty(shape=(count,)+part.shape[1:], dtype=part.dtype)
+            res[pointer:pointer+part.shape[0]] = part
+            pointer += part.shape[0]
+            i += part.shape[0]*step
+        assert pointer == count
+        return res
+
+    def with_operands(self, replace):
+        res = super().with_operands(replace)
+        if res is not self:
+            # Copy must not share chunks and lock while counting its own bytes
+            res._chunks = OrderedDict()
+            res._used_bytes = 0
+            res._lock = threading.RLock()
+            res.reset_stats()
+        return res
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_chunks"] = OrderedDict()
+        state["_used_bytes"] = 0
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def __repr__(self):
+        return f"CachedLazyArray({self.source}, hits={self.hits}, misses={self.misses})"
@@ -0,0 +1,238 @@
+import functools
+import numbers
+import threading
+
+from . import tracing
+from .slice_combination import normalize_slice
+
+
+_LOCAL = threading.local()
+
+
+def current_context():
+    return getattr(_LOCAL, "context", None)
+
+
+def time_part(interesting_slices):
+    '''
+    Returns part of request that refers to axis 0
+    '''
+    if isinstance(interesting_slices, tuple):
+        if interesting_slices:
+            return interesting_slices[0]
+        return slice(None)
+    return interesting_slices
+
+
+def spatial_part(interesting_slices):
+    '''
+    Part of request that refers to axes after 0 without trailing full slices.
+    None if it holds anything except integers and slices (such requests are not coalesced).
+    '''
+    if not isinstance(interesting_slices, tuple):
+        return ()
+    rest = list(interesting_slices[1:])
+    while rest and rest[-1] == slice(None):
+        rest.pop()
+    if not all(isinstance(item, (numbers.Integral, slice)) for item in rest):
+        return None
+    return tuple(rest)
+
+
+def _as_interval(length, interesting_slices):
+    x0 = time_part(interesting_slices)
+    if isinstance(x0, int):
+        i = x0
+        if i < 0:
+            i = length + i
+        return i, i+1, 1
+    elif isinstance(x0, slice):
+        start, end, step = normalize_slice(length, x0)
+        if start >= end:
+            return None
+        return start, end, step
+    return None
+
+
+def _union(intervals):
+    '''
+    Union of intervals if they form one connected range that is not larger than requests themselves.
+    None otherwise.
+    '''
+    requested = sum(len(range(s, e, step)) for s, e, step in intervals)
+    intervals = sorted(intervals)
+    start, end, _ = intervals[0]
+    for s, e, _ in intervals[1:]:
+        if s > end:
+            return None
+        end = max(end, e)
+    if end-start > requested:
+        return None
+    return start, end
+
+
+def _topological_order(root):
+    order = []
+    visited = set()
+
+    def visit(op):
+        visited.add(id(op))
+        for child in op.operands():
+            if id(child) not in visited:
+                visit(child)
+        order.append(op)
+
+    visit(root)
+    order.reverse()
+    return order
+
+
+class EvaluationContext(object):
+    '''
+    Lives during one top-level request.
+    Before evaluation the requested slices are propagated through the lazy tree.
+    Every node that is reached from several branches with overlapping requests of the same
+    spatial part (e.g. same pixel) is evaluated once for the union of requests along time
+    and the branches are served from that result.
+    Served arrays may be views of that result, so requested data must not be modified in place.
+    '''
+    def __init__(self):
+        self.shared = dict()
+        self._memo = dict()
+        self._fetching = set()
+
+    def plan(self, root, interesting_slices):
+        order = _topological_order(root)
+        known = {id(op) for op in order}
+        pending = {id(root): [interesting_slices]}
+        for op in order:
+            requests = pending.pop(id(op), None)
+            if not requests:
+                continue
+            if len(requests) > 1:
+                length = op.shape()[0]
+                intervals = [_as_interval(length, r) for r in requests]
+                rest = spatial_part(requests[0])
+                union = None
+                if None not in intervals and rest is not None and all(spatial_part(r) == rest for r in requests):
+                    union = _union(intervals)
+                if union is not None:
+                    self.shared[id(op)] = (op, union, rest)
+                    requests = [(slice(union[0], union[1]),)+rest if rest else slice(union[0], union[1])]
+            for request in requests:
+                try:
+                    deps = op.dependencies(request)
+                except (IndexError, ValueError):
+                    deps = None
+                if deps is None:
+                    continue
+                for child, child_slices in deps:
+                    if id(child) in known:
+                        pending.setdefault(id(child), []).append(child_slices)
+
+    def lookup(self, op, method, interesting_slices):
+        key = id(op)
+        if key not in self.shared or key in self._fetching:
+            return None
+        _, (start, end), rest = self.shared[key]
+        interval = _as_interval(op.shape()[0], interesting_slices)
+        if interval is None or interval[0] < start or interval[1] > end or spatial_part(interesting_slices) != rest:
+            # Request was not planned (dependencies() of some parent under-reports), so it is evaluated directly
+            return None
+        if key not in self._memo:
+            self._fetching.add(key)
+            try:
+                self._memo[key] = method(op, (slice(start, end),)+rest if rest else slice(start, end))
+            finally:
+                self._fetching.discard(key)
+        return self._serve(op, start, self._memo[key], interesting_slices)
+
+    @staticmethod
+    def _serve(op, start, data, interesting_slices):
+        # Data already holds spatial part of request, only time part is taken
+        x0 = time_part(interesting_slices)
+        length = op.shape()[0]
+        if isinstance(x0, int):
+            i = x0 + length if x0 < 0 else x0
+            return data[i-start]
+        s, e, step = normalize_slice(length, x0)
+        return data[s-start:e-start:step]
+
+    def __enter__(self):
+        _LOCAL.context = self
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _LOCAL.context = None
+        self._memo.clear()
+
+
+def evaluated(method):
+    '''
+    Wraps request_data so that the outermost call opens an EvaluationContext and
+    nested calls are served from it when possible.
+    '''
+    if getattr(method, "_evaluated", False):
+        return method
+
+    @functools.wraps(method)
+    def wrapper(self, interesting_slices):
+        tracer = tracing.active_tracer()
+        if tracer is not None:
+            frame = tracer.enter(self, interesting_slices)
+            result = None
+            try:
+                result = evaluate(self, interesting_slices)
+            finally:
+                tracer.exit(frame, result)
+            return result
+        return evaluate(self, interesting_slices)
+
+    def evaluate(self, interesting_slices):
+        context = current_context()
+        if context is None:
+            with EvaluationContext() as context:
+                context.plan(self, interesting_slices)
+                return method(self, interesting_slices)
+        shared = context.lookup(self, method, interesting_slices)
+        if shared is not None:
+            return shared
+        return method(self, interesting_slices)
+
+    wrapper._evaluated = True
+    return wrapper
+
+
+def evaluated_into(method):
+    '''
+    Same as evaluated, but for request_into(interesting_slices, out).
+    Shared nodes are served from context and copied into out.
+    '''
+    if getattr(method, "_evaluated", False):
+        return method
+
+    @functools.wraps(method)
+    def wrapper(self, interesting_slices, out):
+        tracer = tracing.active_tracer()
+        if tracer is not None:
+            frame = tracer.enter(self, interesting_slices)
+            try:
+                return evaluate(self, interesting_slices, out)
+            finally:
+                tracer.exit(frame, out)
+        return evaluate(self, interesting_slices, out)
+
+    def evaluate(self, interesting_slices, out):
+        context = current_context()
+        if context is None:
+            with EvaluationContext() as context:
+                context.plan(self, interesting_slices)
+                return method(self, interesting_slices, out)
+        shared = context.lookup(self, type(self).request_data, interesting_slices)
+        if shared is not None:
+            out[...] = shared
+            return out
+        return method(self, interesting_slices, out)
+
+    wrapper._evaluated = True
+    return wrapper
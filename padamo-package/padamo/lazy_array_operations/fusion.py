@@ -0,0 +1,256 @@
+import re
+
+import numba as nb
+import numpy as np
+
+from .base import LazyArrayOperation
+from .evaluation import time_part
+from .precision import compute_dtype, get_compute_precision, FLOAT64
+
+
+@nb.njit(inline="always")
+def safe_div(a, b):
+    if b != 0:
+        return a/b
+    return 0.0
+
+
+@nb.njit(inline="always")
+def suppress_below(a, threshold):
+    if a > threshold:
+        return a
+    return 0.0
+
+
+@nb.njit(inline="always")
+def masked(a, mask):
+    if mask != 0:
+        return a
+    return 0.0
+
+
+KERNEL_NAMESPACE = {
+    "nb": nb,
+    "safe_div": safe_div,
+    "suppress_below": suppress_below,
+    "masked": masked,
+}
+
+KERNEL_TEMPLATE = """
+def fused_kernel(out, {args}):
+    for t in nb.prange(out.shape[0]):
+        for p in range(out.shape[1]):
+            out[t, p] = {expression}
+"""
+
+_KERNELS = dict()
+
+_PLACEHOLDER = re.compile(r"\b([xmc])(\d+)\b")
+
+
+def get_kernel(expression, n_inputs, n_pixelwise, n_scalars):
+    '''
+    Compiles (once) parallel kernel evaluating expression for every sample of every pixel.
+    Inputs are x0..xn[t, p], pixelwise arrays are m0..mn[p] and scalars are c0..cn.
+    '''
+    key = (expression, n_inputs, n_pixelwise, n_scalars)
+    if key not in _KERNELS:
+        args = [f"x{i}" for i in range(n_inputs)] + [f"m{i}" for i in range(n_pixelwise)] + \
+               [f"c{i}" for i in range(n_scalars)]
+        source = KERNEL_TEMPLATE.format(args=", ".join(args), expression=expression)
+        namespace = dict(KERNEL_NAMESPACE)
+        exec(source, namespace)
+        _KERNELS[key] = nb.njit(parallel=True, nogil=True)(namespace["fused_kernel"])
+    return _KERNELS[key]
+
+
+class Fuser(object):
+    '''
+    Collects expression of elementwise region of lazy tree.
+    Operations that are not elementwise or are used by several parents become inputs of region.
+    '''
+    def __init__(self, parents_count:dict):
+        self.parents_count = parents_count
+        self.inputs = []
+        self.pixelwise = []
+        self.scalars = []
+        self.fused_count = 0
+        self._input_names = dict()
+
+    def region(self, op:LazyArrayOperation):
+        expression = op.fuse(self)
+        if expression is not None:
+            self.fused_count += 1
+        return expression
+
+    def operand(self, op:LazyArrayOperation):
+        if self.parents_count.get(id(op), 0) <= 1:
+            expression = op.fuse(self)
+            if expression is not None:
+                self.fused_count += 1
+                return f"({expression})"
+        return self.input(op)
+
+    def input(self, op:LazyArrayOperation):
+        if id(op) not in self._input_names:
+            self._input_names[id(op)] = f"x{len(self.inputs)}[t, p]"
+            self.inputs.append(op)
+        return self._input_names[id(op)]
+
+    def pixelwise_array(self, array):
+        self.pixelwise.append(np.ascontiguousarray(array).reshape(-1))
+        return f"m{len(self.pixelwise)-1}[p]"
+
+    @staticmethod
+    def is_scalar(value):
+        return np.isscalar(value) and np.isrealobj(value)
+
+    def scalar(self, value):
+        self.scalars.append(float(value))
+        return f"c{len(self.scalars)-1}"
+
+
+class FusedElementwise(LazyArrayOperation):
+    '''
+    Several elementwise operations evaluated by one compiled kernel with single output allocation.
+    '''
+    def __init__(self, expression:str, inputs:list, pixelwise:list, scalars:list, precision=None):
+        self.expression = expression
+        self.inputs = inputs
+        self.pixelwise = pixelwise
+        self.scalars = scalars
+        if precision is None:
+            precision = get_compute_precision()
+        self.precision = precision
+
+    def operands(self):
+        return list(self.inputs)
+
+    def with_operands(self, replace):
+        inputs = [replace(op) for op in self.inputs]
+        if all(a is b for a, b in zip(inputs, self.inputs)):
+            return self
+        return FusedElementwise(self.expression, inputs, self.pixelwise, self.scalars, self.precision)
+
+    def dependencies(self, interesting_slices):
+        x0 = time_part(interesting_slices)
+        return [(op, x0) for op in self.inputs]
+
+    def fuse(self, fuser):
+        def substitute(match):
+            kind, index = match.group(1), int(match.group(2))
+            if kind == "x":
+                return fuser.input(self.inputs[index])[:-len("[t, p]")]
+            elif kind == "m":
+                return fuser.pixelwise_array(self.pixelwise[index])[:-len("[p]")]
+            else:
+                return fuser.scalar(self.scalars[index])
+        return _PLACEHOLDER.sub(substitute, self.expression)
+
+    def shape(self):
+        return self.inputs[0].shape()
+
+    def dtype(self):
+        types = [op.dtype() for op in self.inputs] + [m.dtype for m in self.pixelwise]
+        return compute_dtype(np.result_type(*types), self.precision)
+
+    def evaluate(self, arrays, frame_shape, out=None):
+        frame_size = int(np.prod(frame_shape))
+        flat = [np.ascontiguousarray(a).reshape(-1, frame_size) for a in arrays]
+        if out is None:
+            dtype = compute_dtype(np.result_type(*flat), self.precision)
+            out = np.empty(shape=flat[0].shape, dtype=dtype)
+        kernel = get_kernel(self.expression, len(self.inputs), len(self.pixelwise), len(self.scalars))
+        kernel(out, *flat, *self.pixelwise, *self.scalars)
+        return out
+
+    def request_single(self, i:int):
+        arrays = [op.request_data(i) for op in self.inputs]
+        frame_shape = np.shape(arrays[0])
+        # [()] turns result for scalar frames into scalar, as unfused operations return
+        return self.evaluate(arrays, frame_shape).reshape(frame_shape)[()]
+
+    def request_slice(self, s:slice):
+        arrays = [op.request_data(s) for op in self.inputs]
+        shape = np.shape(arrays[0])
+        return self.evaluate(arrays, shape[1:]).reshape(shape)
+
+    def request_into(self, interesting_slices, out:np.ndarray):
+        if out.dtype.kind != "f" or not out.flags.c_contiguous:
+            return super().request_into(interesting_slices, out)
+        arrays = [op.request_data(interesting_slices) for op in self.inputs]
+        shape = np.shape(arrays[0])
+        if shape != out.shape:
+            raise ValueError(f"Output of shape {out.shape} cannot hold data of shape {shape}")
+        if isinstance(time_part(interesting_slices), int):
+            frame_shape = shape
+        else:
+            frame_shape = shape[1:]
+        self.evaluate(arrays, frame_shape, out.reshape(-1, int(np.prod(frame_shape))))
+        return out
+
+    def __repr__(self):
+        inputs = ", ".join(map(repr, self.inputs))
+        return f"FusedElementwise[{self.expression}]({inputs})"
+
+
+def count_parents(roots):
+    counts = dict()
+    visited = set()
+    stack = list(roots)
+    while stack:
+        op = stack.pop()
+        if id(op) in visited:
+            continue
+        visited.add(id(op))
+        for child in op.operands():
+            counts[id(child)] = counts.get(id(child), 0)+1
+            stack.append(child)
+    return counts
+
+
+def reachable(roots):
+    visited = set()
+    stack = list(roots)
+    while stack:
+        op = stack.pop()
+        if id(op) in visited:
+            continue
+        visited.add(id(op))
+        stack.extend(op.operands())
+    return visited
+
+
+class ElementwiseFusion(object):
+    '''
+    Rewrites lazy trees so that every chain of at least min_ops elementwise operations becomes
+    FusedElementwise. Sharing of nodes between trees passed together is preserved.
+    Regions reachable from exact_roots (time of signals) are computed in float64 regardless of precision policy.
+    '''
+    def __init__(self, roots, min_ops=2, exact_roots=()):
+        roots = [r for r in roots if r is not None]
+        self.parents_count = count_parents(roots)
+        self.min_ops = min_ops
+        self.exact = reachable([r for r in exact_roots if r is not None])
+        self._memo = dict()
+
+    def __call__(self, op):
+        if op is None:
+            return None
+        key = id(op)
+        if key not in self._memo:
+            self._memo[key] = (op, self._rewrite(op))
+        return self._memo[key][1]
+
+    def _rewrite(self, op):
+        fuser = Fuser(self.parents_count)
+        expression = fuser.region(op)
+        if expression is not None and fuser.fused_count >= self.min_ops:
+            inputs = [self(item) for item in fuser.inputs]
+            precision = FLOAT64 if id(op) in self.exact else None
+            return FusedElementwise(expression, inputs, fuser.pixelwise, fuser.scalars, precision)
+        return op.with_operands(self)
+
+
+def fuse_elementwise(op):
+    return ElementwiseFusion([op])(op)
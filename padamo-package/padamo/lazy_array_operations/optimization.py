@@ -0,0 +1,29 @@
+import os
+
+from .fusion import ElementwiseFusion
+from .rewriting import Simplifier, dump_tree
+
+DEBUG_DUMP = bool(os.environ.get("PADAMO_DUMP_REWRITES"))
+
+
+def optimize(roots, exact_roots=()):
+    '''
+    Runs algebraic rewrites and elementwise fusion over lazy trees.
+    Roots are optimized together so nodes shared between them stay shared.
+    Trees of exact_roots (must be listed in roots too) are fused in float64 whatever precision policy is.
+    None roots are passed through.
+    '''
+    simplifier = Simplifier(roots)
+    simplified = [simplifier(root) for root in roots]
+    exact_ids = set(id(root) for root in exact_roots)
+    fusion = ElementwiseFusion(simplified, exact_roots=[s for r, s in zip(roots, simplified) if id(r) in exact_ids])
+    result = [fusion(root) for root in simplified]
+    if DEBUG_DUMP:
+        for before, after in zip(roots, result):
+            if before is None or before is after:
+                continue
+            print("Lazy tree before rewrite:")
+            print(dump_tree(before))
+            print("Lazy tree after rewrite:")
+            print(dump_tree(after))
+    return result
@@ -0,0 +1,75 @@
+import os
+import contextlib
+import warnings
+
+import numpy as np
+
+FLOAT64 = "float64"
+FLOAT32 = "float32"
+KEEP = "keep"
+PRECISIONS = (FLOAT64, FLOAT32, KEEP)
+
+# Key of graph globals holding precision chosen by user
+PRECISION_KEY = "compute_precision"
+
+_precision = os.environ.get("PADAMO_COMPUTE_DTYPE", FLOAT64)
+if _precision not in PRECISIONS:
+    warnings.warn(f"Unknown compute precision {_precision}, falling back to {FLOAT64}")
+    _precision = FLOAT64
+
+
+def set_compute_precision(precision:str):
+    '''
+    Sets precision of lazy operations created afterwards:
+    float64 - everything is computed in double precision (default),
+    float32 - everything is computed in single precision,
+    keep - floating point data keeps its precision, integer counts are converted
+    to the smallest floating type that holds them exactly.
+    Time of signals is not affected: it is always kept in float64.
+    '''
+    global _precision
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown compute precision {precision}. Possible values: {', '.join(PRECISIONS)}")
+    _precision = precision
+
+
+def get_compute_precision():
+    return _precision
+
+
+@contextlib.contextmanager
+def compute_precision(precision:str):
+    '''
+    Temporarily sets precision, e.g. while graph is calculated
+    '''
+    old = get_compute_precision()
+    set_compute_precision(precision)
+    try:
+        yield
+    finally:
+        set_compute_precision(old)
+
+
+def compute_dtype(dtype, precision=None):
+    '''
+    Floating type used to process data of given type
+    '''
+    if precision is None:
+        precision = _precision
+    if precision == FLOAT32:
+        return np.dtype(np.float32)
+    elif precision == KEEP:
+        dtype = np.dtype(dtype)
+        if dtype.kind == "f" and dtype.itemsize >= 4:
+            return dtype
+        if dtype.kind in "biuf" and dtype.itemsize <= 2:
+            return np.dtype(np.float32)
+    return np.dtype(np.float64)
+
+
+def as_compute(array, precision=None):
+    '''
+    Replacement for array.astype(float) that respects precision. Does not copy if type already matches.
+    '''
+    array = np.asarray(array)
+    return array.astype(compute_dtype(array.dtype, precision), copy=False)
@@ -0,0 +1,141 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from .base import LazyArrayOperation
+from .slice_combination import normalize_slice
+
+
+class PrefetchedLazyArray(LazyArrayOperation):
+    '''
+    Reads ahead of sequential consumers.
+    When two consecutive requests of the same size advance by the same stride,
+    next depth requests along that stride are computed by background workers
+    while caller processes current one. Any other request is a seek: pending work is cancelled
+    and requests already being computed are waited for, so that no reads outlive the seek or close().
+    At most depth results are kept in memory.
+    '''
+    def __init__(self, source:LazyArrayOperation, depth=2, workers=1):
+        if depth <= 0:
+            raise ValueError("Prefetch depth must be positive")
+        self.source = source
+        self.depth = depth
+        self.workers = workers
+        self.hits = 0
+        self.misses = 0
+        self._pending = OrderedDict()
+        self._last = None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def shape(self):
+        return self.source.shape()
+
+    def dtype(self):
+        return self.source.dtype()
+
+    def dependencies(self, interesting_slices):
+        return [(self.source, interesting_slices)]
+
+    def _key(self, interesting_slices):
+        if isinstance(interesting_slices, tuple) and len(interesting_slices) == 1:
+            interesting_slices = interesting_slices[0]
+        length = self.shape()[0]
+        if isinstance(interesting_slices, int):
+            i = interesting_slices + length if interesting_slices < 0 else interesting_slices
+            return i, i+1, 0
+        if isinstance(interesting_slices, slice):
+            start, end, step = normalize_slice(length, interesting_slices)
+            if start < end:
+                return start, end, step
+        return None
+
+    @staticmethod
+    def _request_of(key):
+        start, end, step = key
+        if step == 0:
+            return start
+        return slice(start, end, step)
+
+    def _predict(self, key):
+        '''
+        Keys of next requests if key continues access pattern, empty list otherwise
+        '''
+        last = self._last
+        if last is None or last[2] != key[2] or last[1]-last[0] != key[1]-key[0]:
+            return []
+        stride = key[0] - last[0]
+        if stride <= 0:
+            return []
+        length = self.shape()[0]
+        res = []
+        for k in range(1, self.depth+1):
+            start = key[0] + stride*k
+            if start >= length:
+                break
+            end = min(key[1] + stride*k, length)
+            res.append((start, end, key[2]))
+        return res
+
+    def _discard(self):
+        # Called under lock. Returns futures that are already running and cannot be cancelled
+        running = [future for future in self._pending.values() if not future.cancel()]
+        self._pending.clear()
+        return running
+
+    def cancel(self):
+        with self._lock:
+            running = self._discard()
+        wait(running)
+
+    def close(self):
+        self.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _submit(self, keys):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="padamo-prefetch")
+        with self._lock:
+            for key in keys:
+                if key not in self._pending and len(self._pending) < self.depth:
+                    self._pending[key] = self._executor.submit(self.source.request_data, self._request_of(key))
+
+    def request_data(self, interesting_slices):
+        key = self._key(interesting_slices)
+        if key is None:
+            return self.source.request_data(interesting_slices)
+        running = []
+        with self._lock:
+            future = self._pending.pop(key, None)
+            if future is None and self._pending:
+                # Seek: everything read ahead is useless now
+                running = self._discard()
+        wait(running)
+        upcoming = self._predict(key)
+        self._last = key
+        if future is not None:
+            self.hits += 1
+            # Keep the queue full while waiting for the current result
+            self._submit(upcoming)
+            return future.result()
+        self.misses += 1
+        res = self.source.request_data(interesting_slices)
+        self._submit(upcoming)
+        return res
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_pending"] = OrderedDict()
+        state["_last"] = None
+        state["_executor"] = None
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"PrefetchedLazyArray({self.source}, hits={self.hits}, misses={self.misses})"
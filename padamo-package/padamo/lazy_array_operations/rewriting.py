@@ -0,0 +1,104 @@
+from .base import LazyArrayOperation, ConstantSlice, ConstantMultiply
+from .slice_combination import combine_slices
+from .fusion import Fuser, count_parents
+
+
+class _ElementwiseProbe(Fuser):
+    def operand(self, op):
+        return self.input(op)
+
+
+def is_elementwise(op:LazyArrayOperation):
+    return _ElementwiseProbe(dict()).region(op) is not None
+
+
+def is_time_slice(slices):
+    if isinstance(slices, tuple):
+        return len(slices) == 1 and isinstance(slices[0], slice)
+    return isinstance(slices, slice)
+
+
+class Simplifier(object):
+    '''
+    Algebraic rewrites of lazy trees:
+    nested constant slices are folded into one,
+    nested constant multiplications are merged,
+    time slices are pushed below elementwise operations towards sources.
+    '''
+    def __init__(self, roots):
+        roots = [r for r in roots if r is not None]
+        self.parents_count = count_parents(roots)
+        self._memo = dict()
+
+    def __call__(self, op):
+        if op is None:
+            return None
+        key = id(op)
+        if key not in self._memo:
+            result = self._simplify(op.with_operands(self))
+            self._memo[key] = (op, result)
+            if result is not op:
+                self.parents_count[id(result)] = self.parents_count.get(key, 0)
+        return self._memo[key][1]
+
+    def _is_exclusive(self, op):
+        return self.parents_count.get(id(op), 0) <= 1
+
+    def _simplify(self, op):
+        while True:
+            new_op = self._apply_rules(op)
+            if new_op is op:
+                return op
+            op = new_op
+
+    def _apply_rules(self, op):
+        if isinstance(op, ConstantSlice):
+            source = op.source
+            if isinstance(source, ConstantSlice):
+                slices = combine_slices(source.source.shape(), source.slices, op.slices)
+                return ConstantSlice(source.source, slices)
+            if is_time_slice(op.slices) and is_elementwise(source) and self._is_exclusive(source):
+                slices = op.slices
+                return source.with_operands(lambda x: self._simplify(ConstantSlice(x, slices)))
+        elif isinstance(op, ConstantMultiply):
+            inner = op.array
+            if isinstance(inner, ConstantMultiply) and self._is_exclusive(inner) \
+                    and Fuser.is_scalar(inner.constant) and Fuser.is_scalar(op.constant):
+                return ConstantMultiply(inner.array, inner.constant*op.constant)
+        return op
+
+
+def _node_label(op):
+    label = type(op).__name__
+    if isinstance(op, ConstantSlice):
+        label += f" {op.slices}"
+    elif isinstance(op, ConstantMultiply):
+        label += f" *{op.constant}"
+    elif hasattr(op, "expression"):
+        label += f" [{op.expression}]"
+    try:
+        label += f" {op.shape()}"
+    except Exception as e:
+        label += f" <shape error: {e}>"
+    return label
+
+
+def dump_tree(op:LazyArrayOperation):
+    '''
+    Text representation of lazy tree. Nodes met several times are printed once and referenced by number.
+    '''
+    lines = []
+    numbers = dict()
+
+    def visit(node, depth):
+        indent = "  "*depth
+        if id(node) in numbers:
+            lines.append(f"{indent}-> #{numbers[id(node)]}")
+            return
+        numbers[id(node)] = len(numbers)
+        lines.append(f"{indent}#{numbers[id(node)]} {_node_label(node)}")
+        for child in node.operands():
+            visit(child, depth+1)
+
+    visit(op, 0)
+    return "\n".join(lines)
@@ -56,7 +56,7 @@ def shape_transform(shape: tuple, s: slice_t):
             raise IndexError(f"too many indices for array: array is {len(shape)}-dimensional, but {len(s)} were indexed")
         new_shapes = [transform_single_axis(shape[i],s[i],i) for i in range(len(s))]
         new_shapes = [item for item in new_shapes if item is not None]
-        return tuple(new_shapes)
+        return tuple(new_shapes)+tuple(shape[len(s):])
     else:
         tr = transform_single_axis(shape[0], s)
         if tr is None:
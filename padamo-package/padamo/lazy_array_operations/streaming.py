@@ -0,0 +1,550 @@
+import copy
+import os
+import threading
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import h5py
+import numba as nb
+import numpy as np
+
+from .base import LazyArrayOperation
+
+# Default memory budget of streaming reduction: chunks in flight and reducer states
+STREAMING_MAX_BYTES = 1024**3
+
+
+class StreamingReducer(object):
+    '''
+    Reduces array along time axis chunk by chunk.
+    States of reducers that have seen different chunks can be merged.
+    transform (if given) is applied to every chunk before reduction.
+    '''
+    def __init__(self, transform=None):
+        self.transform = transform
+
+    def empty(self):
+        '''
+        Reducer with the same settings that has not seen any data
+        '''
+        res = copy.copy(self)
+        res.reset()
+        return res
+
+    def reset(self):
+        raise NotImplementedError
+
+    def prime(self, chunk):
+        '''
+        Called with first chunk before any update. Reducers choose their layout here.
+        '''
+        pass
+
+    def update(self, chunk):
+        raise NotImplementedError
+
+    def merge(self, other):
+        raise NotImplementedError
+
+    def result(self):
+        raise NotImplementedError
+
+    def state_bytes(self, frame_shape):
+        return 0
+
+    def feed(self, chunk):
+        if self.transform is not None:
+            chunk = self.transform(chunk)
+        self.update(chunk)
+
+
+class MeanReducer(StreamingReducer):
+    def __init__(self, transform=None):
+        super().__init__(transform)
+        self.reset()
+
+    def reset(self):
+        self.total = None
+        self.count = 0
+
+    def update(self, chunk):
+        s = np.sum(chunk, axis=0, dtype=np.float64)
+        self.total = s if self.total is None else self.total+s
+        self.count += chunk.shape[0]
+
+    def merge(self, other):
+        if other.total is not None:
+            self.total = other.total if self.total is None else self.total+other.total
+            self.count += other.count
+
+    def result(self):
+        return self.total/self.count
+
+
+class ExtremumReducer(StreamingReducer):
+    FUNCTION = None
+
+    def __init__(self, transform=None):
+        super().__init__(transform)
+        self.reset()
+
+    def reset(self):
+        self.value = None
+
+    def update(self, chunk):
+        v = type(self).FUNCTION.reduce(chunk, axis=0)
+        self.value = v if self.value is None else type(self).FUNCTION(self.value, v)
+
+    def merge(self, other):
+        if other.value is not None:
+            self.value = other.value if self.value is None else type(self).FUNCTION(self.value, other.value)
+
+    def result(self):
+        return self.value
+
+
+class MaxReducer(ExtremumReducer):
+    FUNCTION = np.maximum
+
+
+class MinReducer(ExtremumReducer):
+    FUNCTION = np.minimum
+
+
+@nb.njit(parallel=True, nogil=True)
+def histogram_update(chunk, counts, nans, underflow, overflow, first, origin, width, ignore_below):
+    n, pixels = chunk.shape
+    last = counts.shape[1]-1
+    for p in nb.prange(pixels):
+        for t in range(n):
+            v = chunk[t, p]
+            if np.isnan(v):
+                nans[p] += 1
+            elif v == np.inf:
+                overflow[p] += 1
+            elif v == -np.inf:
+                if ignore_below == -np.inf:
+                    underflow[p] += 1
+            elif v >= ignore_below:
+                k = int(np.floor((v-origin)/width))-first
+                counts[p, min(max(k, 0), last)] += 1
+
+
+@nb.njit(parallel=True, nogil=True)
+def histogram_gather(chunk, first, last, origin, width, ignore_below, bins_lo, bins_hi, offsets, fill, buffer):
+    # Bins are found exactly as in histogram_update so that gathered values match counts
+    n, pixels = chunk.shape
+    for p in nb.prange(pixels):
+        for t in range(n):
+            v = chunk[t, p]
+            if v >= ignore_below and np.isfinite(v):
+                k = min(max(int(np.floor((v-origin)/width))-first, 0), last)
+                if bins_lo[p] <= k <= bins_hi[p]:
+                    buffer[offsets[p]+fill[p]] = v
+                    fill[p] += 1
+
+
+def _lerp(a, b, t):
+    # Same interpolation as np.quantile along axis (including nan next to infinite values)
+    with np.errstate(invalid="ignore"):
+        diff = b - a
+        return np.where(t >= 0.5, b - diff*(1-t), a + diff*t)
+
+
+class HistogramReducer(StreamingReducer):
+    '''
+    Per-pixel histogram with bin edges origin + k*width shared by all pixels.
+    Range grows with data. If bins do not fit into max_bins, neighbouring bins are merged (width doubles),
+    unless coarsening is disabled.
+    Values below ignore_below are not counted (but are counted in number of frames).
+    Integer data gets unit bins, so its quantiles are exact.
+    Infinite values are counted in underflow (-inf) and overflow (+inf) bins outside of the histogram,
+    so quantiles falling there are infinite, as with np.quantile.
+    '''
+    def __init__(self, width=None, origin=0.0, max_bins=4096, coarsen=True, ignore_below=-np.inf, transform=None):
+        super().__init__(transform)
+        self.width = width
+        self.origin = origin
+        self.max_bins = max_bins
+        self.coarsen = coarsen
+        self.ignore_below = ignore_below
+        self.integer = False
+        self.reset()
+
+    def reset(self):
+        self.counts = None
+        self.nans = None
+        self.underflow = None
+        self.overflow = None
+        self.first = 0
+        self.frames = 0
+
+    def state_bytes(self, frame_shape):
+        return int(np.prod(frame_shape, dtype=np.int64))*self.max_bins*8
+
+    def prime(self, chunk):
+        if self.width is not None:
+            return
+        if chunk.dtype.kind in "biu":
+            self.width = 1.0
+            self.integer = True
+            return
+        finite = chunk[np.isfinite(chunk)]
+        spread = float(finite.max()-finite.min()) if finite.size else 0.0
+        self.width = spread/(self.max_bins/8) if spread > 0 else 1.0
+
+    def edges(self):
+        return self.origin+self.width*(self.first+np.arange(self.counts.shape[1]+1))
+
+    def _ensure(self, pixels, low, high, coarsen=True):
+        '''
+        Extends histogram to cover bins from low to high (inclusive)
+        '''
+        if self.counts is None:
+            self.first = low
+            self.counts = np.zeros((pixels, high-low+1), dtype=np.int64)
+            self.nans = np.zeros(pixels, dtype=np.int64)
+            self.underflow = np.zeros(pixels, dtype=np.int64)
+            self.overflow = np.zeros(pixels, dtype=np.int64)
+        else:
+            last = self.first+self.counts.shape[1]-1
+            if low < self.first or high > last:
+                new_first = min(low, self.first)
+                new_last = max(high, last)
+                counts = np.zeros((pixels, new_last-new_first+1), dtype=np.int64)
+                counts[:, self.first-new_first:self.first-new_first+self.counts.shape[1]] = self.counts
+                self.counts = counts
+                self.first = new_first
+        while coarsen and self.coarsen and self.counts.shape[1] > self.max_bins:
+            self._coarsen()
+
+    def regrouped(self, factor):
+        '''
+        Returns (counts, first) of histogram with factor times wider bins. Bin k goes to k//factor.
+        '''
+        start = self.first - (self.first % factor)
+        end = -(-(self.first+self.counts.shape[1])//factor)*factor
+        counts = np.zeros((self.counts.shape[0], end-start), dtype=np.int64)
+        counts[:, self.first-start:self.first-start+self.counts.shape[1]] = self.counts
+        return counts.reshape(counts.shape[0], -1, factor).sum(axis=2), start//factor
+
+    def _coarsen(self):
+        self.counts, self.first = self.regrouped(2)
+        self.width *= 2
+        self.integer = False
+
+    def update(self, chunk):
+        if self.width is None:
+            self.prime(chunk)
+        flat = np.ascontiguousarray(chunk.reshape(chunk.shape[0], -1), dtype=np.float64)
+        self.frames += flat.shape[0]
+        counted = (flat >= self.ignore_below) & np.isfinite(flat)
+        pixels = flat.shape[1]
+        if counted.any():
+            low = int(np.floor((np.min(flat, where=counted, initial=np.inf)-self.origin)/self.width))
+            high = int(np.floor((np.max(flat, where=counted, initial=-np.inf)-self.origin)/self.width))
+            self._ensure(pixels, low, high)
+        elif self.counts is None:
+            self._ensure(pixels, 0, 0)
+        histogram_update(flat, self.counts, self.nans, self.underflow, self.overflow, self.first, self.origin, self.width,
+                         self.ignore_below)
+
+    def merge(self, other):
+        if other.counts is None:
+            return
+        if self.counts is None:
+            self.counts = other.counts.copy()
+            self.nans = other.nans.copy()
+            self.underflow = other.underflow.copy()
+            self.overflow = other.overflow.copy()
+            self.first = other.first
+            self.width = other.width
+            self.integer = other.integer
+            self.frames = other.frames
+            return
+        other = copy.copy(other)
+        while other.width < self.width:
+            other._coarsen()
+        while self.width < other.width:
+            self._coarsen()
+        if self.width != other.width or self.origin != other.origin:
+            raise ValueError("Histograms with different bin edges cannot be merged")
+        last = other.first+other.counts.shape[1]-1
+        self._ensure(self.counts.shape[0], other.first, last, coarsen=False)
+        self.counts[:, other.first-self.first:other.first-self.first+other.counts.shape[1]] += other.counts
+        self.nans += other.nans
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        self.frames += other.frames
+        while self.coarsen and self.counts.shape[1] > self.max_bins:
+            self._coarsen()
+
+    def result(self):
+        return self.counts
+
+    def save(self, filename, **attrs):
+        '''
+        Stores histogram in HDF5 file. Extra attributes (e.g. description of data) are stored along.
+        '''
+        with h5py.File(filename, "w") as fp:
+            fp.create_dataset("counts", data=self.counts)
+            fp.create_dataset("nans", data=self.nans)
+            fp.create_dataset("underflow", data=self.underflow)
+            fp.create_dataset("overflow", data=self.overflow)
+            fp.attrs.update(attrs)
+            fp.attrs["first"] = self.first
+            fp.attrs["frames"] = self.frames
+            fp.attrs["width"] = self.width
+            fp.attrs["origin"] = self.origin
+            fp.attrs["max_bins"] = self.max_bins
+            fp.attrs["coarsen"] = self.coarsen
+            fp.attrs["ignore_below"] = self.ignore_below
+            fp.attrs["integer"] = self.integer
+
+    @classmethod
+    def load(cls, filename):
+        '''
+        Reads histogram written by save(). Returns histogram and dict of all stored attributes.
+        '''
+        with h5py.File(filename, "r") as fp:
+            attrs = dict(fp.attrs)
+            res = cls(width=float(attrs["width"]), origin=float(attrs["origin"]), max_bins=int(attrs["max_bins"]),
+                      coarsen=bool(attrs["coarsen"]), ignore_below=float(attrs["ignore_below"]))
+            res.counts = fp["counts"][()]
+            res.nans = fp["nans"][()]
+            # Files written before infinite values were counted have no such bins
+            for name in ("underflow", "overflow"):
+                setattr(res, name, fp[name][()] if name in fp else np.zeros_like(res.nans))
+        res.first = int(attrs["first"])
+        res.frames = int(attrs["frames"])
+        res.integer = bool(attrs["integer"])
+        return res, attrs
+
+    def _order_bins(self, ranks):
+        '''
+        Bin of order statistic with given rank for every pixel and count of values before the bin
+        '''
+        cumulative = np.cumsum(self.counts, axis=1)
+        bins = np.empty(ranks.shape, dtype=np.int64)
+        for p in range(ranks.shape[0]):
+            bins[p] = np.searchsorted(cumulative[p], ranks[p], side="right")
+        bins = np.minimum(bins, self.counts.shape[1]-1)
+        pixels = np.arange(ranks.shape[0])
+        before = cumulative[pixels, bins]-self.counts[pixels, bins]
+        return bins, before
+
+    def _finite_ranks(self, ranks):
+        '''
+        Ranks among finite values (clipped to them) and masks of ranks falling to -inf and +inf
+        '''
+        finite = self.counts.sum(axis=1)
+        low = ranks < self.underflow
+        high = ranks >= self.underflow+finite
+        return np.clip(ranks-self.underflow, 0, np.maximum(finite-1, 0)), low, high
+
+    def _order_values(self, ranks):
+        ranks, low, high = self._finite_ranks(ranks)
+        values = self._finite_values(ranks)
+        values[low] = -np.inf
+        values[high] = np.inf
+        return values
+
+    def _finite_values(self, ranks):
+        bins, before = self._order_bins(ranks)
+        pixels = np.arange(ranks.shape[0])
+        left = self.origin+self.width*(self.first+bins)
+        if self.integer:
+            return left
+        # Values are assumed to be spread uniformly inside bin
+        inside = self.counts[pixels, bins]
+        return left+self.width*(ranks-before+0.5)/np.maximum(inside, 1)
+
+    def quantile_ranks(self, q):
+        valid = self.counts.sum(axis=1)+self.underflow+self.overflow
+        position = q*np.maximum(valid-1, 0)
+        lo = np.floor(position).astype(np.int64)
+        hi = np.minimum(lo+1, np.maximum(valid-1, 0))
+        return valid, lo, hi, position-lo
+
+    def quantile(self, q):
+        '''
+        Approximate per-pixel quantile (exact for integer data with unit bins)
+        '''
+        valid, lo, hi, t = self.quantile_ranks(q)
+        res = _lerp(self._order_values(lo), self._order_values(hi), t)
+        res[(self.nans > 0) | (valid == 0)] = np.nan
+        return res
+
+    def quantile_window(self, q):
+        '''
+        For second pass of exact quantile: bins holding needed order statistics,
+        numbers of finite values before them and numbers of values inside.
+        '''
+        valid, lo, hi, t = self.quantile_ranks(q)
+        lo, _, _ = self._finite_ranks(lo)
+        hi, _, _ = self._finite_ranks(hi)
+        bins_lo, before = self._order_bins(lo)
+        bins_hi, before_hi = self._order_bins(hi)
+        pixels = np.arange(lo.shape[0])
+        inside = before_hi+self.counts[pixels, bins_hi]-before
+        return bins_lo, bins_hi, before, inside
+
+
+class QuantileGatherer(StreamingReducer):
+    '''
+    Second pass of exact quantile: collects values inside windows found by HistogramReducer
+    '''
+    def __init__(self, histogram:HistogramReducer, q, transform=None):
+        super().__init__(transform)
+        self.q = q
+        self.histogram = histogram
+        self.bins_lo, self.bins_hi, self.before, self.inside = histogram.quantile_window(q)
+        self.offsets = np.concatenate([[0], np.cumsum(self.inside)[:-1]]).astype(np.int64)
+        self.reset()
+
+    def reset(self):
+        self.buffer = np.empty(int(self.inside.sum()))
+        self.fill = np.zeros(self.inside.shape[0], dtype=np.int64)
+
+    def state_bytes(self, frame_shape):
+        return self.buffer.nbytes
+
+    def update(self, chunk):
+        flat = np.ascontiguousarray(chunk.reshape(chunk.shape[0], -1), dtype=np.float64)
+        h = self.histogram
+        histogram_gather(flat, h.first, h.counts.shape[1]-1, h.origin, h.width, h.ignore_below,
+                         self.bins_lo, self.bins_hi, self.offsets, self.fill, self.buffer)
+
+    def merge(self, other):
+        # Segments of other are appended after already gathered values of each pixel
+        for p in np.nonzero(other.fill)[0]:
+            start = self.offsets[p]+self.fill[p]
+            self.buffer[start:start+other.fill[p]] = other.buffer[other.offsets[p]:other.offsets[p]+other.fill[p]]
+            self.fill[p] += other.fill[p]
+
+    def result(self):
+        h = self.histogram
+        valid, lo, hi, t = h.quantile_ranks(self.q)
+        for p in np.nonzero(self.fill)[0]:
+            self.buffer[self.offsets[p]:self.offsets[p]+self.fill[p]].sort()
+        filled = self.fill > 0
+        values = []
+        for ranks in (lo, hi):
+            finite_ranks, low, high = h._finite_ranks(ranks)
+            v = np.full(ranks.shape[0], np.nan)
+            v[filled] = self.buffer[(self.offsets+finite_ranks-self.before)[filled]]
+            v[low] = -np.inf
+            v[high] = np.inf
+            values.append(v)
+        res = _lerp(values[0], values[1], t)
+        res[(self.histogram.nans > 0) | (valid == 0)] = np.nan
+        return res
+
+
+def print_progress(done, total):
+    print(f"\rStreaming reduction: {done}/{total}", end="" if done < total else "\n")
+
+
+def stream_reduce(op:LazyArrayOperation, reducers, start=0, stop=None, workers=None, max_bytes=STREAMING_MAX_BYTES,
+                  progress=print_progress):
+    '''
+    Feeds [start, stop) of op to reducers chunk by chunk and returns reducers.
+    Chunks are sized so that chunks in flight and reducer states fit into max_bytes.
+    With several workers every worker accumulates its own copies of reducers, which are merged at the end;
+    number of workers is reduced if their states do not fit into max_bytes.
+    progress(done_frames, total_frames) is called after every chunk.
+    '''
+    length = op.shape()[0]
+    if stop is None:
+        stop = length
+    stop = min(stop, length)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    frame_shape = op.shape()[1:]
+    frame_bytes = max(1, int(np.prod(frame_shape, dtype=np.int64))*np.dtype(op.dtype()).itemsize)
+    state = sum(r.state_bytes(frame_shape) for r in reducers)
+    # Chunk is held by reducer together with its float copy
+    workers = max(1, min(workers, max_bytes//(state+3*frame_bytes)))
+    budget = max_bytes-state*workers
+    if budget < 3*frame_bytes*workers:
+        raise MemoryError(f"Streaming reduction needs {state} bytes for its state, budget is {max_bytes}")
+    chunk_len = max(1, budget//(3*frame_bytes*workers))
+    chunk_len = min(chunk_len, op.chunk_layout()[0])
+    chunk_len, _ = op.chunk_layout(chunk_len)
+    total = max(stop-start, 0)
+    done = 0
+    chunks = op.iter_chunks(start, stop, chunk_len)
+
+    # First chunk is seen by main reducers, so that all copies share layout chosen in prime()
+    first = next(chunks, None)
+    if first is None:
+        return reducers
+    index_range, data = first
+    for r in reducers:
+        r.prime(data if r.transform is None else r.transform(data))
+        r.feed(data)
+    done += len(index_range)
+    if progress is not None:
+        progress(done, total)
+
+    if workers <= 1:
+        for index_range, data in chunks:
+            for r in reducers:
+                r.feed(data)
+            done += len(index_range)
+            if progress is not None:
+                progress(done, total)
+        return reducers
+
+    local = threading.local()
+    copies = []
+    lock = threading.Lock()
+
+    def work(item):
+        nonlocal done
+        index_range, data = item
+        own = getattr(local, "reducers", None)
+        if own is None:
+            own = [r.empty() for r in reducers]
+            local.reducers = own
+            with lock:
+                copies.append(own)
+        for r in own:
+            r.feed(data)
+        with lock:
+            done += len(index_range)
+            if progress is not None:
+                progress(done, total)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Chunks are read in this thread; at most 2*workers of them are in flight
+        pending = []
+        for item in chunks:
+            pending.append(pool.submit(work, item))
+            if len(pending) >= 2*workers:
+                pending.pop(0).result()
+        for future in pending:
+            future.result()
+    for own in copies:
+        for r, o in zip(reducers, own):
+            r.merge(o)
+    return reducers
+
+
+def stream_quantile(op:LazyArrayOperation, q, exact=False, transform=None, **kwargs):
+    '''
+    Per-pixel quantile of op along time. Approximate values come from one pass with histograms
+    (exact for integer data); exact=True adds second pass collecting values near the quantile.
+    '''
+    histogram, = stream_reduce(op, [HistogramReducer(transform=transform)], **kwargs)
+    if histogram.counts is None:
+        return np.full(op.shape()[1:], np.nan)
+    if exact and not histogram.integer:
+        gatherer = QuantileGatherer(histogram, q, transform=transform)
+        max_bytes = kwargs.get("max_bytes", STREAMING_MAX_BYTES)
+        if gatherer.buffer.nbytes > max_bytes//2:
+            warnings.warn(f"Exact quantile needs {gatherer.buffer.nbytes} bytes, approximate value is used")
+        else:
+            stream_reduce(op, [gatherer], **kwargs)
+            return gatherer.result().reshape(op.shape()[1:])
+    return histogram.quantile(q).reshape(op.shape()[1:])
@@ -0,0 +1,80 @@
+import unittest
+import numpy as np
+from .basic_operations import ConstantArray
+from .caching import CachedLazyArray
+
+
+class Counting(ConstantArray):
+    '''
+    Constant array remembering requests made to it
+    '''
+    def __init__(self, data):
+        super().__init__(data)
+        self.requests = []
+
+    def request_data(self, interesting_slices):
+        self.requests.append(interesting_slices)
+        return super().request_data(interesting_slices)
+
+
+class TestCachedLazyArray(unittest.TestCase):
+    def setUp(self):
+        self.x = np.arange(100*4, dtype=np.float64).reshape(100, 4)
+        # Every chunk of 10 frames takes 320 bytes
+        self.chunk_bytes = 10*4*8
+
+    def test_hits(self):
+        source = Counting(self.x)
+        cached = CachedLazyArray(source, chunk_size=10, max_bytes=10*self.chunk_bytes)
+        np.testing.assert_array_equal(cached.request_data(slice(5, 35)), self.x[5:35])
+        self.assertEqual((cached.hits, cached.misses), (0, 4))
+        np.testing.assert_array_equal(cached.request_data(slice(12, 28, 3)), self.x[12:28:3])
+        np.testing.assert_array_equal(cached.request_data(-70), self.x[-70])
+        self.assertEqual((cached.hits, cached.misses), (3, 4))
+        self.assertEqual(len(source.requests), 4)
+        self.assertEqual(cached.used_bytes(), 4*self.chunk_bytes)
+
+    def test_eviction(self):
+        source = Counting(self.x)
+        cached = CachedLazyArray(source, chunk_size=10, max_bytes=3*self.chunk_bytes)
+        for i in (0, 10, 20, 0, 30):
+            cached.request_data(i)
+        # Chunk 1 was least recently used
+        self.assertEqual(list(cached._chunks.keys()), [2, 0, 3])
+        cached.request_data(10)
+        self.assertEqual(cached.misses, 5)
+        self.assertEqual(list(cached._chunks.keys()), [0, 3, 1])
+
+    def test_budget(self):
+        cached = CachedLazyArray(ConstantArray(self.x), chunk_size=10, max_bytes=int(2.5*self.chunk_bytes))
+        for i in np.random.default_rng(8).integers(0, 100, 200):
+            np.testing.assert_array_equal(cached.request_data(int(i)), self.x[i])
+            self.assertLessEqual(cached.used_bytes(), cached.max_bytes)
+            self.assertEqual(cached.used_bytes(), sum(c.nbytes for c in cached._chunks.values()))
+        # Chunks that do not fit are not stored
+        small = CachedLazyArray(ConstantArray(self.x), chunk_size=10, max_bytes=self.chunk_bytes-1)
+        np.testing.assert_array_equal(small.request_data(slice(0, 50)), self.x[:50])
+        self.assertEqual(small.used_bytes(), 0)
+
+    def test_cached_data_is_protected(self):
+        cached = CachedLazyArray(ConstantArray(self.x.copy()), chunk_size=10)
+        frame = cached.request_data(3)
+        frame[:] = -1
+        np.testing.assert_array_equal(cached.request_data(3), self.x[3])
+        with self.assertRaises(ValueError):
+            cached.get_chunk(0)[0, 0] = -1
+        part = cached.request_data(slice(0, 5))
+        part[:] = -1
+        np.testing.assert_array_equal(cached.request_data(slice(0, 5)), self.x[:5])
+
+    def test_with_operands(self):
+        cached = CachedLazyArray(ConstantArray(self.x), chunk_size=10, max_bytes=3*self.chunk_bytes)
+        cached.request_data(slice(0, 30))
+        copy = cached.with_operands(lambda op: ConstantArray(self.x*2))
+        self.assertIsNot(copy._chunks, cached._chunks)
+        self.assertIsNot(copy._lock, cached._lock)
+        self.assertEqual(copy.used_bytes(), 0)
+        np.testing.assert_array_equal(copy.request_data(slice(0, 30)), self.x[:30]*2)
+        np.testing.assert_array_equal(cached.request_data(slice(0, 30)), self.x[:30])
+        self.assertEqual(cached.used_bytes(), 3*self.chunk_bytes)
+        self.assertEqual(copy.used_bytes(), 3*self.chunk_bytes)
@@ -0,0 +1,103 @@
+import unittest
+import numpy as np
+from .base import LazyArrayOperation
+from .basic_operations import ConstantArray
+from .evaluation import time_part
+
+
+class Pair(LazyArrayOperation):
+    def __init__(self, a, b):
+        self.a = a
+        self.b = b
+
+    def shape(self):
+        return self.a.shape()
+
+    def request_data(self, interesting_slices):
+        return self.a.request_data(interesting_slices) + self.b.request_data(interesting_slices)
+
+    def dependencies(self, interesting_slices):
+        return [(self.a, time_part(interesting_slices)), (self.b, time_part(interesting_slices))]
+
+
+class Ahead(LazyArrayOperation):
+    '''
+    Reads one sample ahead but declares only requested range
+    '''
+    def __init__(self, source):
+        self.source = source
+
+    def shape(self):
+        return (self.source.shape()[0]-1,)
+
+    def request_data(self, interesting_slices):
+        if isinstance(interesting_slices, int):
+            return self.source.request_data(interesting_slices+1)
+        return self.source.request_data(slice(interesting_slices.start+1, interesting_slices.stop+1))
+
+    def dependencies(self, interesting_slices):
+        return [(self.source, time_part(interesting_slices))]
+
+
+class Counting(ConstantArray):
+    '''
+    Constant array remembering requests made to it
+    '''
+    def __init__(self, data):
+        super().__init__(data)
+        self.requests = []
+
+    def request_data(self, interesting_slices):
+        self.requests.append(interesting_slices)
+        return super().request_data(interesting_slices)
+
+
+class PixelAndFrame(LazyArrayOperation):
+    '''
+    Reads one pixel and whole frames of the same source
+    '''
+    def __init__(self, source):
+        self.source = source
+
+    def shape(self):
+        return self.source.shape()[:1]
+
+    def request_data(self, interesting_slices):
+        frames = self.source.request_data(interesting_slices)
+        return self.source.request_data((interesting_slices, 0, 1)) + frames.sum(axis=(1, 2))
+
+    def dependencies(self, interesting_slices):
+        return [(self.source, interesting_slices), (self.source, (interesting_slices, 0, 1))]
+
+
+class TestEvaluationContext(unittest.TestCase):
+    def test_shared_node(self):
+        src = ConstantArray(np.arange(20.0))
+        root = Pair(src, src*2)
+        np.testing.assert_array_equal(root.request_data(slice(3, 10)), np.arange(3, 10)*3.0)
+        self.assertEqual(root.request_data(5), 15.0)
+
+    def test_unplanned_request(self):
+        src = ConstantArray(np.arange(20.0))
+        root = Pair(Ahead(src), src)
+        np.testing.assert_array_equal(root.request_data(slice(0, 10)), np.arange(1, 11)+np.arange(0, 10))
+        self.assertEqual(root.request_data(4), 9.0)
+
+    def test_single_pixel(self):
+        x = np.arange(20*3*4, dtype=np.float64).reshape(20, 3, 4)
+        src = Counting(x)
+        root = src + src*2.0
+        np.testing.assert_array_equal(root.request_data((slice(3, 10), 1, 2)), x[3:10, 1, 2]*3)
+        # Shared source is evaluated once and only for requested pixel
+        self.assertEqual(src.requests, [(slice(3, 10), 1, 2)])
+        src.requests.clear()
+        np.testing.assert_array_equal(root.request_data((5, slice(0, 2))), x[5, 0:2]*3)
+        self.assertEqual(src.requests, [(slice(5, 6), slice(0, 2))])
+
+    def test_different_spatial_parts(self):
+        x = np.arange(20*3*4, dtype=np.float64).reshape(20, 3, 4)
+        src = Counting(x)
+        root = PixelAndFrame(src)
+        np.testing.assert_array_equal(root.request_data(slice(3, 10)), x[3:10, 0, 1]+x[3:10].sum(axis=(1, 2)))
+        # Requests of pixel and of whole frames are not merged
+        self.assertEqual(src.requests, [slice(3, 10), (slice(3, 10), 0, 1)])
@@ -0,0 +1,68 @@
+import unittest
+import numpy as np
+from .basic_operations import ConstantArray
+from .fusion import FusedElementwise
+from .optimization import optimize
+from .precision import compute_precision, get_compute_precision, FLOAT32, FLOAT64, PRECISION_KEY
+from padamo.node_lib.node_signal_processing import LazyTimeSubtractor, LazyTimeMultiplier
+from padamo.node_processing import Node, ARRAY
+
+
+class TestTimePrecision(unittest.TestCase):
+    def setUp(self):
+        self.time = 1.7e9+np.arange(100)*1e-3
+        self.space = np.arange(100*4, dtype=np.float64).reshape(100, 4)
+
+    def test_time_stays_float64(self):
+        with compute_precision(FLOAT32):
+            time = ConstantArray(self.time)*1.0-ConstantArray(np.full(100, 1.7e9))
+            space = ConstantArray(self.space)*2.0-ConstantArray(self.space)
+            space, time = optimize([space, time], exact_roots=[time])
+        self.assertIsInstance(time, FusedElementwise)
+        self.assertEqual(space.dtype(), np.float32)
+        self.assertEqual(space.request_all_data().dtype, np.float32)
+        self.assertEqual(time.dtype(), np.float64)
+        np.testing.assert_allclose(time.request_all_data(), np.arange(100)*1e-3, atol=1e-6)
+        self.assertIsInstance(time.request_data(-1), np.float64)
+
+    def test_time_operations_are_fused(self):
+        source = ConstantArray(self.time)
+        time = LazyTimeMultiplier(LazyTimeSubtractor(source, 1.7e9), 1e3)
+        unfused = time.request_all_data()
+        self.assertEqual(unfused.dtype, np.float64)
+        for precision in (FLOAT64, FLOAT32):
+            with compute_precision(precision):
+                fused, = optimize([time], exact_roots=[time])
+            self.assertIsInstance(fused, FusedElementwise)
+            self.assertEqual(fused.dtype(), np.float64)
+            np.testing.assert_array_equal(fused.request_all_data(), unfused)
+            np.testing.assert_array_equal(fused.request_data(slice(10, 20)), unfused[10:20])
+            self.assertEqual(fused.request_data(-1), unfused[-1])
+
+
+class PrecisionNode(Node):
+    OUTPUTS = {
+        "value": ARRAY,
+    }
+
+    def calculate(self, globalspace:dict) ->dict:
+        source = ConstantArray(np.arange(10, dtype=np.float64))
+        return dict(value=source*2.0-source)
+
+
+class TestNodePrecision(unittest.TestCase):
+    def apply(self, globalspace):
+        node = PrecisionNode()
+        env = dict()
+        node.apply_on_env(env, globalspace)
+        return env[node]["value"]
+
+    def test_graph_precision(self):
+        self.assertEqual(self.apply({PRECISION_KEY: FLOAT32}).dtype(), np.float32)
+        self.assertEqual(self.apply({PRECISION_KEY: FLOAT64}).dtype(), np.float64)
+        self.assertEqual(get_compute_precision(), FLOAT64)
+
+    def test_default_precision(self):
+        with compute_precision(FLOAT32):
+            self.assertEqual(self.apply(dict()).dtype(), np.float32)
+        self.assertEqual(self.apply(dict()).dtype(), np.float64)
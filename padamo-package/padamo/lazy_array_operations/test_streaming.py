@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from .basic_operations import ConstantArray
+from .streaming import stream_quantile, stream_reduce, HistogramReducer
+
+
+class TestStreamQuantile(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.x = rng.normal(10.0, 3.0, (1000, 3, 4))
+        # Memory budget of 4 workers with chunks of 100 frames, so merging of worker states is tested too
+        state = HistogramReducer().state_bytes((3, 4))
+        self.kwargs = dict(max_bytes=4*(state+3*100*self.x[0].nbytes), workers=4, progress=None)
+
+    def check(self, x, qs=(0.0, 0.1, 0.5, 0.9, 1.0)):
+        op = ConstantArray(x)
+        for q in qs:
+            np.testing.assert_array_equal(stream_quantile(op, q, exact=True, **self.kwargs), np.quantile(x, q, axis=0))
+
+    def test_exact(self):
+        self.check(self.x)
+
+    def test_approximate(self):
+        width = (self.x.max()-self.x.min())/(4096/8)
+        res = stream_quantile(ConstantArray(self.x), 0.5, **self.kwargs)
+        np.testing.assert_allclose(res, np.median(self.x, axis=0), atol=width)
+
+    def test_integer(self):
+        x = np.random.default_rng(1).integers(0, 100, (1000, 3, 4))
+        for q in (0.0, 0.5, 0.9):
+            np.testing.assert_array_equal(stream_quantile(ConstantArray(x), q, **self.kwargs),
+                                          np.quantile(x, q, axis=0))
+
+    def test_infinite(self):
+        x = self.x.copy()
+        x[:10, 0, 0] = -np.inf
+        x[:600, 0, 1] = -np.inf
+        x[-10:, 1, 0] = np.inf
+        x[-600:, 1, 1] = np.inf
+        x[::2, 2, 2] = -np.inf
+        x[1::2, 2, 2] = np.inf
+        x[5, 2, 3] = np.nan
+        with np.errstate(invalid="ignore"):
+            self.check(x, qs=(0.0, 0.005, 0.1, 0.5, 0.9, 0.995, 1.0))
+            width = (self.x.max()-self.x.min())/(4096/8)
+            for q in (0.005, 0.5, 0.995):
+                res = stream_quantile(ConstantArray(x), q, **self.kwargs)
+                np.testing.assert_allclose(res, np.quantile(x, q, axis=0), atol=width)
+
+    def test_exact_over_budget(self):
+        # All values but outlier fall into one bin, so exact pass would need to hold whole signal
+        x = 10.0+np.random.default_rng(3).normal(0.0, 1e-9, (10000, 3, 4))
+        x[0] = 1e6
+        state = HistogramReducer().state_bytes((3, 4))
+        kwargs = dict(max_bytes=state+3*100*x[0].nbytes, workers=1, progress=None)
+        op = ConstantArray(x)
+        with self.assertWarns(UserWarning):
+            res = stream_quantile(op, 0.5, exact=True, **kwargs)
+        np.testing.assert_array_equal(res, stream_quantile(op, 0.5, **kwargs))
+
+
+class TestHistogramReducer(unittest.TestCase):
+    def test_save_load(self):
+        x = np.random.default_rng(2).normal(0.0, 1.0, (500, 6))
+        x[0, 0] = np.inf
+        x[1, 1] = np.nan
+        histogram, = stream_reduce(ConstantArray(x), [HistogramReducer(ignore_below=-1.0)], progress=None)
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "histogram.h5")
+            histogram.save(filename, description="test")
+            loaded, attrs = HistogramReducer.load(filename)
+        self.assertEqual(attrs["description"], "test")
+        for name in ("counts", "nans", "underflow", "overflow"):
+            np.testing.assert_array_equal(getattr(loaded, name), getattr(histogram, name))
+        for name in ("first", "frames", "width", "origin", "ignore_below", "integer"):
+            self.assertEqual(getattr(loaded, name), getattr(histogram, name))
+        np.testing.assert_array_equal(loaded.quantile(0.5), histogram.quantile(0.5))
+        self.assertEqual(loaded.overflow[0], 1)
+        self.assertEqual(histogram.counts.sum()+histogram.nans.sum()+histogram.overflow.sum(), (x >= -1.0).sum()+1)
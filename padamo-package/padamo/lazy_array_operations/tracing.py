@@ -0,0 +1,232 @@
+import json
+import threading
+import time
+import weakref
+import contextlib
+
+import numpy as np
+
+
+_TRACER = None
+_ORIGINS = weakref.WeakKeyDictionary()
+
+
+def active_tracer():
+    return _TRACER
+
+
+def start_tracing():
+    '''
+    Starts recording every request of lazy operations. Returns the tracer.
+    '''
+    global _TRACER
+    _TRACER = Tracer()
+    return _TRACER
+
+
+def stop_tracing():
+    global _TRACER
+    tracer = _TRACER
+    _TRACER = None
+    return tracer
+
+
+@contextlib.contextmanager
+def tracing():
+    tracer = start_tracing()
+    try:
+        yield tracer
+    finally:
+        stop_tracing()
+
+
+def tag_origin(root, origin):
+    '''
+    Marks operations of lazy tree as created by origin (e.g. processing node).
+    Operations that already have origin are not touched, so does their subtree.
+    '''
+    if root is None:
+        return
+    stack = [root]
+    while stack:
+        op = stack.pop()
+        if op in _ORIGINS:
+            continue
+        _ORIGINS[op] = origin
+        stack.extend(op.operands())
+
+
+def origin_of(op):
+    return _ORIGINS.get(op)
+
+
+def _request_size(interesting_slices):
+    x0 = interesting_slices[0] if isinstance(interesting_slices, tuple) and interesting_slices else interesting_slices
+    if isinstance(x0, slice):
+        if x0.start is not None and x0.stop is not None:
+            return len(range(x0.start, x0.stop, x0.step or 1))
+        return -1
+    return 1
+
+
+class TraceFrame(object):
+    def __init__(self, op, interesting_slices):
+        self.op = op
+        self.label = type(op).__name__
+        self.slices = interesting_slices
+        self.requested = _request_size(interesting_slices)
+        self.bytes = 0
+        self.children = []
+        self.wall = 0.0
+        self.cpu = 0.0
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.thread_time()
+
+    def finish(self, result):
+        self.wall = time.perf_counter()-self._wall_start
+        self.cpu = time.thread_time()-self._cpu_start
+        self.bytes = getattr(result, "nbytes", 0)
+
+    @property
+    def self_wall(self):
+        return max(0.0, self.wall-sum(child.wall for child in self.children))
+
+    def to_dict(self):
+        return {
+            "node": self.label,
+            "origin": _origin_label(origin_of(self.op)),
+            "request": repr(self.slices),
+            "elements": self.requested,
+            "bytes": self.bytes,
+            "wall": self.wall,
+            "cpu": self.cpu,
+            "children": [child.to_dict() for child in self.children]
+        }
+
+
+def _origin_label(origin):
+    if origin is None:
+        return None
+    return getattr(origin, "REPR_LABEL", repr(origin))
+
+
+class Tracer(object):
+    '''
+    Collects tree of timed requests for every top-level request of lazy operations.
+    Each thread builds its own trees, so read-ahead workers are traced as separate requests.
+    '''
+    def __init__(self):
+        self.requests = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = []
+            self._local.stack = stack
+        return stack
+
+    def enter(self, op, interesting_slices):
+        frame = TraceFrame(op, interesting_slices)
+        stack = self._stack()
+        if stack:
+            stack[-1].children.append(frame)
+        else:
+            with self._lock:
+                self.requests.append(frame)
+        stack.append(frame)
+        return frame
+
+    def exit(self, frame, result):
+        frame.finish(result)
+        stack = self._stack()
+        if stack and stack[-1] is frame:
+            stack.pop()
+
+    def _frames(self):
+        stack = list(self.requests)
+        while stack:
+            frame = stack.pop()
+            yield frame
+            stack.extend(frame.children)
+
+    def node_costs(self):
+        '''
+        Aggregated statistics for every lazy operation: calls, elements, bytes, wall and cpu time.
+        self_wall excludes time spent in operands.
+        '''
+        costs = dict()
+        for frame in self._frames():
+            key = id(frame.op)
+            if key not in costs:
+                costs[key] = dict(op=frame.op, node=frame.label, origin=origin_of(frame.op), calls=0, elements=0,
+                                  bytes=0, wall=0.0, cpu=0.0, self_wall=0.0)
+            item = costs[key]
+            item["calls"] += 1
+            item["elements"] += max(frame.requested, 0)
+            item["bytes"] += frame.bytes
+            item["wall"] += frame.wall
+            item["cpu"] += frame.cpu
+            item["self_wall"] += frame.self_wall
+        return costs
+
+    def origin_costs(self):
+        '''
+        Own wall time of lazy operations summed by their origins
+        '''
+        res = dict()
+        for item in self.node_costs().values():
+            origin = item["origin"]
+            if origin is not None:
+                res[origin] = res.get(origin, 0.0)+item["self_wall"]
+        return res
+
+    def collapsed_stacks(self):
+        '''
+        Profile in collapsed stack format accepted by flamegraph tools (own time in microseconds)
+        '''
+        counts = dict()
+
+        def visit(frame, prefix):
+            name = frame.label
+            origin = _origin_label(origin_of(frame.op))
+            if origin is not None:
+                name = f"{origin}/{name}"
+            path = f"{prefix};{name}" if prefix else name
+            counts[path] = counts.get(path, 0)+int(frame.self_wall*1e6)
+            for child in frame.children:
+                visit(child, path)
+
+        for request in self.requests:
+            visit(request, "")
+        return "\n".join(f"{path} {value}" for path, value in counts.items())
+
+    def to_json(self, **kwargs):
+        return json.dumps([request.to_dict() for request in self.requests], **kwargs)
+
+    def save(self, filename):
+        if filename.endswith(".json"):
+            text = self.to_json(indent=2)
+        else:
+            text = self.collapsed_stacks()
+        with open(filename, "w") as fp:
+            fp.write(text)
+
+    def summary(self, top=10):
+        costs = sorted(self.node_costs().values(), key=lambda x: x["self_wall"], reverse=True)
+        lines = [f"{'node':<32}{'origin':<32}{'calls':>8}{'MB':>10}{'wall, s':>10}{'self, s':>10}"]
+        for item in costs[:top]:
+            origin = _origin_label(item["origin"]) or ""
+            lines.append(f"{item['node']:<32}{origin:<32}{item['calls']:>8}{item['bytes']/1024**2:>10.2f}"
+                         f"{item['wall']:>10.3f}{item['self_wall']:>10.3f}")
+        return "\n".join(lines)
+
+
+def cost_color(share):
+    '''
+    White for no cost, red for the most expensive
+    '''
+    share = float(np.clip(share, 0.0, 1.0))
+    other = int(255*(1-share))
+    return f"#FF{other:02X}{other:02X}"
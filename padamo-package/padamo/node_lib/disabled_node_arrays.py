@@ -6,6 +6,7 @@ from padamo.node_processing import Node, FLOAT, INTEGER, STRING, ARRAY, ANY, Nod
 from padamo.lazy_array_operations import LazyArrayOperation
 from padamo.lazy_array_operations.basic_operations import ConstantArray
 from padamo.lazy_array_operations.base import normalize_slice, ArrayUnaryOperation, ArrayBinaryOperation
+from padamo.lazy_array_operations.streaming import stream_reduce, MaxReducer, MinReducer
 
 
 class SliceArrayNode(Node):
@@ -112,6 +113,19 @@ class DummyArray(LazyArrayOperation):
 #         return dict(dummy_time=DummyArray(time))
 
 
+def streamed_extremum(arr:LazyArrayOperation, reducer, function, whole, axis):
+    '''
+    function (np.max or np.min) of lazy array evaluated chunk by chunk
+    '''
+    axis = axis % len(arr.shape())
+    if whole or axis == 0:
+        res = stream_reduce(arr, [reducer])[0].result()
+        if whole:
+            return function(res)
+        return res
+    return np.concatenate([function(data, axis=axis) for _, data in arr.iter_chunks()], axis=0)
+
+
 class MaxNode(Node):
     INPUTS = {
         "array":ARRAY
@@ -136,11 +150,9 @@ class MaxNode(Node):
 
     def calculate(self, globalspace:dict) ->dict:
         arr:LazyArrayOperation = self.require("array")
-        arr1 = arr.request_all_data()
-        if self.constants["whole"]:
-            m = np.max(arr1)
-        else:
-            m = ConstantArray(np.max(arr1,axis=self.constants["axis"]))
+        m = streamed_extremum(arr, MaxReducer(), np.max, self.constants["whole"], self.constants["axis"])
+        if not self.constants["whole"]:
+            m = ConstantArray(m)
         return dict(value=m)
 
 class MinNode(Node):
@@ -168,11 +180,9 @@ class MinNode(Node):
 
     def calculate(self, globalspace:dict) ->dict:
         arr:LazyArrayOperation = self.require("array")
-        arr1 = arr.request_all_data()
-        if self.constants["whole"]:
-            m = np.min(arr1)
-        else:
-            m = ConstantArray(np.min(arr1,axis=self.constants["axis"]))
+        m = streamed_extremum(arr, MinReducer(), np.min, self.constants["whole"], self.constants["axis"])
+        if not self.constants["whole"]:
+            m = ConstantArray(m)
         return dict(value=m)
 
 class LazyLogicOR(ArrayBinaryOperation):
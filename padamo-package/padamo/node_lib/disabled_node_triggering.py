@@ -4,6 +4,17 @@ from padamo.node_processing import Node, FLOAT, INTEGER, ARRAY, SIGNAL
 from padamo.lazy_array_operations import LazyArrayOperation
 from padamo.utilities.dual_signal import Signal
 from padamo.lazy_array_operations.basic_operations import ConstantArray
+from padamo.lazy_array_operations.streaming import stream_reduce, MaxReducer
+from padamo.utilities.frame_reductions import frame_sum, frame_max
+
+
+def pixel_maxes(space:LazyArrayOperation):
+    '''
+    Per-pixel maximum over time. 2D space is taken as map itself.
+    '''
+    if len(space.shape())==2:
+        return space.request_all_data()
+    return stream_reduce(space, [MaxReducer()])[0].result()
 
 
 def find_start(src:LazyArrayOperation, thresh):
@@ -91,29 +102,33 @@ class TriggerLineAsymmetrical(Node):
 class LazyLC(LazyArrayOperation):
     def __init__(self, source:LazyArrayOperation, maxmode,pixelmap=None):
         self.source = source
+        self.maxmode = maxmode
         if maxmode:
             print("LC uses max")
-            self.lcfunc = np.max
+            self.lcfunc = frame_max
         else:
             print("LC uses sum")
-            self.lcfunc = np.sum
+            self.lcfunc = frame_sum
         if pixelmap is None:
             self.pixelmap = None
         else:
             self.pixelmap = pixelmap.request_all_data()
 
-    def request_data(self, interesting_slices):
-        src = self.source.request_data(interesting_slices)
-        if self.pixelmap is not None:
-            src[:,np.logical_not(self.pixelmap)] = 0
-        if src.shape==self.shape():
-            axes = tuple(range(1,len(self.shape())))
-            return self.lcfunc(src,axis=axes)
-        else:
-            return self.lcfunc(src)
+    def _reduce(self, src):
+        res = self.lcfunc(src, pixelmap=self.pixelmap)
+        if self.maxmode and self.pixelmap is not None and not np.all(self.pixelmap):
+            # Pixels outside of map are zeros
+            np.maximum(res, 0, out=res)
+        return res
+
+    def request_single(self, i:int):
+        return self._reduce(np.expand_dims(self.source.request_data(i), 0))[0]
+
+    def request_slice(self, s:slice):
+        return self._reduce(self.source.request_data(s))
 
     def shape(self):
-        return self.source.shape()
+        return self.source.shape()[:1]
 
 class LightCurveNode(Node):
     INPUTS = {
@@ -160,11 +175,7 @@ class TriggerMatrix(Node):
     def calculate(self, globalspace:dict) ->dict:
         signal = self.require("signal")
         threshold = self.require("threshold")
-        signal_space = signal.space.request_all_data()
-        if len(signal_space.shape)==2:
-            maxes = signal_space
-        else:
-            maxes = np.max(signal_space, axis=0)
+        maxes = pixel_maxes(signal.space)
         matrix = maxes>threshold
         return dict(map=ConstantArray(matrix))
 
@@ -220,11 +231,7 @@ class TriggerMatrixNumber(Node):
     def calculate(self, globalspace:dict) ->dict:
         signal = self.require("signal")
         n = self.require("amount")
-        signal_space = signal.space.request_all_data()
-        if len(signal_space.shape)==2:
-            maxes = signal_space
-        else:
-            maxes = np.max(signal_space, axis=0)
+        maxes = pixel_maxes(signal.space)
         matrix = trigger_amount(maxes,n)
         return dict(map=ConstantArray(matrix))
 
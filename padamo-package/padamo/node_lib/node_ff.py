@@ -1,16 +1,21 @@
+import os
+
 import numba as nb
 import numpy as np
 from padamo.node_processing import Node, ARRAY, SIGNAL, FLOAT, AllowExternal
 from padamo.lazy_array_operations import LazyArrayOperation
 from padamo.lazy_array_operations.basic_operations import ConstantArray
+from padamo.lazy_array_operations.evaluation import time_part
+from padamo.lazy_array_operations.streaming import stream_reduce, stream_quantile, MeanReducer, HistogramReducer
+from padamo.lazy_array_operations.precision import as_compute, compute_dtype, get_compute_precision
 from padamo.utilities.dual_signal import Signal
 
 SIGMA_TO_MAD_COEFF = 0.6744897501960818
 
-
-@nb.njit(nb.float64[:,:,:](nb.float64[:,:,:],nb.float64[:,:]))
+@nb.njit([nb.float64[:,:,:](nb.float64[:,:,:],nb.float64[:,:]),
+          nb.float32[:,:,:](nb.float32[:,:,:],nb.float32[:,:])])
 def ff_divide(a,b):
-    r = np.zeros(a.shape)
+    r = np.zeros(a.shape, dtype=a.dtype)
     for k in range(a.shape[0]):
         for i in range(a.shape[1]):
             for j in range(a.shape[2]):
@@ -22,24 +27,34 @@ def ff_divide(a,b):
 class LazyFFDivider(LazyArrayOperation):
     def __init__(self, source, divider):
         self.source = source
+        self.precision = get_compute_precision()
         self.divider = divider.request_all_data().astype(float)
         assert self.divider.shape==source.shape()[1:]
 
     def shape(self):
         return self.source.shape()
 
+    def dtype(self):
+        return compute_dtype(self.source.dtype(), self.precision)
+
     def request_single(self,i:int):
-        src_slice = self.source.request_data(i).astype(float)
+        src_slice = as_compute(self.source.request_data(i), self.precision)
         divider = self.divider
-        res = np.zeros(src_slice.shape)
-        np.divide(src_slice,divider, out=res, where=(divider!=0))
+        res = np.zeros(src_slice.shape, dtype=src_slice.dtype)
+        np.divide(src_slice,divider, out=res, where=(divider!=0), casting="unsafe")
         return res
 
     def request_slice(self,s:slice):
-        src_slice = self.source.request_data(s).astype(float)
-        divider = self.divider
+        src_slice = as_compute(self.source.request_data(s), self.precision)
+        divider = self.divider.astype(src_slice.dtype, copy=False)
         return ff_divide(src_slice, divider)
 
+    def dependencies(self, interesting_slices):
+        return [(self.source, time_part(interesting_slices))]
+
+    def fuse(self, fuser):
+        return f"safe_div({fuser.operand(self.source)}, {fuser.pixelwise_array(self.divider)})"
+
     # def request_data(self, interesting_slices):
     #     src_slice = self.source.request_data(interesting_slices).astype(float)
     #     divider = self.divider.request_all_data().astype(float)
@@ -52,35 +67,45 @@ class LazyFFDivider(LazyArrayOperation):
     #         return ff_divide(src_slice.astype(float),divider)
 
 
-@nb.njit(nb.float64[:,:,:](nb.float64[:,:,:],nb.float64[:,:]))
+@nb.njit([nb.float64[:,:,:](nb.float64[:,:,:],nb.float64[:,:]),
+          nb.float32[:,:,:](nb.float32[:,:,:],nb.float32[:,:])])
 def ff_subtract(a,b):
-    r = np.zeros(a.shape)
+    r = np.zeros(a.shape, dtype=a.dtype)
     for k in range(a.shape[0]):
         for i in range(a.shape[1]):
             for j in range(a.shape[2]):
-                if b[i,j] != 0:
-                    r[k,i,j] = a[k,i,j]/b[i,j]
+                r[k,i,j] = a[k,i,j]-b[i,j]
     return r
 
 
 class LazyFFSubtractor(LazyArrayOperation):
     def __init__(self, source, subtractor):
         self.source = source
+        self.precision = get_compute_precision()
         self.subtractor = subtractor.request_all_data().astype(float)
         assert self.subtractor.shape==source.shape()[1:]
 
     def shape(self):
         return self.source.shape()
 
+    def dtype(self):
+        return compute_dtype(self.source.dtype(), self.precision)
+
     def request_single(self,i:int):
-        src_slice = self.source.request_data(i).astype(float)
-        subtractor = self.subtractor
+        src_slice = as_compute(self.source.request_data(i), self.precision)
+        subtractor = self.subtractor.astype(src_slice.dtype, copy=False)
         return src_slice - subtractor
 
     def request_slice(self,s:slice):
-        src_slice = self.source.request_data(s).astype(float)
-        subtractor = self.subtractor
-        return ff_subtract(src_slice.astype(float),subtractor)
+        src_slice = as_compute(self.source.request_data(s), self.precision)
+        subtractor = self.subtractor.astype(src_slice.dtype, copy=False)
+        return ff_subtract(src_slice,subtractor)
+
+    def dependencies(self, interesting_slices):
+        return [(self.source, time_part(interesting_slices))]
+
+    def fuse(self, fuser):
+        return f"{fuser.operand(self.source)} - {fuser.pixelwise_array(self.subtractor)}"
 
     # def request_data(self, interesting_slices):
     #     src_slice = self.source.request_data(interesting_slices).astype(float)
@@ -130,13 +155,18 @@ class FFSubtractNode(Node):
         return dict(signal=Signal(signal_out_space, signal_in.time, signal_in.trigger))
 
 
+def mad_transform(chunk):
+    return np.abs(chunk)/SIGMA_TO_MAD_COEFF
+
+
 class SignalMedian(Node):
     INPUTS = {
         "signal": SIGNAL,
     }
     CONSTANTS = {
         "MAD_mode":False,
-        "Normalize":False
+        "Normalize":False,
+        "exact":True
     }
     OUTPUTS = {
         "median": ARRAY
@@ -146,11 +176,8 @@ class SignalMedian(Node):
 
     def calculate(self, globalspace:dict) ->dict:
         signal = self.require( "signal")
-        spatial = signal.space.request_all_data()
-        if self.constants["MAD_mode"]:
-            medians = np.median(np.abs(spatial)/SIGMA_TO_MAD_COEFF,axis=0)
-        else:
-            medians = np.median(spatial,axis=0)
+        medians = stream_quantile(signal.space, 0.5, exact=self.constants["exact"],
+                                  transform=mad_transform if self.constants["MAD_mode"] else None)
 
         if self.constants["Normalize"]:
             medians = medians / np.mean(medians)
@@ -165,7 +192,8 @@ class SignalQuantile(Node):
     CONSTANTS = {
         "MAD_mode":False,
         "Normalize":False,
-        "q":AllowExternal(0.5)
+        "q":AllowExternal(0.5),
+        "exact":True
     }
     OUTPUTS = {
         "quantiles": ARRAY
@@ -175,12 +203,9 @@ class SignalQuantile(Node):
 
     def calculate(self, globalspace:dict) ->dict:
         signal = self.require( "signal")
-        spatial = signal.space.request_all_data()
         q = self.constants["q"]
-        if self.constants["MAD_mode"]:
-            quants = np.quantile(np.abs(spatial)/SIGMA_TO_MAD_COEFF,q,axis=0)
-        else:
-            quants = np.quantile(spatial,q,axis=0)
+        quants = stream_quantile(signal.space, q, exact=self.constants["exact"],
+                                 transform=mad_transform if self.constants["MAD_mode"] else None)
 
         if self.constants["Normalize"]:
             quants = quants / np.mean(quants)
@@ -188,34 +213,46 @@ class SignalQuantile(Node):
         return dict(quantiles=quants)
 
 
-@nb.njit()
-def bin_ff(source, bin_width, threshold, max_signal):
-    length = len(source)
-    #max_signal = np.max(source)
-    bins_count = int(max_signal/bin_width)+1
-    bins = np.zeros(shape=(bins_count,))
-    for i in range(length):
-        if source[i] >= 0:
-            bin_id = int(source[i]/bin_width)
-            bins[bin_id] += 1
-    #print("BINS",bins)
-    #accum = 0
-    for j in range(bins_count):
-        #accum += bins[j]
-        if bins[j]/length > threshold:
-            return j*bin_width
-    return 1.0
-
-
-@nb.njit(parallel=True)
-def bin_ff_3d(source, bin_width, threshold):
-    max_signal = np.max(source)
-    res = np.zeros(shape=(source.shape[1:]))
-    for i in nb.prange(source.shape[1]):
-        for j in nb.prange(source.shape[2]):
-            res[i,j] = bin_ff(source[:,i,j],bin_width=bin_width,threshold=threshold,max_signal=max_signal)
-    return res
-
+def frequency_ff(histogram:HistogramReducer, threshold, bin_width=None):
+    '''
+    Left edge of first histogram bin holding more than threshold of all frames (1.0 where there is no such bin).
+    If bin_width is given, bins of histogram are merged into bins of this width (it must be multiple of histogram bin width).
+    '''
+    counts, first, width = histogram.counts, histogram.first, histogram.width
+    if bin_width is not None and bin_width != width:
+        factor = int(round(bin_width/width))
+        if factor < 1 or not np.isclose(factor*width, bin_width):
+            raise ValueError(f"Bin width {bin_width} is not multiple of histogram resolution {width}")
+        counts, first = histogram.regrouped(factor)
+        width = bin_width
+    if threshold < 0:
+        return np.zeros(counts.shape[0])
+    above = counts/max(histogram.frames, 1) > threshold
+    bins = np.argmax(above, axis=1)
+    return np.where(above.any(axis=1), (first+bins)*width, 1.0)
+
+
+def ff_histogram(signal:Signal, resolution, filename=""):
+    '''
+    Per-pixel histogram of non-negative signal values with bins of given width, made in one pass over data.
+    If filename is given, histogram is stored there and later calls reuse it without reading data,
+    so threshold and bin width can be tuned quickly. File is not checked to be made from the same signal:
+    remove it or choose other one when signal changes.
+    '''
+    shape = signal.space.shape()
+    if filename and os.path.isfile(filename):
+        stored, _ = HistogramReducer.load(filename)
+        if stored.width == resolution and stored.frames == shape[0] \
+                and stored.counts.shape[0] == int(np.prod(shape[1:], dtype=np.int64)):
+            print("Loaded histogram", filename)
+            return stored
+        print(f"Histogram {filename} has other resolution or size, recalculating")
+    # Negative values are not counted
+    histogram = HistogramReducer(width=float(resolution), origin=0.0, coarsen=False, ignore_below=0.0)
+    stream_reduce(signal.space, [histogram])
+    if filename:
+        histogram.save(filename)
+    return histogram
 
 
 class SignalFrequencyFF(Node):
@@ -224,7 +261,9 @@ class SignalFrequencyFF(Node):
     }
     CONSTANTS = {
         "bin_width": AllowExternal(1.0),
-        "threshold": AllowExternal(0.01)
+        "threshold": AllowExternal(0.01),
+        "resolution": AllowExternal(0.0),
+        "histogram_file": AllowExternal("")
     }
     OUTPUTS = {
         "ff_coefficients": ARRAY
@@ -234,10 +273,13 @@ class SignalFrequencyFF(Node):
 
     def calculate(self,globalspace:dict) -> dict:
         signal = self.require("signal")
-        spatial = signal.space.request_all_data()
         threshold = self.constants["threshold"]
         bin_width = self.constants["bin_width"]
-        coeffs = bin_ff_3d(spatial,bin_width,threshold)
+        # Histogram with finer bins (resolution) allows to change bin_width without new pass over data
+        resolution = self.constants["resolution"] or bin_width
+        histogram = ff_histogram(signal, resolution, self.constants["histogram_file"])
+        coeffs = frequency_ff(histogram, threshold, bin_width)
+        coeffs = coeffs.reshape(signal.space.shape()[1:])
         print(coeffs)
         return dict(ff_coefficients=ConstantArray(coeffs))
 
@@ -259,8 +301,8 @@ class SignalMean(Node):
 
     def calculate(self, globalspace:dict) ->dict:
         signal = self.require( "signal")
-        spatial = signal.space.request_all_data()
-        means = np.mean(spatial,axis=0)
+        reducer, = stream_reduce(signal.space, [MeanReducer()])
+        means = reducer.result()
         if self.constants["Normalize"]:
             means = means/np.mean(means)
         means = ConstantArray(means)
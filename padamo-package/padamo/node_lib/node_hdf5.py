@@ -12,6 +12,21 @@ def create_signal(filename, spatial_key, temporal_key):
     reader_t = LazyHDF5reader(filename, temporal_key)
     return Signal(reader_s, reader_t)
 
+def read_into(dataset, interesting_slices, out:np.ndarray):
+    '''
+    Reads dataset selection directly into out if possible
+    '''
+    if not out.flags.c_contiguous or out.size == 0:
+        out[...] = dataset[interesting_slices]
+        return out
+    selection = interesting_slices if isinstance(interesting_slices, tuple) else (interesting_slices,)
+    if all(isinstance(s, slice) and (s.step is None or s.step > 0) for s in selection):
+        dataset.read_direct(out, source_sel=selection)
+    else:
+        out[...] = dataset[interesting_slices]
+    return out
+
+
 class LazyHDF5reader(LazyArrayOperation):
     def __init__(self, filename, field):
         self.filename = filename
@@ -33,9 +48,19 @@ class LazyHDF5reader(LazyArrayOperation):
         res = np.array(self._file[self.field][interesting_slices])
         return res
 
+    def request_into(self, interesting_slices, out:np.ndarray):
+        self.ensure_file()
+        return read_into(self._file[self.field], interesting_slices, out)
+
     def shape(self):
         return self._file[self.field].shape
 
+    def dtype(self):
+        return self._file[self.field].dtype
+
+    def chunks(self):
+        return self._file[self.field].chunks
+
 
 class H5SourceArray(Node):
     INPUTS = {
@@ -178,7 +203,6 @@ class LocalHDF5Directory(Node):
         space_key = self.constants["spatial_field"]
         if not os.path.isdir(src_dir):
             raise NodeExecutionError(f"No such directory {src_dir}", self.graph_node)
-        signal = None
         files = map(lambda x: os.path.join(src_dir,x),
                     os.listdir(src_dir))
 
@@ -200,16 +224,11 @@ class LocalHDF5Directory(Node):
         files = list(files)
         files.sort(key=lambda x: x[1])
         files = list(map(lambda x: x[0],files))
-        for filename in files:
-            new_part = create_signal(filename,space_key, time_key)
-            if signal is None:
-                signal = new_part
-            else:
-                signal = signal.extend(new_part)
-
-        if signal is None:
+        if not files:
             raise NodeExecutionError("Suitable signals not found",self.graph_node)
 
+        parts = [create_signal(filename,space_key, time_key) for filename in files]
+        signal = Signal.concatenate(parts)
         return dict(signal=signal)
 
 
@@ -3,6 +3,7 @@ import numba as nb
 from scipy.special import lambertw
 
 from padamo.lazy_array_operations import LazyArrayOperation
+from padamo.lazy_array_operations.precision import as_compute, compute_dtype, get_compute_precision
 from padamo.node_processing import Node,ARRAY,SIGNAL
 
 # Constants
@@ -21,56 +22,143 @@ from padamo.node_processing import Node,ARRAY,SIGNAL
 #
 
 # Function lambertw is not supported by numba_scipy.
-# Used solution https://habr.com/ru/articles/665634/
-@nb.njit()
+# Principal branch is found with Halley iterations (see Corless et al., On the Lambert W function).
+# Arguments below branch point -1/e have no real solution, -1 is returned for them.
+INV_E = np.exp(-1.0)
+
+
+@nb.njit(nogil=True)
+def lambert_w0_guess(x):
+    if x < -0.32:
+        # Series around branch point
+        p = np.sqrt(2*(np.e*x+1))
+        return -1+p*(1+p*(-1/3+p*11/72))
+    # Winitzki approximation
+    l = np.log1p(x)
+    return l*(1-np.log1p(l)/(2+l))
+
+
+@nb.njit(nogil=True)
+def lambert_w0_refine(x, w, iterations):
+    for _ in range(iterations):
+        if w+1 < 1e-8:
+            # At branch point iterations degenerate, series is exact enough there
+            break
+        ew = np.exp(w)
+        f = w*ew-x
+        step = f/(ew*(w+1)-(w+2)*f/(2*w+2))
+        w -= step
+        if abs(step) <= 1e-14*(1+abs(w)):
+            break
+    return w
+
+
+@nb.njit(nogil=True)
 def lambert_w0(x):
-    left = -1
-    right = x if x <= np.e else np.log(x)
-    prec = 10**-8 # precision
-    # binary search
-    while right - left > prec:
-        mid = (right + left) / 2
-        if mid * np.exp(mid) > x:
-            right = mid
-        else:
-            left = mid
-    return right
-
-@nb.njit()
-def flatfield(pdm_2d_rot_global:np.ndarray, eff,tau, dt, cr_to_int, nts):
-    res = np.empty(pdm_2d_rot_global.shape)
-    for i in range(pdm_2d_rot_global.shape[0]):
-        for j in range(pdm_2d_rot_global.shape[1]):
-            for k in range(pdm_2d_rot_global.shape[2]):
-
-                if eff[j,k]>0:
-                    b = tau[j, k] * eff[j, k] / dt
-                    larg = -b * pdm_2d_rot_global[i,j,k]/nts/eff[j,k]
-                    res[i,j,k] = -cr_to_int*nts*lambert_w0(larg).real/b
+    if x <= -INV_E:
+        return -1.0
+    return lambert_w0_refine(x, lambert_w0_guess(x), 20)
+
+
+# Lookup table covers arguments from -1/e to 0 (nonnegative counts)
+LAMBERT_TABLE_SIZE = 4096
+LAMBERT_TABLE_P_MAX = np.sqrt(2.0)
+
+
+@nb.njit(nogil=True)
+def _lambert_table(size):
+    res = np.empty(size)
+    step = LAMBERT_TABLE_P_MAX/(size-1)
+    for i in range(size):
+        p = i*step
+        res[i] = lambert_w0((p*p/2-1)/np.e)
+    return res
+
+
+def lambert_w0_table(size=LAMBERT_TABLE_SIZE):
+    '''
+    Values of W0 tabulated over p = sqrt(2(ex+1)), where W0 is smooth even near branch point
+    '''
+    return _lambert_table(size)
+
+
+@nb.njit(nogil=True)
+def lambert_w0_lookup(x, table):
+    '''
+    Linear interpolation in table followed by one Halley step. Arguments outside of table are computed directly.
+    '''
+    if x <= -INV_E:
+        return -1.0
+    p = np.sqrt(2*(np.e*x+1))
+    pos = p/LAMBERT_TABLE_P_MAX*(table.shape[0]-1)
+    i = int(pos)
+    if i >= table.shape[0]-1:
+        return lambert_w0(x)
+    t = pos-i
+    return lambert_w0_refine(x, table[i]*(1-t)+table[i+1]*t, 1)
+
+
+@nb.njit(parallel=True, nogil=True)
+def flatfield(pdm_2d_rot_global:np.ndarray, eff,tau, dt, cr_to_int, nts, table):
+    '''
+    Pile-up correction. Empty table means W0 is computed without lookup table.
+    '''
+    res = np.empty(pdm_2d_rot_global.shape, dtype=pdm_2d_rot_global.dtype)
+    l, w, h = pdm_2d_rot_global.shape
+    # Per pixel coefficients: argument and result scales
+    arg_scale = np.zeros((w, h))
+    res_scale = np.zeros((w, h))
+    for j in range(w):
+        for k in range(h):
+            if eff[j, k] > 0:
+                b = tau[j, k] * eff[j, k] / dt
+                arg_scale[j, k] = -b/nts/eff[j, k]
+                res_scale[j, k] = -cr_to_int*nts/b
+    use_table = table.shape[0] > 1
+    for p in nb.prange(l*w):
+        i = p // w
+        j = p % w
+        for k in range(h):
+            if eff[j,k]>0:
+                larg = arg_scale[j, k]*pdm_2d_rot_global[i,j,k]
+                if use_table:
+                    res[i,j,k] = res_scale[j, k]*lambert_w0_lookup(larg, table)
                 else:
-                    res[i,j,k] = 0.0
+                    res[i,j,k] = res_scale[j, k]*lambert_w0(larg)
+            else:
+                res[i,j,k] = 0.0
     return res
 
 class LazyFFPhysicalSignal(LazyArrayOperation):
-    def __init__(self, source, eff, tau, dt, cr_to_int, nts):
+    def __init__(self, source, eff, tau, dt, cr_to_int, nts, use_table=False):
         self.source = source
         self.tau = tau.request_all_data().astype(float)
         self.eff = eff.request_all_data().astype(float)
         self.dt = dt
         self.cr_to_int = cr_to_int
         self.nts = nts
+        self.precision = get_compute_precision()
+        if use_table:
+            self.table = lambert_w0_table()
+        else:
+            self.table = np.zeros(0)
         #self.divider = divider.request_all_data().astype(float)
         assert self.tau.shape == self.eff.shape == source.shape()[1:]
 
     def shape(self):
         return self.source.shape()
 
+    def dtype(self):
+        return compute_dtype(self.source.dtype(), self.precision)
+
     def request_single(self,i:int):
+        if i < 0:
+            i += self.shape()[0]
         return self.request_slice(slice(i,i+1))[0]
 
     def request_slice(self,s:slice):
-        src_slice = self.source.request_data(s).astype(float)
-        return flatfield(src_slice,self.eff,self.tau, self.dt, self.cr_to_int, self.nts)
+        src_slice = as_compute(self.source.request_data(s), self.precision)
+        return flatfield(src_slice,self.eff,self.tau, self.dt, self.cr_to_int, self.nts, self.table)
 
 class PhysicalFlatFieldingNode(Node):
     INPUTS = {
@@ -88,6 +176,7 @@ class PhysicalFlatFieldingNode(Node):
         "pix_fov": (2.88 / 160) ** 2,  # Поле зрения пикселя в стеррадианах
         "s": np.pi * 25 / 4,  # Площадь входного окна в см^2
         "t": 0.001,  # Time sample в секундах
+        "lambert_table": False, # Lookup table for Lambert W function
     }
     REPR_LABEL = "Pile up flat fielding"
     LOCATION = "/Flat fielding/Pile up flat fielding"
@@ -108,7 +197,7 @@ class PhysicalFlatFieldingNode(Node):
         nts = t/dt*10**9
         cr_to_int = 1 / (wt * lt * pix_fov * s * t)  # Коэффициент перевода Count Rate --> Intensity
 
-        new_spatial = LazyFFPhysicalSignal(spatial,eff,tau,dt,cr_to_int,nts)
+        new_spatial = LazyFFPhysicalSignal(spatial,eff,tau,dt,cr_to_int,nts,self.constants["lambert_table"])
         new_signal = signal.clone()
         new_signal.space = new_spatial
         return dict(signal=new_signal)
\ No newline at end of file
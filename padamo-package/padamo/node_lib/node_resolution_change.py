@@ -72,27 +72,24 @@ class LazyResolutionChange(LazyArrayOperation):
         if step==1:
             # Gallop optimization
             #print("Reduce time speeding up")
-            cnt = 0
             if self.use_low_ram:
                 max_available_chunks = self._get_max_chunk_size()
             else:
                 max_available_chunks = end-start
-            #max_available_samples = max_available_chunks*self.scale
-            i = start
-            while i < end:
-                #print(f"\r{i-start}/{end-start}      ", end="")
-                i_step = min(end-i,max_available_chunks)
-                i_start = i
-                i_end = i_start+i_step
-                data_part = self.source.request_data(slice(i_start*self.scale,i_end*self.scale))
+            chunk_len = max_available_chunks*self.scale
+            # Chunk boundaries must not split reduced samples
+            align = self.scale
+            storage_chunks = self.source.chunks()
+            if storage_chunks:
+                common = int(np.lcm(self.scale, storage_chunks[0]))
+                if common <= chunk_len:
+                    align = common
+            for index_range, data_part in self.source.iter_chunks(start*self.scale, end*self.scale, chunk_len, align=align):
+                #print(f"\r{index_range.start}/{end*self.scale}      ", end="")
                 reduced = reduce_resolution(data_part,self.scale,self.use_sum)
-                cnt_step = reduced.shape[0]
-                assert cnt_step == i_step
-                res[cnt:cnt+cnt_step] = reduced
-                cnt += cnt_step
-                i = i_end
-                if self.use_low_ram:
-                    max_available_chunks = self._get_max_chunk_size()
+                cnt = index_range.start//self.scale - start
+                assert reduced.shape[0] == len(index_range)//self.scale
+                res[cnt:cnt+reduced.shape[0]] = reduced
             #print()
             return res
         else:
@@ -5,12 +5,17 @@ import numba as nb
 
 from padamo.lazy_array_operations import LazyArrayOperation
 from padamo.lazy_array_operations.slice_combination import normalize_slice
+from padamo.lazy_array_operations.evaluation import time_part
+from padamo.lazy_array_operations.precision import as_compute, compute_dtype, get_compute_precision
 from padamo.node_lib.disabled_node_arrays import DummyArray
 from padamo.node_processing import Node, SIGNAL, STRING, INTEGER, ARRAY, AllowExternal,Optional
 
 from padamo.ui_elements.searching import comparing_binsearch
 from padamo.ui_elements.datetime_parser import parse_datetimes_dt, datetime_to_unixtime
 from padamo.utilities.dual_signal import Signal
+from padamo.utilities.frame_reductions import frame_any, single_frame
+from padamo.utilities.dilation import window_any, dilate_runs
+from padamo.utilities.run_trigger import RunTrigger
 from padamo.lazy_array_operations.base import ArrayBinaryOperation
 
 
@@ -172,6 +177,8 @@ class LazyTriggerInverter(LazyArrayOperation):
     def mux_none(item):
         if item is None:
             return None
+        if isinstance(item, RunTrigger) and item.masks is None:
+            return item.complement()
         return LazyTriggerInverter(item)
 
     def shape(self):
@@ -210,14 +217,17 @@ class LazyTriggerMarginalize(LazyArrayOperation):
 
     def request_single(self, i):
         data = self.src.request_data(i)
-        return np.logical_or.reduce(data)
+        return single_frame(frame_any, data)
 
     def request_slice(self,s:slice):
         data = self.src.request_data(s)
-        s = len(self.src.shape())
-        axes = tuple(range(1,s))
-        dat = np.logical_or.reduce(data,axis=axes)
-        return dat
+        return frame_any(data)
+
+
+def marginalize_trigger(trigger):
+    if isinstance(trigger, RunTrigger):
+        return trigger.marginalized()
+    return LazyTriggerMarginalize(trigger)
 
 
 class LazyTriggersAnd(LazyArrayOperation):
@@ -269,25 +279,106 @@ class TriggersAnd(Node):
         if a.trigger is None or b.trigger is None:
             trig = None
         else:
-            trig_a = LazyTriggerMarginalize(a.trigger)
-            trig_b = LazyTriggerMarginalize(b.trigger)
-            trig = LazyTriggersAnd(trig_a,trig_b,self.constants["swap_arguments"])
+            trig_a = marginalize_trigger(a.trigger)
+            trig_b = marginalize_trigger(b.trigger)
+            if isinstance(trig_a, RunTrigger) and isinstance(trig_b, RunTrigger):
+                trig = trig_a.intersection(trig_b)
+            else:
+                trig = LazyTriggersAnd(trig_a,trig_b,self.constants["swap_arguments"])
         space = a.space
         time = a.time
         synth = Signal(space,time,trig)
         return dict(and_triggered=synth)
 
 
-@nb.njit
+class LazyTriggersOr(LazyArrayOperation):
+    def __init__(self,a: LazyArrayOperation,b: LazyArrayOperation):
+        assert a.shape() == b.shape()
+        self.a = a
+        self.b = b
+
+    def shape(self):
+        return self.a.shape()
+
+    def request_data(self, interesting_slices):
+        a_res = self.a.request_data(interesting_slices)
+        if np.all(a_res):
+            return a_res
+        b_res = self.b.request_data(interesting_slices)
+        return np.logical_or(a_res,b_res)
+
+
+class TriggersOr(Node):
+    INPUTS = {
+        "primary":SIGNAL,
+        "secondary":SIGNAL,
+    }
+    OUTPUTS = {
+        "or_triggered":SIGNAL
+    }
+
+    LOCATION = "/Signal manipulation/Unite triggers"
+    REPR_LABEL = "Unite triggers"
+
+    def calculate(self,globalspace:dict) ->dict:
+        a = self.require("primary")
+        b = self.require("secondary")
+        assert a.time.request_data(0) == b.time.request_data(0)
+        assert a.time.request_data(-1) == b.time.request_data(-1)
+
+        if a.trigger is None:
+            trig = b.trigger
+        elif b.trigger is None:
+            trig = a.trigger
+        else:
+            trig_a = marginalize_trigger(a.trigger)
+            trig_b = marginalize_trigger(b.trigger)
+            if isinstance(trig_a, RunTrigger) and isinstance(trig_b, RunTrigger):
+                trig = trig_a.union(trig_b)
+            else:
+                trig = LazyTriggersOr(trig_a,trig_b)
+        synth = Signal(a.space,a.time,trig)
+        return dict(or_triggered=synth)
+
+
+class TriggerRunsNode(Node):
+    INPUTS = {
+        "signal_in":SIGNAL,
+    }
+    CONSTANTS = {
+        "per_pixel":True
+    }
+    OUTPUTS = {
+        "signal_out":SIGNAL
+    }
+
+    LOCATION = "/Signal manipulation/Encode trigger runs"
+    REPR_LABEL = "Encode trigger runs"
+
+    def calculate(self,globalspace:dict) ->dict:
+        signal = self.require("signal_in")
+        res = signal.clone()
+        if res.trigger is not None and not isinstance(res.trigger, RunTrigger):
+            res.trigger = RunTrigger.from_lazy(res.trigger, self.constants["per_pixel"])
+        return dict(signal_out=res)
+
+
 def deconvolve(x,window):
+    # res[i] = x[start:start+window].any() with start = max(i-window//2, 0)
     res = np.full(shape=x.shape,fill_value=False)
-    for i in range(x.shape[0]):
-        start = i-window//2
-        start = max(start,0)
-        end = start+window
-        end = min(end,x.shape[0])
-        res[i] = x[start:end].any()
-    return res
+    return window_any(x, window//2, window, True, res)
+
+
+def expand_runs(starts, ends, window, length):
+    '''
+    Same as deconvolve for trigger given as runs [starts[k], ends[k])
+    '''
+    touches_edge = starts.shape[0] > 0 and starts[0] < window
+    starts, ends = dilate_runs(starts, ends, window-window//2-1, window//2, length)
+    # Windows near left edge are shifted to [0, window)
+    if touches_edge and starts.shape[0] > 0:
+        starts[0] = 0
+    return starts, ends
 
 
 class LazyTriggerExpander(LazyArrayOperation):
@@ -345,14 +436,18 @@ class TriggerExpand(Node):
     def calculate(self,globalspace:dict) ->dict:
         signal = self.require("signal_in")
         res = signal.clone()
-        if res.trigger is not None:
-            res.trigger = LazyTriggerExpander(res.trigger,self.constants["window"])
+        window = self.constants["window"]
+        if isinstance(res.trigger, RunTrigger) and not res.trigger.frame_shape:
+            starts, ends = expand_runs(res.trigger.starts, res.trigger.ends, window, res.trigger.length)
+            res.trigger = RunTrigger(starts, ends, res.trigger.length)
+        elif res.trigger is not None:
+            res.trigger = LazyTriggerExpander(res.trigger,window)
         return dict(signal_out=res)
 
 
 @nb.njit()
 def signal_mask(src, mask):
-    res = np.zeros(shape=src.shape)
+    res = np.zeros(shape=src.shape, dtype=src.dtype)
     for i in range(res.shape[0]):
         for j in range(res.shape[1]):
             for k in range(res.shape[2]):
@@ -365,6 +460,7 @@ class LazySilencer(LazyArrayOperation):
     def __init__(self, source, mask):
         self.source = source
         self.mask = mask.request_all_data().astype(float)
+        self.precision = get_compute_precision()
         pix = source.shape()[1:]
         # if mask.shape != pix:
         #     raise ValueError(f"Shapes mismatch {mask.shape}!= {pix}")
@@ -373,16 +469,24 @@ class LazySilencer(LazyArrayOperation):
     def shape(self):
         return self.source.shape()
 
+    def dtype(self):
+        return compute_dtype(self.source.dtype(), self.precision)
+
     def request_single(self,i:int):
-        src_slice = self.source.request_data(i).astype(float)[:]
+        src_slice = as_compute(self.source.request_data(i), self.precision)
         mask = self.mask
-        src_slice[np.logical_not(mask)] = 0
-        return src_slice
+        return np.where(mask != 0, src_slice, src_slice.dtype.type(0))
 
     def request_slice(self,s:slice):
-        src_slice = self.source.request_data(s).astype(float)
+        src_slice = as_compute(self.source.request_data(s), self.precision)
         mask = self.mask
-        return signal_mask(src_slice.astype(float), mask)
+        return signal_mask(src_slice, mask)
+
+    def dependencies(self, interesting_slices):
+        return [(self.source, time_part(interesting_slices))]
+
+    def fuse(self, fuser):
+        return f"masked({fuser.operand(self.source)}, {fuser.pixelwise_array(self.mask)})"
 
 
 class SilencerNode(Node):
@@ -1,62 +1,305 @@
 import sys
+import threading
 from datetime import datetime
 from datetime import timedelta
 
 import numba as nb
 import numpy as np
 from padamo.node_processing import Node, FLOAT, INTEGER, STRING, SIGNAL, AllowExternal
-from padamo.lazy_array_operations import LazyArrayOperation
+from padamo.lazy_array_operations import LazyArrayOperation, CachedLazyArray
 from padamo.lazy_array_operations.base import normalize_slice
+from padamo.lazy_array_operations.evaluation import time_part
+from padamo.lazy_array_operations.precision import as_compute, compute_dtype, get_compute_precision
 from padamo.lazy_array_operations.base import AutoRequest
 from padamo.utilities.dual_signal import Signal
+from padamo.utilities.frame_reductions import frame_median, single_frame
 from .disabled_node_arrays import DummyArray
 
 
-@nb.njit(nb.float64[:](nb.float64[:], nb.int64, nb.float64))
-def moving_quantile_1d(src, window, quant):
+# Integer inputs spanning fewer distinct values are processed with value histogram
+QUANTILE_HISTOGRAM_BINS = 1 << 16
+
+
+@nb.njit(nogil=True)
+def fenwick_add(tree, i, value):
+    i += 1
+    n = tree.shape[0]
+    while i < n:
+        tree[i] += value
+        i += i & (-i)
+
+
+@nb.njit(nogil=True)
+def fenwick_kth(tree, k):
+    '''
+    Smallest index which prefix sum exceeds k (i.e. position of k-th item counting from zero)
+    '''
+    n = tree.shape[0]
+    step = 1
+    while step*2 < n:
+        step *= 2
+    pos = 0
+    while step > 0:
+        if pos+step < n and tree[pos+step] <= k:
+            pos += step
+            k -= tree[pos]
+        step //= 2
+    return pos
+
+
+@nb.njit(nogil=True)
+def quantile_lerp(a, b, t):
+    # Same interpolation as np.quantile
+    diff = b - a
+    if t >= 0.5:
+        return b - diff*(1-t)
+    return a + diff*t
+
+
+@nb.njit(nogil=True)
+def sliding_quantile_1d_into(src, window, quant, out):
+    '''
+    Quantiles of all windows of src. Window contents are kept as Fenwick tree over ranks of src values,
+    so every step costs O(log len(src)).
+    '''
+    l_ = src.shape[0]
+    order = np.argsort(src, kind="mergesort")
+    ranks = np.empty(l_, dtype=np.int64)
+    for k in range(l_):
+        ranks[order[k]] = k
+    tree = np.zeros(l_+1, dtype=np.int64)
+    position = quant*(window-1)
+    lo = int(np.floor(position))
+    t = position - lo
+    hi = min(lo+1, window-1)
+    nans = 0
+    for k in range(l_):
+        if np.isnan(src[k]):
+            nans += 1
+        else:
+            fenwick_add(tree, ranks[k], 1)
+        if k >= window:
+            if np.isnan(src[k-window]):
+                nans -= 1
+            else:
+                fenwick_add(tree, ranks[k-window], -1)
+        if k >= window-1:
+            if nans > 0:
+                out[k-window+1] = np.nan
+            else:
+                a = src[order[fenwick_kth(tree, lo)]]
+                b = src[order[fenwick_kth(tree, hi)]]
+                out[k-window+1] = quantile_lerp(a, b, t)
+
+
+@nb.njit(nogil=True)
+def histogram_quantile_1d_into(src, bins, window, quant, out):
+    '''
+    Same as sliding_quantile_1d_into for nonnegative integers below bins. Fenwick tree is built over values.
+    '''
     l_ = src.shape[0]
-    res = np.zeros((l_-window+1,))
-    for i in range(l_-window+1):
-        res[i] = np.quantile(src[i:i+window], quant)
+    tree = np.zeros(bins+1, dtype=np.int64)
+    position = quant*(window-1)
+    lo = int(np.floor(position))
+    t = position - lo
+    hi = min(lo+1, window-1)
+    for k in range(l_):
+        fenwick_add(tree, src[k], 1)
+        if k >= window:
+            fenwick_add(tree, src[k-window], -1)
+        if k >= window-1:
+            out[k-window+1] = quantile_lerp(float(fenwick_kth(tree, lo)), float(fenwick_kth(tree, hi)), t)
+
+
+@nb.njit(nogil=True)
+def moving_quantile_1d(src, window, quant):
+    res = np.zeros((src.shape[0]-window+1,), dtype=src.dtype)
+    sliding_quantile_1d_into(src, window, quant, res)
     return res
 
 
-@nb.njit(nb.float64[:, :, :](nb.float64[:, :, :], nb.int64, nb.float64), parallel=True)
+@nb.njit([nb.void(nb.float64[:, :, :], nb.int64, nb.float64, nb.float64[:, :, :]),
+          nb.void(nb.float32[:, :, :], nb.int64, nb.float64, nb.float32[:, :, :])], parallel=True, nogil=True)
+def moving_quantile_3d_into(src, window, quant, out):
+    l, w, h = src.shape
+    for p in nb.prange(w*h):
+        i = p // h
+        j = p % h
+        res = np.empty(l-window+1, dtype=np.float64)
+        sliding_quantile_1d_into(src[:, i, j].astype(np.float64), window, quant, res)
+        out[:, i, j] = res
+
+
+@nb.njit([nb.void(nb.int64[:, :, :], nb.int64, nb.int64, nb.float64, nb.float64[:, :, :]),
+          nb.void(nb.int64[:, :, :], nb.int64, nb.int64, nb.float64, nb.float32[:, :, :])], parallel=True, nogil=True)
+def histogram_quantile_3d_into(src, bins, window, quant, out):
+    l, w, h = src.shape
+    for p in nb.prange(w*h):
+        i = p // h
+        j = p % h
+        res = np.empty(l-window+1, dtype=np.float64)
+        histogram_quantile_1d_into(src[:, i, j].copy(), bins, window, quant, res)
+        out[:, i, j] = res
+
+
+def moving_quantile_counts_into(src, window, quant, out):
+    '''
+    Fast path for integer photon counts. Returns False if src is not suitable.
+    '''
+    if src.dtype.kind not in "iu" or src.size == 0:
+        return False
+    vmin = int(src.min())
+    bins = int(src.max()) - vmin + 1
+    if bins > QUANTILE_HISTOGRAM_BINS:
+        return False
+    shifted = src.astype(np.int64) - vmin
+    histogram_quantile_3d_into(shifted, bins, window, quant, out)
+    out += vmin
+    return True
+
+
 def moving_quantile_3d(src, window, quant):
     l, w, h = src.shape
-    res = np.zeros((l-window+1, w, h))
-    for i in nb.prange(w):
-        for j in nb.prange(h):
-            res[:, i, j] = moving_quantile_1d(src[:, i, j], window, quant)
+    res = np.zeros((l-window+1, w, h), dtype=src.dtype)
+    moving_quantile_3d_into(src, window, quant, res)
     return res
 
 
-@nb.njit(nb.float64[:](nb.float64[:], nb.int64))
+@nb.njit(inline="always")
+def _finite_part(v, bad, delta):
+    '''
+    Counts non-finite v in bad (NaN, +inf, -inf counters) and returns part of v that goes to running sum.
+    Non-finite values never enter the sum, so it stays valid after they leave the window.
+    '''
+    if np.isfinite(v):
+        return v
+    if np.isnan(v):
+        bad[0] += delta
+    elif v > 0:
+        bad[1] += delta
+    else:
+        bad[2] += delta
+    return 0.0
+
+
+@nb.njit(inline="always")
+def _window_mean(s, bad, window):
+    # Same as np.mean of window with non-finite values
+    if bad[0] > 0 or (bad[1] > 0 and bad[2] > 0):
+        return np.nan
+    if bad[1] > 0:
+        return np.inf
+    if bad[2] > 0:
+        return -np.inf
+    return s/window
+
+
+@nb.njit([nb.float64[:](nb.float64[:], nb.int64),
+          nb.float32[:](nb.float32[:], nb.int64)])
 def moving_mean_1d(src, window):
     l_ = src.shape[0]
-    res = np.zeros((l_-window+1,))
-    for i in range(l_-window+1):
-        res[i] = np.mean(src[i:i+window])
+    res = np.zeros((l_-window+1,), dtype=src.dtype)
+    bad = np.zeros(3, dtype=np.int64)
+    s = 0.0
+    c = 0.0
+    for k in range(l_):
+        # Kahan summation: c keeps low order bits lost by s
+        y = _finite_part(src[k], bad, 1) - c
+        if k >= window:
+            y -= _finite_part(src[k-window], bad, -1)
+        t = s + y
+        c = (t - s) - y
+        s = t
+        if k >= window-1:
+            res[k-window+1] = _window_mean(s, bad, window)
     return res
 
 
-@nb.njit(nb.float64[:, :, :](nb.float64[:, :, :], nb.int64), parallel=True)
-def moving_mean_3d(src, window):
+@nb.njit([nb.void(nb.float64[:, :, :], nb.int64, nb.float64[:, :, :], nb.float64[:, :], nb.float64[:, :],
+                  nb.int64[:, :, :]),
+          nb.void(nb.float32[:, :, :], nb.int64, nb.float32[:, :, :], nb.float64[:, :], nb.float64[:, :],
+                  nb.int64[:, :, :])],
+         parallel=True, nogil=True)
+def running_mean_3d(src, window, out, sums, comps, bad):
+    '''
+    Moving mean with compensated running sum.
+    On exit sums and comps hold sum of finite values of the last window and its compensation,
+    bad holds counts of NaN, +inf and -inf in it.
+    '''
     l, w, h = src.shape
-    res = np.zeros((l-window+1, w, h))
     for i in nb.prange(w):
-        for j in nb.prange(h):
-            res[:, i, j] = moving_mean_1d(src[:, i, j], window)
+        for j in range(h):
+            sums[i, j] = 0.0
+            comps[i, j] = 0.0
+            bad[i, j, :] = 0
+        for k in range(l):
+            for j in range(h):
+                y = _finite_part(src[k, i, j], bad[i, j], 1) - comps[i, j]
+                if k >= window:
+                    y -= _finite_part(src[k-window, i, j], bad[i, j], -1)
+                t = sums[i, j] + y
+                comps[i, j] = (t - sums[i, j]) - y
+                sums[i, j] = t
+                if k >= window-1:
+                    out[k-window+1, i, j] = _window_mean(t, bad[i, j], window)
+
+
+@nb.njit([nb.void(nb.float64[:, :, :], nb.float64[:, :, :], nb.int64, nb.int64, nb.float64[:, :, :],
+                  nb.float64[:, :], nb.float64[:, :], nb.int64[:, :, :]),
+          nb.void(nb.float32[:, :, :], nb.float32[:, :, :], nb.int64, nb.int64, nb.float32[:, :, :],
+                  nb.float64[:, :], nb.float64[:, :], nb.int64[:, :, :])],
+         parallel=True, nogil=True)
+def advance_mean_3d(drop, add, window, skip, out, sums, comps, bad):
+    '''
+    Moves running sum forward by len(add) samples. Means after first skip steps are written to out.
+    '''
+    n, w, h = add.shape
+    for i in nb.prange(w):
+        for k in range(n):
+            for j in range(h):
+                y = (_finite_part(add[k, i, j], bad[i, j], 1) - _finite_part(drop[k, i, j], bad[i, j], -1)) - comps[i, j]
+                t = sums[i, j] + y
+                comps[i, j] = (t - sums[i, j]) - y
+                sums[i, j] = t
+                if k >= skip:
+                    out[k-skip, i, j] = _window_mean(t, bad[i, j], window)
+
+
+def moving_mean_3d_into(src, window, out):
+    w, h = src.shape[1:]
+    running_mean_3d(src, window, out, np.zeros((w, h)), np.zeros((w, h)), np.zeros((w, h, 3), dtype=np.int64))
+
+
+def moving_mean_3d(src, window):
+    l, w, h = src.shape
+    res = np.zeros((l-window+1, w, h), dtype=src.dtype)
+    moving_mean_3d_into(src, window, res)
     return res
 
 
+def dense_window_request(op, interesting_slices, out):
+    '''
+    Source range for request_into of moving window operation.
+    None if request must take general path (not dense 3D request or incompatible output).
+    '''
+    if not isinstance(interesting_slices, slice) or out.dtype.kind != "f" or out.ndim != 3:
+        return None
+    start, end, step = normalize_slice(op.shape()[0], interesting_slices)
+    if step != 1 or end <= start or out.shape[0] != end-start:
+        return None
+    return slice(start, end + op.window-1)
+
+
 class LazyMovingQuantile(LazyArrayOperation):
     def __init__(self, source: LazyArrayOperation, window: int, quantile=0.5):
         self.source = source
         self.window = window
         self.quantile = quantile
+        self.precision = get_compute_precision()
 
     def request_single(self, i: int):
+        if i < 0:
+            i += self.shape()[0]
         src_data = self.source.request_data(slice(i, i + self.window))
         return np.quantile(src_data, self.quantile, axis=0)
 
@@ -67,10 +310,41 @@ class LazyMovingQuantile(LazyArrayOperation):
         start, end, step = normalize_slice(l_, interesting_slice)
         src_end = end + self.window-1
         src_part = self.source.request_data(slice(start, src_end))
-        mm = moving_quantile_3d(src_part.astype(float), self.window, self.quantile)
+        if src_part.ndim == 3 and end > start:
+            mm = np.empty((end-start,)+src_part.shape[1:], dtype=self.dtype())
+            if not moving_quantile_counts_into(src_part, self.window, self.quantile, mm):
+                moving_quantile_3d_into(as_compute(src_part, self.precision).astype(mm.dtype, copy=False),
+                                        self.window, self.quantile, mm)
+        else:
+            mm = np.quantile(np.lib.stride_tricks.sliding_window_view(src_part, self.window, axis=0),
+                             self.quantile, axis=-1)
         res = mm[0:end - start:step]
         return res
 
+    def request_into(self, interesting_slices, out):
+        src_slice = dense_window_request(self, interesting_slices, out)
+        if src_slice is None:
+            return super().request_into(interesting_slices, out)
+        src_part = self.source.request_data(src_slice)
+        if moving_quantile_counts_into(src_part, self.window, self.quantile, out):
+            return out
+        src_part = as_compute(src_part, self.precision)
+        if src_part.dtype != out.dtype:
+            src_part = src_part.astype(out.dtype)
+        moving_quantile_3d_into(src_part, self.window, self.quantile, out)
+        return out
+
+    def dependencies(self, interesting_slices):
+        x0 = time_part(interesting_slices)
+        if isinstance(x0, int):
+            start = x0 + self.shape()[0] if x0 < 0 else x0
+            end = start+1
+        else:
+            start, end, step = normalize_slice(self.shape()[0], x0)
+        if end <= start:
+            return []
+        return [(self.source, slice(start, end + self.window-1))]
+
     def shape(self):
         src_shape = self.source.shape()
         l_ = src_shape[0]-self.window+1
@@ -78,27 +352,129 @@ class LazyMovingQuantile(LazyArrayOperation):
             raise ValueError("Sliding window size cannot be larger than array length")
         return (l_,)+src_shape[1:]
 
+    def dtype(self):
+        return compute_dtype(self.source.dtype(), self.precision)
+
+
+# Running sum is recomputed from scratch after advancing this many samples
+MEAN_STATE_RESYNC = 1 << 22
+
 
 class LazyMovingMean(LazyArrayOperation):
+    '''
+    Moving mean with running sums.
+    Running sum of the last requested frame is kept, so sequential requests read only samples
+    entering and leaving the window instead of whole window again.
+    '''
     def __init__(self, source: LazyArrayOperation, window: int):
         self.source = source
         self.window = window
+        self.precision = get_compute_precision()
+        self._state = None
+        self._lock = threading.Lock()
+
+    def _source_part(self, start, end, dtype):
+        src = as_compute(self.source.request_data(slice(start, end)), self.precision)
+        if src.dtype != dtype:
+            src = src.astype(dtype)
+        return src.reshape(src.shape[0], 1, -1) if src.ndim != 3 else src
+
+    def _stored_state(self, start, end):
+        '''
+        Stored running sum if continuing from it is cheaper than summing window again, None otherwise
+        '''
+        with self._lock:
+            state = self._state
+        if state is None:
+            return None
+        pos, sums, comps, bad, advanced = state
+        n = end-1-pos
+        # Continuing from stored sum reads 2*n source frames instead of end-start+window-1
+        if pos < start and 2*n < end-start+self.window-1 and advanced+n < MEAN_STATE_RESYNC:
+            return state
+        return None
+
+    def compute_into(self, start, end, out):
+        '''
+        Writes means of frames [start, end) into out (3D view).
+        '''
+        state = self._stored_state(start, end)
+        if state is not None:
+            pos, sums, comps, bad, advanced = state
+            drop = self._source_part(pos, end-1, out.dtype)
+            add = self._source_part(pos+self.window, end-1+self.window, out.dtype)
+            sums = sums.copy()
+            comps = comps.copy()
+            bad = bad.copy()
+            advance_mean_3d(drop, add, self.window, start-pos-1, out, sums, comps, bad)
+            with self._lock:
+                self._state = (end-1, sums, comps, bad, advanced+end-1-pos)
+            return out
+        src = self._source_part(start, end+self.window-1, out.dtype)
+        sums = np.zeros(src.shape[1:])
+        comps = np.zeros(src.shape[1:])
+        bad = np.zeros(src.shape[1:]+(3,), dtype=np.int64)
+        running_mean_3d(src, self.window, out, sums, comps, bad)
+        with self._lock:
+            self._state = (end-1, sums, comps, bad, 0)
+        return out
+
+    def _compute(self, start, end):
+        frame = self.shape()[1:]
+        res = np.empty((max(end-start, 0),)+frame, dtype=self.dtype())
+        if end > start:
+            self.compute_into(start, end, res.reshape(res.shape[0], 1, -1) if res.ndim != 3 else res)
+        return res
 
     def request_single(self, i: int):
-        src_data = self.source.request_data(slice(i, i + self.window))
-        return np.mean(src_data, axis=0)
+        if i < 0:
+            i += self.shape()[0]
+        return self._compute(i, i+1)[0]
 
     def request_slice(self, interesting_slice):
-        shape = self.shape()
-        # print("MM source shape", shape)
-        l_ = shape[0]
-        start, end, step = normalize_slice(l_, interesting_slice)
-        src_end = end + self.window-1
-        src_part = self.source.request_data(slice(start, src_end))
-        mm = moving_mean_3d(src_part.astype(float), self.window)
-        res = mm[0:end - start:step]
+        start, end, step = normalize_slice(self.shape()[0], interesting_slice)
+        return self._compute(start, end)[::step]
+
+    def request_into(self, interesting_slices, out):
+        src_slice = dense_window_request(self, interesting_slices, out)
+        if src_slice is None or out.dtype != self.dtype():
+            return super().request_into(interesting_slices, out)
+        self.compute_into(src_slice.start, src_slice.stop-self.window+1, out)
+        return out
+
+    def with_operands(self, replace):
+        res = super().with_operands(replace)
+        if res is not self:
+            res._state = None
+            res._lock = threading.Lock()
         return res
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_state"] = None
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def dependencies(self, interesting_slices):
+        x0 = time_part(interesting_slices)
+        if isinstance(x0, int):
+            start = x0 + self.shape()[0] if x0 < 0 else x0
+            end = start+1
+        else:
+            start, end, step = normalize_slice(self.shape()[0], x0)
+        if end <= start:
+            return []
+        state = self._stored_state(start, end)
+        if state is not None:
+            # Same reads as compute_into does when continuing from stored sum
+            pos = state[0]
+            return [(self.source, slice(pos, end-1)), (self.source, slice(pos+self.window, end-1+self.window))]
+        return [(self.source, slice(start, end + self.window-1))]
+
     def shape(self):
         src_shape = self.source.shape()
         l_ = src_shape[0]-self.window+1
@@ -106,6 +482,9 @@ class LazyMovingMean(LazyArrayOperation):
             raise ValueError("Sliding window size cannot be larger than array length")
         return (l_,)+src_shape[1:]
 
+    def dtype(self):
+        return compute_dtype(self.source.dtype(), self.precision)
+
 
 class LazyAbs(LazyArrayOperation):
     def __init__(self, source: LazyArrayOperation):
@@ -114,6 +493,17 @@ class LazyAbs(LazyArrayOperation):
     def request_data(self, interesting_slices):
         return np.abs(self.source.request_data(interesting_slices))
 
+    def request_into(self, interesting_slices, out):
+        self.source.request_into(interesting_slices, out)
+        np.abs(out, out=out)
+        return out
+
+    def dependencies(self, interesting_slices):
+        return [(self.source, interesting_slices)]
+
+    def fuse(self, fuser):
+        return f"abs({fuser.operand(self.source)})"
+
     def shape(self):
         return self.source.shape()
 
@@ -211,9 +601,144 @@ class MovingMedianNode(Node):
 
         return dict(detail=detail, background=moving_median)
 
+class CacheNode(Node):
+    INPUTS = {
+        "signal": SIGNAL,
+    }
+    CONSTANTS = {
+        "chunk_size": AllowExternal(1024),
+        "max_megabytes": AllowExternal(256),
+    }
+    OUTPUTS = {
+        "signal": SIGNAL
+    }
+    REPR_LABEL = "Cache"
+    LOCATION = "/Signal processing/Cache"
+
+    @classmethod
+    def on_constants_update(cls,graphnode):
+        mb = graphnode.get_constant("max_megabytes")
+        graphnode.set_title(cls.REPR_LABEL + f" ({mb} MB)")
+
+    def calculate(self, globalspace: dict) -> dict:
+        signal: Signal = self.require("signal")
+        chunk_size = self.constants["chunk_size"]
+        max_bytes = int(self.constants["max_megabytes"]*1024**2)
+        cached = signal.clone()
+        cached.space = CachedLazyArray(signal.space, chunk_size, max_bytes)
+        if signal.trigger is not None:
+            cached.trigger = CachedLazyArray(signal.trigger, chunk_size, max_bytes)
+        return dict(signal=cached)
+
+
 SIGMA_TO_MAD_COEFF = 0.6744897501960818
 
 
+@nb.njit(nogil=True)
+def mad_normalize_1d(src, window, median_window, coeff, n):
+    if median_window > 0:
+        medians = np.empty(src.shape[0]-median_window+1, dtype=np.float64)
+        sliding_quantile_1d_into(src, median_window, 0.5, medians)
+        series = src[median_window//2:median_window//2+medians.shape[0]] - medians
+    else:
+        series = src
+    mads = np.empty(n, dtype=np.float64)
+    sliding_quantile_1d_into(np.abs(series), window, 0.5, mads)
+    res = np.zeros(n, dtype=np.float64)
+    offset = window//2
+    for k in range(n):
+        if mads[k] != 0:
+            res[k] = coeff*series[k+offset]/mads[k]
+    return res
+
+
+@nb.njit([nb.void(nb.float64[:, :, :], nb.int64, nb.int64, nb.float64, nb.float64[:, :, :]),
+          nb.void(nb.float32[:, :, :], nb.int64, nb.int64, nb.float64, nb.float32[:, :, :])], parallel=True, nogil=True)
+def mad_normalize_3d_into(src, window, median_window, coeff, out):
+    '''
+    out = coeff*x/median(|x|) over moving window, 0 where median is 0.
+    If median_window is positive x is src with its moving median subtracted first.
+    '''
+    l, w, h = src.shape
+    n = out.shape[0]
+    for p in nb.prange(w*h):
+        i = p // h
+        j = p % h
+        out[:, i, j] = mad_normalize_1d(src[:, i, j].astype(np.float64), window, median_window, coeff, n)
+
+
+class LazyMovingMADNormalize(LazyArrayOperation):
+    '''
+    coeff*x[offset:]/moving_median(|x|) in one pass over source window.
+    With median_window > 0 moving median of that window is subtracted from source beforehand.
+    Output frame k corresponds to source frame k plus half of every window.
+    '''
+    def __init__(self, source: LazyArrayOperation, window: int, coeff=1.0, median_window=0):
+        self.source = source
+        self.window = window
+        self.coeff = coeff
+        self.median_window = median_window
+        self.precision = get_compute_precision()
+
+    @property
+    def halo(self):
+        res = self.window-1
+        if self.median_window > 0:
+            res += self.median_window-1
+        return res
+
+    def _compute(self, start, end, out):
+        src = as_compute(self.source.request_data(slice(start, end+self.halo)), self.precision)
+        if src.dtype != out.dtype:
+            src = src.astype(out.dtype)
+        if src.ndim != 3:
+            src = src.reshape(src.shape[0], 1, -1)
+            out = out.reshape(out.shape[0], 1, -1)
+        mad_normalize_3d_into(src, self.window, self.median_window, self.coeff, out)
+
+    def request_single(self, i: int):
+        if i < 0:
+            i += self.shape()[0]
+        return self.request_slice(slice(i, i+1))[0]
+
+    def request_slice(self, interesting_slice):
+        start, end, step = normalize_slice(self.shape()[0], interesting_slice)
+        res = np.zeros((max(end-start, 0),)+self.shape()[1:], dtype=self.dtype())
+        if end > start:
+            self._compute(start, end, res)
+        return res[::step]
+
+    def request_into(self, interesting_slices, out):
+        if not isinstance(interesting_slices, slice) or out.dtype not in (np.float32, np.float64) or out.ndim != 3:
+            return super().request_into(interesting_slices, out)
+        start, end, step = normalize_slice(self.shape()[0], interesting_slices)
+        if step != 1 or end <= start or out.shape[0] != end-start:
+            return super().request_into(interesting_slices, out)
+        self._compute(start, end, out)
+        return out
+
+    def dependencies(self, interesting_slices):
+        x0 = time_part(interesting_slices)
+        if isinstance(x0, int):
+            start = x0 + self.shape()[0] if x0 < 0 else x0
+            end = start+1
+        else:
+            start, end, step = normalize_slice(self.shape()[0], x0)
+        if end <= start:
+            return []
+        return [(self.source, slice(start, end+self.halo))]
+
+    def shape(self):
+        src_shape = self.source.shape()
+        l_ = src_shape[0]-self.halo
+        if l_ <= 0:
+            raise ValueError("Sliding window size cannot be larger than array length")
+        return (l_,)+src_shape[1:]
+
+    def dtype(self):
+        return compute_dtype(self.source.dtype(), self.precision)
+
+
 class MovingMADNormalizeNode(Node):
     INPUTS = {
         "source": SIGNAL,
@@ -222,7 +747,8 @@ class MovingMADNormalizeNode(Node):
 
     CONSTANTS = {
         "window": AllowExternal(10),
-        "gauss_mode":True
+        "gauss_mode":True,
+        "subtract_median":False
     }
 
     OUTPUTS = {
@@ -245,18 +771,21 @@ class MovingMADNormalizeNode(Node):
         window = self.constants["window"]
         offset = window // 2
         back_cut = window - offset
-        absed = LazyAbs(source_space)
-        moving_median_space = LazyMovingQuantile(absed, window)
+        median_window = 0
+        if self.constants["subtract_median"]:
+            # Moving median of the same window is subtracted first
+            median_window = window
+            offset += window // 2
+            back_cut += window - window // 2 - 1
 
         time_ = source_time[offset:-back_cut+1]
         trigger_ = source.get_trigger()[offset:-back_cut+1]
 
-        cutoff = source_space[offset:-back_cut + 1]
         if self.constants["gauss_mode"]:
             coeff = SIGMA_TO_MAD_COEFF
         else:
             coeff = 1.0
-        norm_space = coeff * cutoff/moving_median_space
+        norm_space = LazyMovingMADNormalize(source_space, window, coeff, median_window)
         norm = Signal(norm_space,time_,trigger_)
         return dict(normalized=norm)
 
@@ -266,16 +795,16 @@ class LazyFlashSuppressor(LazyArrayOperation):
 
     def request_single(self,i:int):
         raw = self.source.request_data(i)
-        corr = np.median(raw)
+        corr = single_frame(frame_median, raw)
         return raw - corr
 
     def request_slice(self,s:slice):
         raw = self.source.request_data(s)
-        full_dim = len(self.shape())
-        axes = list(range(1, full_dim))
-        flashes = np.median(raw, axis=tuple(axes))
-        flashes = np.expand_dims(flashes, axis=(1, 2))
-        return raw-flashes
+        flashes = frame_median(raw)
+        return raw-flashes.reshape((-1,)+(1,)*(raw.ndim-1))
+
+    def dependencies(self, interesting_slices):
+        return [(self.source, time_part(interesting_slices))]
 
     def shape(self):
         return self.source.shape()
@@ -320,6 +849,14 @@ class LazyMinSuppressor(LazyArrayOperation):
         raw = self.source.request_data(interesting_slices)
         return np.where(raw > self.thresh, raw,0)
 
+    def dependencies(self, interesting_slices):
+        return [(self.source, interesting_slices)]
+
+    def fuse(self, fuser):
+        if not fuser.is_scalar(self.thresh):
+            return None
+        return f"suppress_below({fuser.operand(self.source)}, {fuser.scalar(self.thresh)})"
+
     def shape(self):
         return self.source.shape()
 
@@ -406,6 +943,19 @@ class LazyTimeSubtractor(LazyArrayOperation):
         x = self.src.request_data(interesting_slices)
         return x-self.value
 
+    def request_into(self, interesting_slices, out):
+        self.src.request_into(interesting_slices, out)
+        np.subtract(out, self.value, out=out, casting="unsafe")
+        return out
+
+    def dependencies(self, interesting_slices):
+        return [(self.src, interesting_slices)]
+
+    def fuse(self, fuser):
+        if not fuser.is_scalar(self.value):
+            return None
+        return f"{fuser.operand(self.src)} - {fuser.scalar(self.value)}"
+
 
 class LazyTimeMultiplier(LazyArrayOperation):
     def __init__(self, src:LazyArrayOperation, value:float):
@@ -419,6 +969,19 @@ class LazyTimeMultiplier(LazyArrayOperation):
         x = self.src.request_data(interesting_slices)
         return x*self.value
 
+    def request_into(self, interesting_slices, out):
+        self.src.request_into(interesting_slices, out)
+        np.multiply(out, self.value, out=out, casting="unsafe")
+        return out
+
+    def dependencies(self, interesting_slices):
+        return [(self.src, interesting_slices)]
+
+    def fuse(self, fuser):
+        if not fuser.is_scalar(self.value):
+            return None
+        return f"{fuser.operand(self.src)} * {fuser.scalar(self.value)}"
+
 
 class TimeSubtractorNode(Node):
     INPUTS = {
@@ -458,24 +1021,129 @@ class TimeMultiplierNode(Node):
         return dict(signal=s1)
 
 
-@nb.njit(nb.float64[:,:](nb.float64[:,:],nb.int64,nb.int64))
+@nb.njit(nogil=True)
+def frame_ranks(a):
+    '''
+    Ranks of frame values (NaN are last) and values in sorted order
+    '''
+    flat = a.ravel()
+    order = np.argsort(flat, kind="mergesort")
+    ranks = np.empty(flat.shape[0], dtype=np.int64)
+    for k in range(flat.shape[0]):
+        ranks[order[k]] = k
+    return ranks.reshape(a.shape), flat[order]
+
+
+@nb.njit(nogil=True)
+def _median_conv_update(a, ranks, tree, i_start, i_end, j, value):
+    nans = 0
+    for i in range(i_start, i_end):
+        if np.isnan(a[i, j]):
+            nans += value
+        else:
+            fenwick_add(tree, ranks[i, j], value)
+    return nans
+
+
+@nb.njit(nogil=True)
+def median_conv_rows(a, ranks, values, span_x, span_y, row_start, row_end, res):
+    '''
+    Median filter for rows [row_start, row_end) of frame a.
+    Neighbourhood of (i, j) is [i-span_x, i+span_x) x [j-span_y, j+span_y) clipped by frame.
+    Neighbourhood slides along row; values are kept in Fenwick tree over ranks.
+    '''
+    w, h = a.shape
+    tree = np.zeros(w*h+1, dtype=np.int64)
+    for i in range(row_start, row_end):
+        i_start = max(i-span_x, 0)
+        i_end = min(i+span_x, w)
+        nans = 0
+        col_start = 0
+        col_end = 0
+        for j in range(h):
+            j_start = max(j-span_y, 0)
+            j_end = min(j+span_y, h)
+            while col_end < j_end:
+                nans += _median_conv_update(a, ranks, tree, i_start, i_end, col_end, 1)
+                col_end += 1
+            while col_start < j_start:
+                nans += _median_conv_update(a, ranks, tree, i_start, i_end, col_start, -1)
+                col_start += 1
+            count = max(i_end-i_start, 0)*max(j_end-j_start, 0)
+            if nans > 0 or count == 0:
+                res[i, j] = np.nan
+            elif count % 2 == 1:
+                res[i, j] = values[fenwick_kth(tree, count//2)]
+            else:
+                res[i, j] = (values[fenwick_kth(tree, count//2-1)]+values[fenwick_kth(tree, count//2)])/2
+        while col_start < col_end:
+            _median_conv_update(a, ranks, tree, i_start, i_end, col_start, -1)
+            col_start += 1
+
+
+# Neighbourhoods not larger than this are sorted directly
+MEDIAN_CONV_DIRECT = 16
+
+
+@nb.njit(nogil=True)
+def median_conv_rows_direct(a, span_x, span_y, row_start, row_end, res):
+    '''
+    Same as median_conv_rows for small neighbourhoods
+    '''
+    w, h = a.shape
+    buffer = np.empty(max(4*span_x*span_y, 1), dtype=np.float64)
+    for i in range(row_start, row_end):
+        i_start = max(i-span_x, 0)
+        i_end = min(i+span_x, w)
+        for j in range(h):
+            j_start = max(j-span_y, 0)
+            j_end = min(j+span_y, h)
+            count = 0
+            nans = False
+            for k in range(i_start, i_end):
+                for m in range(j_start, j_end):
+                    v = a[k, m]
+                    nans = nans or np.isnan(v)
+                    # Insertion sort
+                    p = count
+                    while p > 0 and buffer[p-1] > v:
+                        buffer[p] = buffer[p-1]
+                        p -= 1
+                    buffer[p] = v
+                    count += 1
+            if nans or count == 0:
+                res[i, j] = np.nan
+            elif count % 2 == 1:
+                res[i, j] = buffer[count//2]
+            else:
+                res[i, j] = (buffer[count//2-1]+buffer[count//2])/2
+
+
+@nb.njit(nogil=True)
+def median_conv_frame(a, span_x, span_y, row_start, row_end, res):
+    if 4*span_x*span_y <= MEDIAN_CONV_DIRECT:
+        median_conv_rows_direct(a, span_x, span_y, row_start, row_end, res)
+    else:
+        ranks, values = frame_ranks(a)
+        median_conv_rows(a, ranks, values, span_x, span_y, row_start, row_end, res)
+
+
+@nb.njit(nb.float64[:,:](nb.float64[:,:],nb.int64,nb.int64), parallel=True, nogil=True)
 def conv_median(a,span_x, span_y):
     res = np.zeros(a.shape)
-    for i in range(a.shape[0]):
-        i_start = max(i-span_x,0)
-        i_end = min(i+span_x,a.shape[0])
-        for j in range(a.shape[1]):
-            j_start = max(j-span_y,0)
-            j_end = min(j+span_y,a.shape[1])
-            res[i,j] = np.median(a[i_start:i_end,j_start:j_end])
+    w = a.shape[0]
+    # Single frame: rows are split between threads
+    block = max(1, -(-w//nb.get_num_threads()))
+    for b in nb.prange(-(-w//block)):
+        median_conv_frame(a, span_x, span_y, b*block, min(b*block+block, w), res)
     return res
 
 
-@nb.njit(nb.float64[:,:,:](nb.float64[:,:,:],nb.int64,nb.int64),parallel=True)
+@nb.njit(nb.float64[:,:,:](nb.float64[:,:,:],nb.int64,nb.int64),parallel=True, nogil=True)
 def conv_median_t(a,span_x, span_y):
     res = np.zeros(a.shape)
     for i in nb.prange(a.shape[0]):
-        res[i] = conv_median(a[i],span_x,span_y)
+        median_conv_frame(a[i], span_x, span_y, 0, a.shape[1], res[i])
     return res
 
 
@@ -490,11 +1158,15 @@ class LazyMedianConv(LazyArrayOperation):
 
     def request_single(self,i:int):
         src_i = self.src.request_data(i)
-        return conv_median(src_i,self.span_x, self.span_y)
+        return conv_median(np.asarray(src_i, dtype=np.float64), self.span_x, self.span_y)
 
     def request_slice(self,s:slice):
+        # Steps are passed to source, skipped frames are neither read nor filtered
         src_s = self.src.request_data(s)
-        return conv_median_t(src_s,self.span_x, self.span_y)
+        return conv_median_t(np.asarray(src_s, dtype=np.float64), self.span_x, self.span_y)
+
+    def dependencies(self, interesting_slices):
+        return [(self.src, time_part(interesting_slices))]
 
 class MedianConvNode(Node):
     INPUTS = {
@@ -2,7 +2,6 @@ import sys
 from datetime import datetime
 from datetime import timedelta
 
-import numba as nb
 import numpy as np
 import psutil
 from padamo.node_processing import Node, FLOAT, INTEGER, STRING, SIGNAL, AllowExternal
@@ -10,6 +9,8 @@ from padamo.lazy_array_operations import LazyArrayOperation
 from padamo.lazy_array_operations.base import normalize_slice
 from padamo.lazy_array_operations.base import AutoRequest
 from padamo.utilities.dual_signal import Signal
+from padamo.utilities.frame_reductions import frame_sum, frame_any_above, frame_median, single_frame
+from padamo.utilities.dilation import window_any
 from .disabled_node_arrays import DummyArray
 
 class LazyLCThresholdTrigger(LazyArrayOperation):
@@ -23,18 +24,11 @@ class LazyLCThresholdTrigger(LazyArrayOperation):
 
     def request_single(self,i:int):
         frame = self.source.request_data(i)
-        return np.sum(frame)>self.threshold
+        return single_frame(frame_sum, frame)>self.threshold
 
     def request_slice(self, s: slice):
         frames = self.source.request_data(s)
-        #mask = frames > self.threshold
-        #print(mask)
-        srclen = len(self.source.shape())
-        srcrange = range(1,srclen)
-        axes = tuple(srcrange)
-        res = np.sum(frames, axis=axes)>self.threshold
-        #print(res)
-        return res
+        return frame_sum(frames)>self.threshold
 
 
 class LazyThresholdTrigger(LazyArrayOperation):
@@ -48,27 +42,17 @@ class LazyThresholdTrigger(LazyArrayOperation):
 
     def request_single(self,i:int):
         frame = self.source.request_data(i)
-        return (frame>self.threshold).any()
+        return single_frame(frame_any_above, frame, self.threshold)
 
     def request_slice(self, s: slice):
         frames = self.source.request_data(s)
-        mask = frames > self.threshold
-        #print(mask)
-        srclen = len(self.source.shape())
-        srcrange = range(1,srclen)
-        axes = tuple(srcrange)
-        res = np.logical_or.reduce(mask, axis=axes)
-        #print(res)
-        return res
-
-@nb.njit
+        return frame_any_above(frames, self.threshold)
+
 def deconvolve(x, window):
+    # res[k] = x[k-window+1:k+1].any()
     length = x.shape[0]+(window-1)
     res = np.full(shape=(length,), fill_value=False)
-    for i in range(x.shape[0]):
-        for j in range(window):
-            res[i+j] |= x[i]
-    return res
+    return window_any(x, window-1, window, False, res)
 
 
 class LazyMedianThresholdTrigger(LazyArrayOperation):
@@ -82,12 +66,11 @@ class LazyMedianThresholdTrigger(LazyArrayOperation):
 
     def request_single(self,i:int):
         frame = self.source.request_data(i)
-        med = np.median(frame)
-        return med>self.threshold
+        return single_frame(frame_median, frame)>self.threshold
 
     def request_slice(self, s: slice):
         frames = self.source.request_data(s)
-        return np.median(frames,axis=(1,2)) > self.threshold
+        return frame_median(frames) > self.threshold
 
 
 class TresholdTriggerNode(Node):
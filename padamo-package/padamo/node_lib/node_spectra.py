@@ -1,7 +1,9 @@
-from padamo.node_processing import Node, FLOAT, INTEGER, SIGNAL, PLOT, AllowExternal
+from padamo.node_processing import Node, FLOAT, INTEGER, SIGNAL, PLOT, AllowExternal, NodeExecutionError
 
 from padamo.utilities.plot import LazyPlotter
 from padamo.utilities.spectra import DualButterworthBandFilter, ButterworthFilter, LazyFilter, HardLowPassFilter, HardBandPassFilter
+from padamo.utilities.spectra import LazyFilterBank, LazyIIRFilter
+from scipy.signal import butter
 from padamo.utilities.spectra import LazyFilterPlotter
 from padamo.utilities.dual_signal import Signal
 from padamo.node_processing import PortType
@@ -140,6 +142,96 @@ class FreqFilterNode(Node):
         return dict(filtered=Signal(filtered_spatial, filtered_temporal))
 
 
+class FilterBankNode(Node):
+    INPUTS = {
+        "signal":SIGNAL,
+        "window":INTEGER,
+        "filter_0":FILTER,
+        "filter_1":FILTER
+    }
+    CONSTANTS = {
+        "bands": 2,
+        "block": False
+    }
+    OUTPUTS = {
+        "stacked":SIGNAL,
+        "filtered_0":SIGNAL,
+        "filtered_1":SIGNAL
+    }
+
+    REPR_LABEL = "Filter bank"
+    LOCATION = "/Spectral Filters/Filter bank"
+
+    @classmethod
+    def on_constants_update(cls,graphnode):
+        bands = max(graphnode.get_constant("bands"), 1)
+        for i in range(bands):
+            graphnode.add_input(FILTER, f"filter_{i}")
+            graphnode.add_output(SIGNAL, f"filtered_{i}")
+        for name in graphnode.get_inputs():
+            if name.startswith("filter_") and int(name[7:]) >= bands:
+                graphnode.remove_input(name)
+        for name in graphnode.get_outputs():
+            if name.startswith("filtered_") and int(name[9:]) >= bands:
+                graphnode.remove_output(name)
+        graphnode.set_title(cls.REPR_LABEL + f" ({bands})")
+
+    def calculate(self, globalspace:dict) ->dict:
+        signal = self.require("signal")
+        window = self.require("window")
+        bands = max(self.constants["bands"], 1)
+        filters = [self.require(f"filter_{i}") for i in range(bands)]
+        if self.constants["block"]:
+            filters = [~filter_ for filter_ in filters]
+        bank = LazyFilterBank(signal, filters, window)
+        length = signal.time.shape()[0]
+        filtered_temporal = signal.time[window//2: length-window+window//2+1]
+        res = dict(stacked=Signal(bank, filtered_temporal))
+        for i in range(bands):
+            res[f"filtered_{i}"] = Signal(bank[:, i], filtered_temporal)
+        return res
+
+
+class IIRButterworthNode(Node):
+    INPUTS = {
+        "signal":SIGNAL
+    }
+    CONSTANTS = {
+        "mode": "lowpass",
+        "frequency": AllowExternal(1.0),
+        "band_width": AllowExternal(0.0),
+        "order": AllowExternal(2),
+        "checkpoint_interval": 65536
+    }
+    OUTPUTS = {
+        "filtered":SIGNAL
+    }
+
+    REPR_LABEL = "IIR Butterworth filter"
+    LOCATION = "/Spectral Filters/IIR Butterworth filter"
+
+    MODES = ("lowpass", "highpass", "bandpass", "bandstop")
+
+    @classmethod
+    def on_constants_update(cls,graphnode):
+        mode = graphnode.get_constant("mode")
+        graphnode.set_title(cls.REPR_LABEL + f" ({mode})")
+
+    def calculate(self, globalspace:dict) ->dict:
+        signal = self.require("signal")
+        mode = self.constants["mode"]
+        if mode not in self.MODES:
+            raise NodeExecutionError(f"Unknown filter mode {mode}. Possible values: {', '.join(self.MODES)}", self)
+        frequency = self.constants["frequency"]
+        if mode in ("bandpass", "bandstop"):
+            band_width = self.constants["band_width"]
+            frequency = [frequency-band_width/2, frequency+band_width/2]
+        time_ = signal.time.request_data(slice(0, 2))
+        sos = butter(self.constants["order"], frequency, btype=mode, fs=1/(time_[1]-time_[0]), output="sos")
+        filtered = LazyIIRFilter(signal.space, sos, self.constants["checkpoint_interval"])
+        return dict(filtered=Signal(filtered, signal.time, signal.trigger))
+
+
 class FilterCurve(Node):
     INPUTS = {
         "filter":FILTER
@@ -0,0 +1,51 @@
+import unittest
+import numpy as np
+from padamo.lazy_array_operations.basic_operations import ConstantArray
+from .node_simple_triggers import LazyLCThresholdTrigger, LazyThresholdTrigger, LazyMedianThresholdTrigger
+from .node_signal_manipulation import LazyTriggerMarginalize
+from .node_signal_processing import LazyFlashSuppressor
+from .disabled_node_triggering import LazyLC
+
+
+class TestFrameReductionCallers(unittest.TestCase):
+    REQUESTS = [slice(None), slice(10, 30), slice(5, 40, 3), 0, 17, -1]
+
+    def setUp(self):
+        rng = np.random.default_rng(6)
+        self.x = rng.normal(0.0, 1.0, (60, 5, 6))
+        self.src = ConstantArray(self.x)
+        self.pixelmap = rng.random((5, 6)) > 0.3
+
+    def check(self, op, expected):
+        self.assertEqual(op.shape(), expected.shape)
+        for request in self.REQUESTS:
+            np.testing.assert_allclose(op.request_data(request), expected[request], err_msg=str(request))
+
+    def test_threshold_triggers(self):
+        # Former per-frame numpy reductions
+        self.check(LazyLCThresholdTrigger(self.src, 1.0), np.sum(self.x, axis=(1, 2)) > 1.0)
+        self.check(LazyThresholdTrigger(self.src, 2.5), np.logical_or.reduce(self.x > 2.5, axis=(1, 2)))
+        self.check(LazyMedianThresholdTrigger(self.src, 0.1), np.median(self.x, axis=(1, 2)) > 0.1)
+
+    def test_marginalize(self):
+        mask = self.x > 2.0
+        self.check(LazyTriggerMarginalize(ConstantArray(mask)), np.logical_or.reduce(mask, axis=(1, 2)))
+
+    def test_flash_suppressor(self):
+        expected = self.x-np.median(self.x, axis=(1, 2)).reshape(-1, 1, 1)
+        self.check(LazyFlashSuppressor(self.src), expected)
+
+    def test_lightcurve(self):
+        for maxmode, func in ((False, np.sum), (True, np.max)):
+            # Former LazyLC zeroed pixels outside of map and reduced every frame
+            self.check(LazyLC(self.src, maxmode), func(self.x, axis=(1, 2)))
+            masked = np.where(self.pixelmap, self.x, 0)
+            self.check(LazyLC(self.src, maxmode, ConstantArray(self.pixelmap)), func(masked, axis=(1, 2)))
+        # All pixels outside of map are below zero
+        negative = -np.abs(self.x)
+        lc = LazyLC(ConstantArray(negative), True, ConstantArray(self.pixelmap))
+        np.testing.assert_array_equal(lc.request_all_data(), np.max(np.where(self.pixelmap, negative, 0), axis=(1, 2)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+import numpy as np
+from scipy.special import lambertw
+from padamo.lazy_array_operations.basic_operations import ConstantArray
+from .node_physical_ff import lambert_w0, lambert_w0_lookup, lambert_w0_table, LazyFFPhysicalSignal, INV_E
+
+
+class TestLambertW(unittest.TestCase):
+    def setUp(self):
+        self.table = lambert_w0_table()
+
+    def check(self, xs, tolerance):
+        ref = lambertw(xs).real
+        direct = np.array([lambert_w0(x) for x in xs])
+        lookup = np.array([lambert_w0_lookup(x, self.table) for x in xs])
+        np.testing.assert_allclose(direct, ref, rtol=tolerance, atol=tolerance)
+        np.testing.assert_allclose(lookup, ref, rtol=tolerance, atol=tolerance)
+
+    def test_negative(self):
+        self.check(np.linspace(-INV_E, 0.0, 20001)[1:], 1e-12)
+
+    def test_branch_point(self):
+        # Rounding of argument near -1/e is amplified as its square root
+        self.check(-INV_E+np.logspace(-15, -3, 200), 1e-8)
+
+    def test_positive(self):
+        self.check(np.logspace(-10, 6, 1000), 1e-12)
+
+    def test_below_branch_point(self):
+        self.assertEqual(lambert_w0(-0.5), -1.0)
+        self.assertEqual(lambert_w0_lookup(-0.5, self.table), -1.0)
+
+
+class TestPhysicalFlatFielding(unittest.TestCase):
+    def test_table(self):
+        rng = np.random.default_rng(4)
+        counts = rng.poisson(20.0, (50, 3, 4)).astype(float)
+        tau = ConstantArray(rng.uniform(5.0, 15.0, (3, 4)))
+        eff = rng.uniform(0.5, 1.0, (3, 4))
+        eff[0, 0] = 0.0
+        eff = ConstantArray(eff)
+        dt, cr_to_int, nts = 2500, 1.0, 400.0
+        direct = LazyFFPhysicalSignal(ConstantArray(counts), eff, tau, dt, cr_to_int, nts)
+        table = LazyFFPhysicalSignal(ConstantArray(counts), eff, tau, dt, cr_to_int, nts, use_table=True)
+        b = tau.request_all_data()*eff.request_all_data()/dt
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ref = -cr_to_int*nts*lambertw(-b*counts/nts/eff.request_all_data()).real/b
+        ref[:, 0, 0] = 0.0
+        np.testing.assert_allclose(direct.request_all_data(), ref, rtol=1e-12)
+        np.testing.assert_allclose(table.request_all_data(), ref, rtol=1e-12)
+        np.testing.assert_allclose(table.request_data(-1), ref[-1], rtol=1e-12)
@@ -0,0 +1,186 @@
+import unittest
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from padamo.lazy_array_operations.basic_operations import ConstantArray
+from .node_signal_processing import moving_mean_1d, moving_quantile_1d, LazyMovingMean, LazyMovingMADNormalize, \
+    LazyMovingQuantile, LazyMedianConv, conv_median, conv_median_t
+
+
+def reference_mean(x, window):
+    return np.mean(sliding_window_view(x, window, axis=0), axis=-1)
+
+
+def reference_quantile(x, window, q):
+    return np.quantile(sliding_window_view(x, window, axis=0), q, axis=-1)
+
+
+def reference_mad_normalize(x, window, coeff, median_window):
+    if median_window > 0:
+        medians = np.median(sliding_window_view(x, median_window, axis=0), axis=-1)
+        x = x[median_window//2:median_window//2+medians.shape[0]]-medians
+    mads = np.median(sliding_window_view(np.abs(x), window, axis=0), axis=-1)
+    series = x[window//2:window//2+mads.shape[0]]
+    return np.where(mads != 0, coeff*series/np.where(mads != 0, mads, 1), 0.0)
+
+
+def reference_conv_median(a, span_x, span_y):
+    # Former conv_median: np.median of [i-span_x, i+span_x) x [j-span_y, j+span_y) clipped by frame
+    res = np.zeros(a.shape)
+    for i in range(a.shape[0]):
+        i_start = max(i-span_x, 0)
+        i_end = min(i+span_x, a.shape[0])
+        for j in range(a.shape[1]):
+            j_start = max(j-span_y, 0)
+            j_end = min(j+span_y, a.shape[1])
+            res[i, j] = np.median(a[i_start:i_end, j_start:j_end])
+    return res
+
+
+class TestMedianConv(unittest.TestCase):
+    # Small spans are sorted directly, larger ones go through Fenwick tree
+    SPANS = [(1, 1), (2, 2), (1, 3), (3, 2), (4, 4), (8, 8)]
+
+    def setUp(self):
+        rng = np.random.default_rng(4)
+        self.x = rng.normal(0.0, 1.0, (6, 9, 7))
+        # Ties
+        self.ties = rng.integers(0, 4, (6, 9, 7)).astype(np.float64)
+
+    def reference(self, x, span_x, span_y):
+        return np.stack([reference_conv_median(frame, span_x, span_y) for frame in x])
+
+    def test_kernels(self):
+        for x in (self.x, self.ties):
+            for span_x, span_y in self.SPANS:
+                ref = self.reference(x, span_x, span_y)
+                np.testing.assert_array_equal(conv_median_t(x, span_x, span_y), ref, err_msg=f"{span_x}, {span_y}")
+                np.testing.assert_array_equal(conv_median(x[2], span_x, span_y), ref[2],
+                                              err_msg=f"{span_x}, {span_y}")
+
+    def test_nan(self):
+        x = self.x.copy()
+        x[1, 4, 3] = np.nan
+        x[3, 0, 0] = np.nan
+        for span_x, span_y in self.SPANS:
+            with np.errstate(invalid="ignore"):
+                ref = self.reference(x, span_x, span_y)
+            np.testing.assert_array_equal(conv_median_t(x, span_x, span_y), ref, err_msg=f"{span_x}, {span_y}")
+
+    def test_lazy(self):
+        for span_x, span_y in ((1, 1), (3, 2)):
+            op = LazyMedianConv(ConstantArray(self.ties), span_x, span_y)
+            ref = self.reference(self.ties, span_x, span_y)
+            np.testing.assert_array_equal(op.request_all_data(), ref)
+            np.testing.assert_array_equal(op.request_data(slice(1, 6, 2)), ref[1:6:2])
+            np.testing.assert_array_equal(op.request_data(3), ref[3])
+            np.testing.assert_array_equal(op.request_data(-1), ref[-1])
+
+
+class TestMovingQuantile(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.x = rng.normal(5.0, 2.0, (400, 3, 4))
+        # Ties must be ordered the same way as by np.quantile
+        self.x[100:150, 1, 1] = 5.0
+        self.counts = rng.poisson(4.0, (400, 3, 4))
+
+    def test_1d(self):
+        x = self.x[:, 1, 1].copy()
+        x[200] = np.nan
+        for window in (1, 2, 15, 16):
+            for q in (0.0, 0.1, 0.5, 0.75, 1.0):
+                np.testing.assert_allclose(moving_quantile_1d(x, window, q), reference_quantile(x, window, q))
+
+    def check(self, x, window, q):
+        op = LazyMovingQuantile(ConstantArray(x), window, q)
+        ref = reference_quantile(x, window, q)
+        self.assertEqual(op.shape(), ref.shape)
+        np.testing.assert_allclose(op.request_all_data(), ref)
+        np.testing.assert_allclose(op.request_data(slice(10, 90, 4)), ref[10:90:4])
+        out = np.empty((50,)+ref.shape[1:])
+        np.testing.assert_allclose(op.request_into(slice(20, 70), out), ref[20:70])
+        for i in (0, 33, -1, -7):
+            np.testing.assert_allclose(op.request_data(i), ref[i])
+
+    def test_float(self):
+        for q in (0.1, 0.5, 0.9):
+            self.check(self.x, 15, q)
+
+    def test_counts(self):
+        for q in (0.1, 0.5, 0.9):
+            self.check(self.counts, 16, q)
+
+    def test_shared_source(self):
+        src = ConstantArray(self.x)
+        op = src[7:-7] - LazyMovingQuantile(src, 15)
+        ref = self.x[7:-7] - reference_quantile(self.x, 15, 0.5)
+        np.testing.assert_allclose(op.request_data(-1), ref[-1])
+        np.testing.assert_allclose(op.request_data(slice(-20, None)), ref[-20:])
+
+
+class TestMovingMean(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.x = rng.normal(10.0, 1.0, (500, 3, 4))
+        self.x[50, 1, 2] = np.nan
+        self.x[120, 0, 0] = np.inf
+        self.x[300, 2, 3] = -np.inf
+        self.x[305, 2, 3] = np.inf
+
+    def test_1d(self):
+        x = self.x[:, 1, 2].copy()
+        np.testing.assert_allclose(moving_mean_1d(x, 1), x)
+        np.testing.assert_allclose(moving_mean_1d(x, 20), np.convolve(x, np.ones(20)/20, mode="valid"))
+        self.assertFalse(np.isnan(moving_mean_1d(x, 20)[100:]).any())
+
+    def test_non_finite(self):
+        mean = LazyMovingMean(ConstantArray(self.x), 20)
+        np.testing.assert_allclose(mean.request_all_data(), reference_mean(self.x, 20))
+
+    def test_sequential_requests(self):
+        mean = LazyMovingMean(ConstantArray(self.x), 20)
+        ref = reference_mean(self.x, 20)
+        for i in range(ref.shape[0]):
+            np.testing.assert_allclose(mean.request_data(i), ref[i])
+        for i in range(0, ref.shape[0]-5, 5):
+            np.testing.assert_allclose(mean.request_data(slice(i, i+5)), ref[i:i+5])
+
+    def test_shared_source(self):
+        window = 20
+        offset = window//2
+        back_cut = window-offset
+        src = ConstantArray(self.x)
+        detail = src[offset:-back_cut+1] - LazyMovingMean(src, window)
+        ref = self.x[offset:-back_cut+1] - reference_mean(self.x, window)
+        for i in range(100, 400):
+            np.testing.assert_allclose(detail.request_data(i), ref[i])
+        for i in range(0, 300, 5):
+            np.testing.assert_allclose(detail.request_data(slice(i, i+5)), ref[i:i+5])
+        np.testing.assert_allclose(detail.request_data(-1), ref[-1])
+
+
+class TestMovingMADNormalize(unittest.TestCase):
+    def setUp(self):
+        self.x = np.random.default_rng(1).normal(0.0, 2.0, (300, 3, 4))
+
+    def check(self, median_window):
+        op = LazyMovingMADNormalize(ConstantArray(self.x), 15, 2.0, median_window)
+        ref = reference_mad_normalize(self.x, 15, 2.0, median_window)
+        self.assertEqual(op.shape(), ref.shape)
+        np.testing.assert_allclose(op.request_all_data(), ref)
+        np.testing.assert_allclose(op.request_data(slice(10, 50, 3)), ref[10:50:3])
+        for i in (0, 7, -1, -5):
+            np.testing.assert_allclose(op.request_data(i), ref[i])
+
+    def test_normalize(self):
+        self.check(0)
+
+    def test_subtract_median(self):
+        self.check(9)
+
+    def test_shared_source(self):
+        src = ConstantArray(self.x)
+        op = src[7:-7] + LazyMovingMADNormalize(src, 15)
+        ref = self.x[7:-7] + reference_mad_normalize(self.x, 15, 1.0, 0)
+        np.testing.assert_allclose(op.request_data(-1), ref[-1])
+        np.testing.assert_allclose(op.request_data(slice(-20, None)), ref[-20:])
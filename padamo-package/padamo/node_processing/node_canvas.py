@@ -9,6 +9,11 @@ from padamo.canvas_drawing import CanvasWrapper
 from padamo.canvas_drawing.linkable_nodes import DraggableNode
 from padamo.canvas_drawing.port_types import PortType
 from padamo.editing.editor_frame import VolatileEditorWindow
+from padamo.lazy_array_operations import LazyArrayOperation
+from padamo.lazy_array_operations.optimization import optimize
+from padamo.lazy_array_operations.precision import PRECISION_KEY, compute_precision, get_compute_precision
+from padamo.lazy_array_operations.tracing import tag_origin, cost_color
+from padamo.utilities.dual_signal import Signal
 
 
 class NodeExecutionError(Exception):
@@ -16,6 +21,37 @@ class NodeExecutionError(Exception):
         super().__init__(msg)
         self.node = node_to_focus
 
+def optimize_outputs(outputs:dict):
+    '''
+    Optimizes lazy trees of all outputs of node together, so parts shared between outputs stay shared
+    '''
+    roots = []
+    times = []
+    for value in outputs.values():
+        if isinstance(value, Signal):
+            roots.extend([value.space, value.time, value.trigger])
+            times.append(value.time)
+        elif isinstance(value, LazyArrayOperation):
+            roots.append(value)
+    optimized = iter(optimize(roots, exact_roots=times))
+    res = dict()
+    for k, value in outputs.items():
+        if isinstance(value, Signal):
+            value = Signal(next(optimized), next(optimized), next(optimized))
+        elif isinstance(value, LazyArrayOperation):
+            value = next(optimized)
+        res[k] = value
+    return res
+
+
+def tag_output(value, origin):
+    if isinstance(value, Signal):
+        for item in (value.space, value.time, value.trigger):
+            tag_origin(item, origin)
+    elif isinstance(value, LazyArrayOperation):
+        tag_origin(value, origin)
+
+
 class ConstRemapper(object):
     def __init__(self, ref):
         self.ref = ref
@@ -169,13 +205,18 @@ class Node(object):
                 inp = env[node][port]
             inputs[k] = inp
         outputs = {k: None for k in self.outputs.keys()}
+        precision = get_compute_precision()
+        if globalspace:
+            precision = globalspace.get(PRECISION_KEY, precision)
         try:
-            calculated = self.calculate_with_inputs(inputs, globalspace)
-            if not isinstance(calculated, dict):
-                raise NodeExecutionError("Node returned not dict", self)
+            with compute_precision(precision):
+                calculated = self.calculate_with_inputs(inputs, globalspace)
+                if not isinstance(calculated, dict):
+                    raise NodeExecutionError("Node returned not dict", self)
+                outputs.update(calculated)
+                outputs = optimize_outputs(outputs)
         except Exception as e:
             raise NodeExecutionError(str(e), self)
-        outputs.update(calculated)
         env[self] = dict()
         for k in outputs.keys():
             env[self][k] = outputs[k]
@@ -342,6 +383,22 @@ class NodeCanvas(CanvasWrapper):
             node:GraphDraggableNode
             node.set_properties(outline="#000000")
 
+    def show_costs(self, tracer):
+        '''
+        Colors nodes by own time of lazy operations they have created
+        '''
+        costs = tracer.origin_costs()
+        total = max(costs.values(), default=0.0)
+        for node, cost in costs.items():
+            gnode = node.graph_node
+            if gnode is not None and total > 0:
+                gnode.set_properties(fill=cost_color(cost/total))
+
+    def clear_costs(self):
+        for node in self.graph_nodes:
+            node:GraphDraggableNode
+            node.set_properties(fill=node.bound_class.GRAPH_KWARGS.get("fill", "#FFFFFF"))
+
     def highlight_node(self,node:GraphDraggableNode):
         self.remove_highlight()
         node.set_properties(outline="#FF0000")
@@ -416,4 +473,6 @@ class NodeCanvas(CanvasWrapper):
         env = dict()
         for node in self._node_cache:
             node.apply_on_env(env,globs)
+            for v in env[node].values():
+                tag_output(v, node)
         #print("Nodes gathered")
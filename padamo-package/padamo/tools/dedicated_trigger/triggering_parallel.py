@@ -5,6 +5,8 @@ from multiprocessing import Process
 from multiprocessing import Pipe
 
 import numpy as np
+from padamo.lazy_array_operations import PrefetchedLazyArray
+from padamo.utilities.run_trigger import RunTrigger, complement_runs
 
 from .storage import  Interval
 from multiprocessing.connection import Connection
@@ -49,17 +51,40 @@ class ParallelTrigger(Process):
         self.batch_size = batch_size
         self.pipe = child_pipe
 
+    def run_encoded(self, trigger:RunTrigger):
+        # Runs are taken as is, so events are not split at batch boundaries
+        start = self.interval.start
+        end = self.interval.end
+        starts, ends = trigger.runs(start, end)
+        neg_starts, neg_ends = complement_runs(starts-start, ends-start, end-start)
+        intervals = [(a, b, True) for a, b in zip(starts, ends)]
+        intervals += [(a+start, b+start, False) for a, b in zip(neg_starts, neg_ends)]
+        intervals.sort()
+        for istart, iend, positive in intervals:
+            self.pipe.send((int(istart)-start,))
+            if positive:
+                print("Found", istart, iend)
+            else:
+                print("Nothing is in", istart, iend)
+            self.pipe.send((int(istart), int(iend), positive))
+        self.pipe.send((end-start,))
+
     def run(self):
         PersistentConnection.reset()
+        if isinstance(self.signal.trigger, RunTrigger):
+            self.run_encoded(self.signal.trigger)
+            self.pipe.send("END")
+            while not self.pipe.poll():
+                pass
+            return
         start = self.interval.start
         end = self.interval.end
         batch_size = self.batch_size
-        current_index = start
-        while current_index<end:
-            cur_size = min(batch_size,end-current_index)
+        trigger = PrefetchedLazyArray(self.signal.trigger)
+        for index_range, processed_data in trigger.iter_chunks(start, end, batch_size):
+            current_index = index_range.start
             self.pipe.send((current_index-start,))
             gc.collect()
-            processed_data = self.signal.trigger.request_data(slice(current_index, current_index+cur_size))
             processed_data = np.logical_or.reduce(processed_data,axis=tuple(range(1,len(processed_data.shape))))
             #print(processed_data)
             intervals_pos, intervals_neg = find_intervals(processed_data)
@@ -71,7 +96,7 @@ class ParallelTrigger(Process):
                 print("Nothing is in", istart+current_index, iend+current_index)
                 self.pipe.send((istart+current_index, iend+current_index,False))
 
-            current_index += cur_size
+        trigger.close()
         #sleep(1)
         self.pipe.send("END")
         while not self.pipe.poll():
@@ -12,6 +12,7 @@ from padamo.tools.base import Tool
 
 from padamo.editing import VolatileEditorWindow
 from padamo.node_processing.node_canvas import NodeCanvas, NodeExecutionError, GraphDraggableNode
+from padamo.lazy_array_operations import tracing
 from .workspace import GraphWorkspace
 from padamo.utilities.workspace import Workspace
 
@@ -51,6 +52,8 @@ class ProcessingEditor(Tool):
         runbtn.grid(row=0, column=0)
         default_set = tk.Button(bpanel, text="Set as default", command=self.on_save_default)
         default_set.grid(row=0, column=1)
+        self.profile_button = tk.Button(bpanel, text="Start profiling", command=self.on_profile)
+        self.profile_button.grid(row=0, column=2)
 
         default_file = get_default_filename()
         if not os.path.isfile(default_file):
@@ -110,6 +113,22 @@ class ProcessingEditor(Tool):
             print(traceback.format_exc(), file=sys.stderr)
         self.trigger_globals_update(self)
 
+    def on_profile(self):
+        if tracing.active_tracer() is None:
+            self.canvas_wrapper.clear_costs()
+            tracing.start_tracing()
+            self.profile_button.configure(text="Stop profiling")
+        else:
+            tracer = tracing.stop_tracing()
+            self.profile_button.configure(text="Start profiling")
+            print(tracer.summary())
+            self.canvas_wrapper.show_costs(tracer)
+            filename = filedialog.asksaveasfilename(title="Save profile",
+                                                    filetypes=[("Collapsed stacks", "*.folded"), ("JSON", "*.json")],
+                                                    defaultextension=".folded")
+            if filename:
+                tracer.save(filename)
+
     def on_globals_update(self):
         self.canvas_wrapper.invalidate_cache()
         #print("GLOBALS UPDATED")
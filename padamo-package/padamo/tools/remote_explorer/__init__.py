@@ -13,6 +13,7 @@ from ..base import Tool
 from .login_form import LoginForm
 from padamo.ui_elements.button_panel import ButtonPanel
 from .lazy_remote import LazyHDF5OnlineBindedReader
+from padamo.lazy_array_operations.base import LazyArrayMultiConcat
 
 class HDFFactory(object):
     def __init__(self, ssh_connector, path):
@@ -69,14 +70,10 @@ class HDFDirFactory(object):
             self.files = [item[1] for item in filemetrics]
             print(files)
 
-        x = None
-        for file in tqdm.tqdm(self.files):
-            next_part = LazyHDF5OnlineBindedReader(self.ssh_connector, file, field)
-            if x is None:
-                x = next_part
-            else:
-                x = x.extend(next_part)
-        return x
+        if not self.files:
+            return None
+        parts = [LazyHDF5OnlineBindedReader(self.ssh_connector, file, field) for file in tqdm.tqdm(self.files)]
+        return LazyArrayMultiConcat(parts)
 
 
 class RemoteExplorer(Tool):
@@ -4,6 +4,7 @@ import h5pickle
 import h5py
 import numpy as np
 from padamo.lazy_array_operations import LazyArrayOperation
+from padamo.node_lib.node_hdf5 import read_into
 from .login_form import Connector
 
 class LazyHDF5OnlineBindedReader(LazyArrayOperation):
@@ -50,6 +51,13 @@ class LazyHDF5OnlineBindedReader(LazyArrayOperation):
         #print("RETURNS", res)
         return res
 
+    def request_into(self, interesting_slices, out:np.ndarray):
+        _file = self._get_h5()
+        read_into(_file[self.field], interesting_slices, out)
+        if self._is_pickled:
+            gc.collect()
+        return out
+
     def shape(self):
         # self.ensure_file(True)
         _file = self._get_h5()
@@ -58,6 +66,14 @@ class LazyHDF5OnlineBindedReader(LazyArrayOperation):
             gc.collect()
         return s
 
+    def dtype(self):
+        _file = self._get_h5()
+        return _file[self.field].dtype
+
+    def chunks(self):
+        _file = self._get_h5()
+        return _file[self.field].chunks
+
     def __getstate__(self):
         state = {
             "filename":self.filename,
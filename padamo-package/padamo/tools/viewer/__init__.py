@@ -114,6 +114,8 @@ class Viewer(Tool, PopupPlotable):
         self._animator = AnimationHandle(self)
         self._exporter = ExporterHandle(self)
         self._detector_error = False
+        self._playback_source = None
+        self._playback = None
         self._finder.set_callback(self.on_event_found)
         PopupPlotable.__init__(self, self.plotter, enable_invalidate=True, max_plots=10)
         self.on_form_commit(False)
@@ -284,11 +286,28 @@ class Viewer(Tool, PopupPlotable):
 
 
 
+    def get_playback_view(self):
+        '''
+        Current view with read-ahead of frames that follow during playback
+        '''
+        cur_view = self.globals["current_view"]
+        if cur_view is not self._playback_source:
+            self.close_playback()
+            self._playback_source = cur_view
+            self._playback = cur_view.prefetched()
+        return self._playback
+
+    def close_playback(self):
+        if self._playback is not None:
+            self._playback.close_prefetch()
+        self._playback_source = None
+        self._playback = None
+
     def on_player_ctrl_frame(self, frame):
         #print(self.globals["current_view"])
         if self.globals["current_view"] is not None:
             try:
-                cur_view = self.globals["current_view"]
+                cur_view = self.get_playback_view()
                 view = cur_view.space.request_data(frame)
                 time_ = cur_view.time.request_data(frame)
                 #dt = datetime.datetime.utcfromtimestamp(float(time_))
@@ -312,6 +331,7 @@ class Viewer(Tool, PopupPlotable):
         pass
 
     def on_globals_update(self):
+        self.close_playback()
         if self.globals["current_view"] is not None:
             #print(self.globals["current_view"])
             try:
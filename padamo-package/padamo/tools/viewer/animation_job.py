@@ -76,52 +76,56 @@ class Animator(ParallelJob):
             bottom = None
 
         start_index = 0
-
-        for i in tqdm.tqdm(range(low_frame, high_frame, skip)):
-            if not self.is_working():
-                break
-            self.set_progress((i-low_frame)//skip)
-            # self.on_player_ctrl_frame(i)
-            # self.plotter.draw(False)
-            if self.trigger_only:
-                trig = self.signal.request_trigger_data(i)
-                if not(trig is None or np.logical_or.reduce(trig)):
-                    continue
-            frame = self.signal.space.request_data(i)
-            time_ = self.signal.time.request_data(i)
-            #dt = datetime.datetime.utcfromtimestamp(float(time_))
-            self.plotter.buffer_matrix = frame
-            self.plotter.update_matrix_plot(True)
-            if self.show_time:
-                print("ANIM", frame, time_)
-                self.plotter.axes.set_title(self.time_format.format_time(i, float(time_)))
-            else:
-                self.plotter.axes.set_title("")
-            self.plotter.draw()
-
-            buf = io.BytesIO()
-            frame = self.plotter.get_frame()
-            if bottom is not None:
-                bottom.set_frame(i - low_frame)
-                frame2 = bottom.get_frame()
-                w = max(frame.size[0], frame2.size[0])
-                h = frame.size[1] + frame2.size[1]
-                result_frame = PIL.Image.new("RGB", (w, h))
-                result_frame.paste(frame, (0, 0))
-                result_frame.paste(frame2, (0, frame.size[1]))
-            else:
-                result_frame = frame
-
-            if writer is None:
-                fn = insert_number(filename, i)
-                result_frame.save(fn)
-            else:
-                result_frame.save(buf, format="png")
-                buf.seek(0)
-                frame_iio = iio.v3.imread(buf)
-                writer.append_data(frame_iio)
-        if writer is not None:
-            writer.close()
+        signal = self.signal.prefetched()
+
+        try:
+            for i in tqdm.tqdm(range(low_frame, high_frame, skip)):
+                if not self.is_working():
+                    break
+                self.set_progress((i-low_frame)//skip)
+                # self.on_player_ctrl_frame(i)
+                # self.plotter.draw(False)
+                if self.trigger_only:
+                    trig = signal.request_trigger_data(i)
+                    if not(trig is None or np.logical_or.reduce(trig)):
+                        continue
+                frame = signal.space.request_data(i)
+                time_ = signal.time.request_data(i)
+                #dt = datetime.datetime.utcfromtimestamp(float(time_))
+                self.plotter.buffer_matrix = frame
+                self.plotter.update_matrix_plot(True)
+                if self.show_time:
+                    print("ANIM", frame, time_)
+                    self.plotter.axes.set_title(self.time_format.format_time(i, float(time_)))
+                else:
+                    self.plotter.axes.set_title("")
+                self.plotter.draw()
+
+                buf = io.BytesIO()
+                frame = self.plotter.get_frame()
+                if bottom is not None:
+                    bottom.set_frame(i - low_frame)
+                    frame2 = bottom.get_frame()
+                    w = max(frame.size[0], frame2.size[0])
+                    h = frame.size[1] + frame2.size[1]
+                    result_frame = PIL.Image.new("RGB", (w, h))
+                    result_frame.paste(frame, (0, 0))
+                    result_frame.paste(frame2, (0, frame.size[1]))
+                else:
+                    result_frame = frame
+
+                if writer is None:
+                    fn = insert_number(filename, i)
+                    result_frame.save(fn)
+                else:
+                    result_frame.save(buf, format="png")
+                    buf.seek(0)
+                    frame_iio = iio.v3.imread(buf)
+                    writer.append_data(frame_iio)
+        finally:
+            signal.close_prefetch()
+            if writer is not None:
+                writer.close()
 
 
 class AnimationHandle(ParallelJobHandle):
@@ -1,5 +1,6 @@
 import pickle
 import h5py
+import numpy as np
 from .parallel_signal_job import ParallelJob, ParallelJobHandle
 
 
@@ -21,38 +22,38 @@ class Exporter(ParallelJob):
         filename = self.filename
         start = self.start_point
         end = self.end_point
-        view = self.view
+        view = self.view.prefetched()
         stepsize = self.stepsize
-        with h5py.File(filename, "w") as fp:
-            l0 = end - start
-            spatial = fp.create_dataset("pdm_2d_rot_global", (l0,) + view.space.shape()[1:])
-            temporal = fp.create_dataset("unixtime_dbl_global", (l0,), dtype=float)
-            time_active = view.time.activate()
-            space_active = view.space.activate()
-
-            pointer = 0
-            print("CYCLE START")
-            while pointer < l0 and self.is_working():
+        try:
+            with h5py.File(filename, "w") as fp:
+                l0 = end - start
+                spatial = fp.create_dataset("pdm_2d_rot_global", (l0,) + view.space.shape()[1:])
+                temporal = fp.create_dataset("unixtime_dbl_global", (l0,), dtype=float)
+                # Step is rounded to storage chunks of source
+                chunk_len, _ = view.space.chunk_layout(stepsize)
+                # Time buffer is reused for every step, space buffer is reused by iter_chunks
+                time_buffer = np.empty((min(chunk_len, l0),), dtype=temporal.dtype)
+
+                pointer = 0
+                print("CYCLE START")
+                for index_range, space_part in view.space.iter_chunks(start, end, chunk_len, reuse_buffer=True):
+                    if not self.is_working():
+                        break
+                    pointer = index_range.start - start
+                    print(f"\r{pointer}/{l0}" + " " * 10, end="")
+                    self.set_progress(pointer)
+                    step = len(index_range)
+                    nbt = view.time.request_into(slice(index_range.start, index_range.stop), time_buffer[:step])
+                    if nbt.shape[0] > 1:
+                        assert nbt[1] > nbt[0]
+                    # print(nbt)
+                    temporal.write_direct(time_buffer, np.s_[0:step], np.s_[pointer:pointer + step])
+                    spatial.write_direct(np.ascontiguousarray(space_part), np.s_[0:step], np.s_[pointer:pointer + step])
+                    pointer += step
                 print(f"\r{pointer}/{l0}" + " " * 10, end="")
-                self.set_progress(pointer)
-                step = l0 - pointer
-                step = min(stepsize, step)
-                sub_start = pointer + start
-                sub_end = sub_start + step
-                nbt = time_active[sub_start:sub_end]
-                if nbt.shape[0] > 1:
-                    assert nbt[1] > nbt[0]
-                # print(nbt)
-                if len(nbt) != step:
-                    print("COMPARE ERROR", len(nbt), step)
-                    print("TIME shape", time_active.shape)
-                    print("CHECK", type(view.time))
-                assert len(nbt) == step
-                temporal[pointer:pointer + step] = nbt
-                spatial[pointer:pointer + step] = space_active[sub_start:sub_end]
-                pointer += step
-            print(f"\r{pointer}/{l0}" + " " * 10, end="")
-            print()
+                print()
+        finally:
+            view.close_prefetch()
 
 
 class ExporterHandle(ParallelJobHandle):
@@ -0,0 +1,41 @@
+import os
+import pickle
+import tempfile
+import unittest
+import h5py
+import numpy as np
+from padamo.node_lib.node_hdf5 import create_signal
+from .export_job import Exporter
+
+
+class TestExporter(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.directory.name, "source.h5")
+        rng = np.random.default_rng(7)
+        self.space = rng.normal(size=(1000, 4, 4))
+        self.time = 1.7e9+np.arange(1000)*1e-3
+        with h5py.File(self.source, "w") as fp:
+            fp.create_dataset("pdm_2d_rot_global", data=self.space, chunks=(128, 4, 4))
+            fp.create_dataset("unixtime_dbl_global", data=self.time, chunks=(128,))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def export(self, start, end, stepsize):
+        target = os.path.join(self.directory.name, "target.h5")
+        signal = create_signal(self.source, "pdm_2d_rot_global", "unixtime_dbl_global")
+        job = Exporter(dict(filename=target, start=start, end=end, signal=pickle.dumps(signal), stepsize=stepsize))
+        job.run_job()
+        with h5py.File(target, "r") as fp:
+            # Exported space is stored in single precision
+            np.testing.assert_array_equal(fp["pdm_2d_rot_global"][()], self.space[start:end].astype(np.float32))
+            np.testing.assert_array_equal(fp["unixtime_dbl_global"][()], self.time[start:end])
+
+    def test_step_below_chunk(self):
+        self.export(0, 1000, 1)
+        self.export(5, 300, 1)
+
+    def test_step_above_chunk(self):
+        self.export(0, 1000, 300)
+        self.export(130, 999, 1000)
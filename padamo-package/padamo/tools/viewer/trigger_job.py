@@ -1,4 +1,5 @@
 import pickle
+from padamo.utilities.run_trigger import RunTrigger
 from .parallel_signal_job import ParallelJob, ParallelJobHandle
 
 def normalize_frame(frame):
@@ -13,11 +14,21 @@ class EventFinder(ParallelJob):
         self.start_i = start_i
 
     def get_length(self):
+        if isinstance(self.trigger_src, RunTrigger):
+            return self.trigger_src.length
         return self.trigger_src.shape[0]
 
     def run_job(self) -> None:
         i = self.start_i
         trigger = self.trigger_src
+        if isinstance(trigger, RunTrigger):
+            # Next event is start of first run after current frame
+            i = trigger.next_run_start(i)
+            if i is None:
+                return
+            print("Reached triggerred index", i)
+            self.return_result(i)
+            return
         length = trigger.shape[0]
         print("START", i)
         while i < length and normalize_frame(trigger[i]):
@@ -48,6 +59,8 @@ class EventFinderHandle(ParallelJobHandle):
 
 
     def create_worker(self):
-        trigger = pickle.loads(self.kwargs["trigger"]).activate()
+        trigger = pickle.loads(self.kwargs["trigger"])
+        if not isinstance(trigger, RunTrigger):
+            trigger = trigger.activate()
         start_i = self.kwargs["start_i"]
         return EventFinder(trigger,start_i)
\ No newline at end of file
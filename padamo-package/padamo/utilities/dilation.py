@@ -0,0 +1,51 @@
+'''
+Dilation of boolean (trigger) arrays along time in O(n) regardless of window.
+'''
+import numpy as np
+import numba as nb
+
+
+@nb.njit(nogil=True)
+def window_any(x, offset, window, shift_left_edge, out):
+    '''
+    out[i] = x[a:a+window].any() with a = i-offset; window is clipped by bounds of x.
+    If shift_left_edge is set, windows starting before 0 are moved to start at 0 instead of being clipped.
+    Window bounds only grow with i, so it is enough to remember last true sample seen.
+    '''
+    n = x.shape[0]
+    last = -1
+    j = 0
+    for i in range(out.shape[0]):
+        a = i-offset
+        if shift_left_edge and a < 0:
+            a = 0
+        b = min(a+window, n)
+        while j < b:
+            if x[j]:
+                last = j
+            j += 1
+        out[i] = last >= 0 and last >= a
+    return out
+
+
+@nb.njit(nogil=True)
+def dilate_runs(starts, ends, left, right, length):
+    '''
+    Dilates runs [starts[k], ends[k]) (sorted, not overlapping) by left samples before and right samples after.
+    Runs are clipped by [0, length) and merged where they touch. Returns new (starts, ends).
+    '''
+    res_starts = np.empty(starts.shape[0], dtype=np.int64)
+    res_ends = np.empty(starts.shape[0], dtype=np.int64)
+    m = 0
+    for k in range(starts.shape[0]):
+        s = max(starts[k]-left, 0)
+        e = min(ends[k]+right, length)
+        if s >= e:
+            continue
+        if m > 0 and s <= res_ends[m-1]:
+            res_ends[m-1] = max(res_ends[m-1], e)
+        else:
+            res_starts[m] = s
+            res_ends[m] = e
+            m += 1
+    return res_starts[:m], res_ends[:m]
@@ -1,4 +1,5 @@
-from padamo.lazy_array_operations import LazyArrayOperation
+from padamo.lazy_array_operations import LazyArrayOperation, PrefetchedLazyArray
+from padamo.lazy_array_operations.base import LazyArrayMultiConcat
 from typing import Optional
 
 class SignalShapeError(Exception):
@@ -80,3 +81,27 @@ class Signal(object):
         time_concat = self.time.extend(other.time)
         trigger = self._concatenate_triggers(other)
         return Signal(space_concat, time_concat, trigger)
+
+    def prefetched(self, depth=2):
+        '''
+        Same signal with read-ahead for sequential consumers
+        '''
+        trigger = None
+        if self.trigger is not None:
+            trigger = PrefetchedLazyArray(self.trigger, depth)
+        return Signal(PrefetchedLazyArray(self.space, depth), PrefetchedLazyArray(self.time, depth), trigger)
+
+    def close_prefetch(self):
+        for item in (self.space, self.time, self.trigger):
+            if isinstance(item, PrefetchedLazyArray):
+                item.close()
+
+    @staticmethod
+    def concatenate(signals):
+        space_concat = LazyArrayMultiConcat([s.space for s in signals])
+        time_concat = LazyArrayMultiConcat([s.time for s in signals])
+        if any(s.trigger is None for s in signals):
+            trigger = None
+        else:
+            trigger = LazyArrayMultiConcat([s.trigger for s in signals])
+        return Signal(space_concat, time_concat, trigger)
@@ -0,0 +1,138 @@
+'''
+Reductions of every frame to a scalar done in one pass over data.
+Functions take array of frames (time axis first) and optional pixel map (boolean array of frame shape).
+Pixels outside of pixel map are ignored. Frames are processed in parallel.
+'''
+import numpy as np
+import numba as nb
+
+
+# Reassociation lets sums vectorize, NaN still propagate
+@nb.njit(parallel=True, nogil=True, fastmath={"reassoc"})
+def _frame_sum(frames, mask):
+    res = np.zeros(frames.shape[0])
+    for t in nb.prange(frames.shape[0]):
+        s = 0.0
+        for p in range(frames.shape[1]):
+            if mask[p]:
+                s += frames[t, p]
+        res[t] = s
+    return res
+
+
+@nb.njit(parallel=True, nogil=True)
+def _frame_max(frames, mask):
+    res = np.full(frames.shape[0], -np.inf)
+    for t in nb.prange(frames.shape[0]):
+        m = -np.inf
+        for p in range(frames.shape[1]):
+            if mask[p]:
+                v = frames[t, p]
+                if np.isnan(v):
+                    m = np.nan
+                    break
+                if v > m:
+                    m = v
+        res[t] = m
+    return res
+
+
+@nb.njit(parallel=True, nogil=True)
+def _frame_quantile(frames, mask, quant):
+    res = np.full(frames.shape[0], np.nan)
+    count = 0
+    for p in range(frames.shape[1]):
+        if mask[p]:
+            count += 1
+    if count == 0:
+        return res
+    for t in nb.prange(frames.shape[0]):
+        buffer = np.empty(count)
+        k = 0
+        nans = False
+        for p in range(frames.shape[1]):
+            if mask[p]:
+                buffer[k] = frames[t, p]
+                nans = nans or np.isnan(buffer[k])
+                k += 1
+        if not nans:
+            res[t] = np.quantile(buffer, quant)
+    return res
+
+
+@nb.njit(parallel=True, nogil=True)
+def _frame_any_above(frames, mask, threshold):
+    res = np.zeros(frames.shape[0], dtype=np.bool_)
+    for t in nb.prange(frames.shape[0]):
+        for p in range(frames.shape[1]):
+            if mask[p] and frames[t, p] > threshold:
+                res[t] = True
+                break
+    return res
+
+
+@nb.njit(parallel=True, nogil=True)
+def _frame_any(frames, mask):
+    res = np.zeros(frames.shape[0], dtype=np.bool_)
+    for t in nb.prange(frames.shape[0]):
+        for p in range(frames.shape[1]):
+            if mask[p] and frames[t, p] != 0:
+                res[t] = True
+                break
+    return res
+
+
+def _prepare(frames, pixelmap):
+    frames = np.asarray(frames)
+    if frames.dtype == np.bool_:
+        frames = frames.view(np.uint8)
+    flat = frames.reshape(frames.shape[0], -1)
+    if pixelmap is None:
+        mask = np.ones(flat.shape[1], dtype=np.bool_)
+    else:
+        mask = np.ascontiguousarray(np.broadcast_to(pixelmap, frames.shape[1:]), dtype=np.bool_).ravel()
+    return flat, mask
+
+
+def _single(reduction, frame, *args, pixelmap=None):
+    return reduction(np.expand_dims(frame, 0), *args, pixelmap=pixelmap)[0]
+
+
+def frame_sum(frames, pixelmap=None):
+    return _frame_sum(*_prepare(frames, pixelmap))
+
+
+def frame_max(frames, pixelmap=None):
+    return _frame_max(*_prepare(frames, pixelmap))
+
+
+def frame_quantile(frames, quant, pixelmap=None):
+    '''
+    Same as np.quantile over frame (NaN gives NaN). NaN for frames without pixels.
+    '''
+    return _frame_quantile(*_prepare(frames, pixelmap), float(quant))
+
+
+def frame_median(frames, pixelmap=None):
+    return frame_quantile(frames, 0.5, pixelmap)
+
+
+def frame_any_above(frames, threshold, pixelmap=None):
+    '''
+    Same as (frames > threshold).any() for every frame without boolean temporary
+    '''
+    return _frame_any_above(*_prepare(frames, pixelmap), threshold)
+
+
+def frame_any(frames, pixelmap=None):
+    '''
+    Same as np.logical_or.reduce over frame
+    '''
+    return _frame_any(*_prepare(frames, pixelmap))
+
+
+def single_frame(reduction, frame, *args, pixelmap=None):
+    '''
+    Applies reduction to one frame, e.g. single_frame(frame_quantile, frame, 0.9)
+    '''
+    return _single(reduction, frame, *args, pixelmap=pixelmap)
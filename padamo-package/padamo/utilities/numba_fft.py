@@ -2,7 +2,8 @@ import matplotlib.pyplot as plt
 import numpy as np
 import numba as nb
 from numpy.fft import fft, ifft, fftfreq
-from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import oaconvolve
+from scipy.fft import rfft, irfft, next_fast_len
 from .dual_signal import Signal
 
 @nb.njit()
@@ -33,40 +34,62 @@ def multiply_slided(freqs, mods):
                     res[k,i,j,w] = freqs[k,i,j,w]*mods[w]
     return res
 
-def singular_calculate(signal:Signal,i,window, filter_):
+def filter_taps(filter_, window, resolution):
+    '''
+    Centre sample of ifft(fft(x)*H) over window is linear combination of x.
+    Returns its coefficients: taps[n] = Re(ifft(H))[(window//2-n) mod window].
+    '''
+    modulator = filter_.build(fftfreq(window, resolution))
+    kernel = np.real(ifft(modulator))
+    n = np.arange(window)
+    return kernel[(window//2-n) % window]
+
+
+def time_resolution(signal:Signal, start):
+    src_temporal = signal.time.request_data(slice(start, start+2))
+    return src_temporal[1]-src_temporal[0]
+
+
+def singular_calculate(signal:Signal,i,window, filter_, taps=None):
     src_spatial = signal.space.request_data(slice(i, i + window))
-    src_temporal = signal.time.request_data(slice(i, i + window))
-    resolution = src_temporal[1]-src_temporal[0]
-    src_spectrum = fft(src_spatial, axis=0)
-    freqs = fftfreq(src_temporal.shape[0],resolution)
-    modulator = filter_.build(freqs)
-    # plt.plot(freqs,modulator)
-    # plt.show()
-    mod_spectrum = multiply_signal(src_spectrum, modulator)
-    new_spatial = ifft(mod_spectrum, axis=0)
-    return np.real(new_spatial[window//2])
+    if taps is None:
+        taps = filter_taps(filter_, window, time_resolution(signal, i))
+    return np.tensordot(taps, src_spatial, axes=(0, 0))
 
-def multiple_calculate(source_signal:Signal, filter_, window, start,src_end):
+
+def multiple_calculate(source_signal:Signal, filter_, window, start,src_end, taps=None):
+    '''
+    Filters every window of source [start, src_end) keeping centre samples.
+    Done as one FIR convolution (overlap-add FFT) instead of FFT of every window.
+    '''
     signal_arr = source_signal.space.request_data(slice(start, src_end))
-    src_temporal = source_signal.time.request_data(slice(start, src_end))
-    resolution = src_temporal[1]-src_temporal[0]
-    slided = sliding_window_view(signal_arr,window,axis=0)
-    res = np.zeros(slided.shape[:-1])
-    freqs = fftfreq(window, resolution)
-    modulator = filter_.build(freqs)
-    # plt.plot(freqs,modulator)
-    # plt.show()
-    for i in range(slided.shape[0]):
-        spectrum = fft(slided[i],axis=-1)
-        mod_spectrum = multiply_signal_last(spectrum,modulator)
-        r1 = ifft(mod_spectrum,axis=-1)
-        res[i] = r1[:,:,window//2]
-    return np.real(res)
+    if taps is None:
+        taps = filter_taps(filter_, window, time_resolution(source_signal, start))
+    kernel = np.expand_dims(taps[::-1], tuple(range(1, signal_arr.ndim)))
+    return oaconvolve(signal_arr.astype(float), kernel, mode="valid", axes=0)
+
 
-    # src_spectral = fft(slided, axis=-1)
-    # freqs = fftfreq(src_temporal.shape[0], resolution)
-    # modulator = filter_.build(freqs)
-    # mod_freqs = multiply_slided(src_spectral,modulator)
-    # new_spatial = ifft(mod_freqs, axis=-1)
-    # new_spatial = new_spatial[:,:,:,window//2]
-    # return np.real(new_spatial)
\ No newline at end of file
+def filter_bank_calculate(source_signal:Signal, window, start, src_end, taps):
+    '''
+    Same as multiple_calculate for several filters at once. taps has shape (filters, window).
+    Overlap-save convolution: spectrum of every source block is computed once and shared by all filters.
+    Result has filter axis right after time axis.
+    '''
+    signal_arr = source_signal.space.request_data(slice(start, src_end))
+    length = signal_arr.shape[0]
+    frame = signal_arr.shape[1:]
+    # Transforms run along contiguous last axis
+    series = np.ascontiguousarray(signal_arr.reshape(length, -1).T, dtype=float)
+    n_out = max(length-window+1, 0)
+    res = np.empty((taps.shape[0], series.shape[0], n_out))
+    nfft = next_fast_len(max(8*window, 4096), real=True)
+    # Circular convolution of block is exact after first window-1 samples
+    block_step = nfft-window+1
+    kernels = rfft(taps[:, ::-1], nfft, axis=-1)
+    for i in range(0, n_out, block_step):
+        block = series[:, i:i+nfft]
+        valid = block.shape[1]-window+1
+        spectrum = rfft(block, nfft, axis=-1)
+        for k in range(taps.shape[0]):
+            res[k, :, i:i+valid] = irfft(spectrum*kernels[k], nfft, axis=-1)[:, window-1:block.shape[1]]
+    return res.transpose(2, 0, 1).reshape((n_out, taps.shape[0])+frame)
@@ -0,0 +1,230 @@
+'''
+Trigger stored as sorted runs [start, end) of triggered frames.
+Memory and scans are proportional to number and length of events, not to length of signal.
+'''
+import numpy as np
+import numba as nb
+
+from padamo.lazy_array_operations import LazyArrayOperation
+from padamo.lazy_array_operations.slice_combination import normalize_slice
+from padamo.utilities.dilation import dilate_runs
+from padamo.utilities.frame_reductions import frame_any
+
+
+@nb.njit(nogil=True)
+def intersect_runs(starts_a, ends_a, starts_b, ends_b):
+    res_starts = np.empty(starts_a.shape[0]+starts_b.shape[0], dtype=np.int64)
+    res_ends = np.empty(starts_a.shape[0]+starts_b.shape[0], dtype=np.int64)
+    i = 0
+    j = 0
+    m = 0
+    while i < starts_a.shape[0] and j < starts_b.shape[0]:
+        s = max(starts_a[i], starts_b[j])
+        e = min(ends_a[i], ends_b[j])
+        if s < e:
+            res_starts[m] = s
+            res_ends[m] = e
+            m += 1
+        if ends_a[i] < ends_b[j]:
+            i += 1
+        else:
+            j += 1
+    return res_starts[:m], res_ends[:m]
+
+
+def unite_runs(starts_a, ends_a, starts_b, ends_b, length):
+    starts = np.concatenate([starts_a, starts_b])
+    ends = np.concatenate([ends_a, ends_b])
+    order = np.argsort(starts, kind="stable")
+    return dilate_runs(starts[order], ends[order], 0, 0, length)
+
+
+def complement_runs(starts, ends, length):
+    res_starts = np.concatenate([[0], ends]).astype(np.int64)
+    res_ends = np.concatenate([starts, [length]]).astype(np.int64)
+    nonempty = res_starts < res_ends
+    return res_starts[nonempty], res_ends[nonempty]
+
+
+def find_runs(x):
+    '''
+    Runs of True in 1D boolean array
+    '''
+    edges = np.diff(x.astype(np.int8), prepend=np.int8(0), append=np.int8(0))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+class RunTrigger(LazyArrayOperation):
+    '''
+    Trigger made of sorted non-touching runs [starts[k], ends[k]) along time. Frames outside of runs are not triggered.
+    Per-pixel trigger keeps bit-packed pixel masks of frames inside runs (masks[k] has shape (run length, packed frame)).
+    Without masks all pixels of frames inside runs are triggered.
+    AND, OR and NOT work on runs (results have no masks).
+    '''
+    def __init__(self, starts, ends, length, frame_shape=(), masks=None):
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.asarray(ends, dtype=np.int64)
+        self.length = int(length)
+        self.frame_shape = tuple(frame_shape)
+        self.masks = masks
+
+    @classmethod
+    def from_lazy(cls, source:LazyArrayOperation, per_pixel=True, chunk_len=None):
+        '''
+        Encodes boolean lazy array in one chunked pass.
+        Frame is in run if any of its pixels is triggered; pixel masks are kept if per_pixel is set.
+        '''
+        shape = source.shape()
+        keep_masks = per_pixel and len(shape) > 1
+        starts = []
+        ends = []
+        masks = []
+        for index_range, data in source.iter_chunks(chunk_len=chunk_len):
+            offset = index_range.start
+            for a, b in zip(*find_runs(frame_any(data))):
+                packed = None
+                if keep_masks:
+                    block = data[a:b].reshape(b-a, -1)
+                    if block.dtype != np.bool_:
+                        block = block != 0
+                    packed = np.packbits(block, axis=1)
+                if ends and ends[-1] == a+offset:
+                    # Run continues from previous chunk
+                    ends[-1] = b+offset
+                    masks[-1].append(packed)
+                else:
+                    starts.append(a+offset)
+                    ends.append(b+offset)
+                    masks.append([packed])
+        if keep_masks:
+            masks = [np.concatenate(parts) for parts in masks]
+        else:
+            masks = None
+        return cls(starts, ends, shape[0], shape[1:] if per_pixel else (), masks)
+
+    def shape(self):
+        return (self.length,)+self.frame_shape
+
+    def dtype(self):
+        return np.dtype(np.bool_)
+
+    def pixels(self):
+        return int(np.prod(self.frame_shape, dtype=np.int64))
+
+    def find(self, start, stop):
+        '''
+        Range of indices of runs intersecting [start, stop)
+        '''
+        first = int(np.searchsorted(self.ends, start, side="right"))
+        last = int(np.searchsorted(self.starts, stop, side="left"))
+        return range(first, max(first, last))
+
+    def runs(self, start=0, stop=None):
+        '''
+        (starts, ends) of runs clipped by [start, stop)
+        '''
+        if stop is None:
+            stop = self.length
+        found = self.find(start, stop)
+        return (np.clip(self.starts[found.start:found.stop], start, stop),
+                np.clip(self.ends[found.start:found.stop], start, stop))
+
+    def next_run_start(self, i):
+        '''
+        Start of first run beginning after frame i (None if there is no such run)
+        '''
+        k = int(np.searchsorted(self.starts, i, side="right"))
+        if k < self.starts.shape[0]:
+            return int(self.starts[k])
+        return None
+
+    def _unpack(self, k, a, b):
+        # Frames a:b of run k (counted from start of run)
+        if self.masks is None:
+            return np.ones((b-a,)+self.frame_shape, dtype=np.bool_)
+        bits = np.unpackbits(self.masks[k][a:b], axis=1, count=self.pixels())
+        return bits.view(np.bool_).reshape((b-a,)+self.frame_shape)
+
+    def request_single(self, i:int):
+        if i < 0:
+            i = self.length+i
+        if i < 0 or i >= self.length:
+            raise IndexError(f"index {i} is out of bounds for axis 0 with size {self.length}")
+        k = int(np.searchsorted(self.ends, i, side="right"))
+        if k < self.starts.shape[0] and self.starts[k] <= i:
+            offset = i-self.starts[k]
+            return self._unpack(k, offset, offset+1)[0]
+        if self.frame_shape:
+            return np.zeros(self.frame_shape, dtype=np.bool_)
+        return np.bool_(False)
+
+    def request_slice(self, s:slice):
+        start, end, step = normalize_slice(self.length, s)
+        end = max(start, end)
+        res = np.zeros((end-start,)+self.frame_shape, dtype=np.bool_)
+        for k in self.find(start, end):
+            a = max(self.starts[k], start)
+            b = min(self.ends[k], end)
+            res[a-start:b-start] = self._unpack(k, a-self.starts[k], b-self.starts[k])
+        return res[::step]
+
+    def sliced(self, start, stop):
+        found = self.find(start, stop)
+        starts, ends = self.runs(start, stop)
+        masks = None
+        if self.masks is not None:
+            masks = [self.masks[k][max(start-self.starts[k], 0):min(stop, self.ends[k])-self.starts[k]] for k in found]
+        return RunTrigger(starts-start, ends-start, stop-start, self.frame_shape, masks)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice) and item.step in (None, 1):
+            start, stop, _ = normalize_slice(self.length, item)
+            return self.sliced(start, max(start, stop))
+        return super().__getitem__(item)
+
+    def extend(self, other):
+        if not isinstance(other, RunTrigger) or other.frame_shape != self.frame_shape \
+                or (other.masks is None) != (self.masks is None):
+            return super().extend(other)
+        starts = np.concatenate([self.starts, other.starts+self.length])
+        ends = np.concatenate([self.ends, other.ends+self.length])
+        masks = None if self.masks is None else list(self.masks)+list(other.masks)
+        k = self.starts.shape[0]
+        if k > 0 and other.starts.shape[0] > 0 and ends[k-1] == starts[k]:
+            # Event crosses junction
+            starts = np.delete(starts, k)
+            ends = np.delete(ends, k-1)
+            if masks is not None:
+                masks[k-1:k+1] = [np.concatenate(masks[k-1:k+1])]
+        return RunTrigger(starts, ends, self.length+other.length, self.frame_shape, masks)
+
+    def marginalized(self):
+        '''
+        Trigger of frames (any pixel is triggered)
+        '''
+        return RunTrigger(self.starts, self.ends, self.length)
+
+    def _check(self, other):
+        if other.length != self.length:
+            raise ValueError(f"Trigger lengths mismatch ({self.length} and {other.length})")
+
+    def intersection(self, other):
+        self._check(other)
+        return RunTrigger(*intersect_runs(self.starts, self.ends, other.starts, other.ends), self.length)
+
+    def union(self, other):
+        self._check(other)
+        return RunTrigger(*unite_runs(self.starts, self.ends, other.starts, other.ends, self.length), self.length)
+
+    def complement(self):
+        '''
+        Inverted trigger. Pixel masks are not inverted, so trigger with masks is marginalized first.
+        '''
+        frame_shape = self.frame_shape if self.masks is None else ()
+        return RunTrigger(*complement_runs(self.starts, self.ends, self.length), self.length, frame_shape)
+
+    def dilated(self, left, right):
+        '''
+        Every run is extended by left frames before and right frames after
+        '''
+        return RunTrigger(*dilate_runs(self.starts, self.ends, left, right, self.length), self.length)
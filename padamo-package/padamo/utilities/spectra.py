@@ -1,10 +1,15 @@
+import threading
+from collections import OrderedDict
+
 import numpy as np
 from numpy.fft import fft, ifft, fftfreq
+from scipy.signal import sosfilt, sosfilt_zi
 from .dual_signal import Signal
 from typing import Union
 from padamo.lazy_array_operations import LazyArrayOperation
 from padamo.lazy_array_operations.slice_combination import normalize_slice
-from .numba_fft import singular_calculate, multiple_calculate
+from padamo.lazy_array_operations.precision import as_compute, compute_dtype, get_compute_precision
+from .numba_fft import singular_calculate, multiple_calculate, filter_taps, time_resolution, filter_bank_calculate
 from .plot import LazyPlotter
 
 class SpectralFilter(object):
@@ -112,9 +117,27 @@ class LazyFilter(LazyArrayOperation):
         self.input_signal = input_signal
         self.filter_obj = filter_obj
         self.window = window
+        self._taps = dict()
+
+    def taps(self, start=0):
+        '''
+        FIR coefficients equivalent to filtering window with filter_obj. Computed once for each time resolution.
+        '''
+        resolution = time_resolution(self.input_signal, start)
+        if resolution not in self._taps:
+            if len(self._taps) >= 16:
+                # Time steps of real data jitter a bit, do not let cache grow
+                self._taps.clear()
+            self._taps[resolution] = self._build_taps(resolution)
+        return self._taps[resolution]
+
+    def _build_taps(self, resolution):
+        return filter_taps(self.filter_obj, self.window, resolution)
 
     def request_single(self,i:int):
-        return singular_calculate(self.input_signal, i, self.window, self.filter_obj)
+        if i < 0:
+            i += self.shape()[0]
+        return singular_calculate(self.input_signal, i, self.window, self.filter_obj, self.taps(i))
 
     def request_slice(self, interesting_slice):
         shape = self.shape()
@@ -124,7 +147,7 @@ class LazyFilter(LazyArrayOperation):
         src_end = end + self.window-1
         #src_part = self.source.request_data(slice(start, src_end))
         #mm = moving_median_3d(src_part.astype(float), self.window)
-        mm = multiple_calculate(self.input_signal,self.filter_obj,self.window,start,src_end)
+        mm = multiple_calculate(self.input_signal,self.filter_obj,self.window,start,src_end,self.taps(start))
         res = mm[0:end - start:step]
         return res
 
@@ -136,6 +159,170 @@ class LazyFilter(LazyArrayOperation):
         return (l,)+src_shape[1:]
 
 
+class LazyFilterBank(LazyFilter):
+    '''
+    Filters signal with several spectral filters sharing one spectrum of source.
+    Output has filter axis right after time axis; bank[:, k] is signal filtered with k-th filter.
+    Last computed block is kept, so outputs of different filters requested for the same frames are computed once.
+    '''
+    def __init__(self, input_signal:Signal, filters:list, window:int):
+        super().__init__(input_signal, tuple(filters), window)
+        self._last = None
+        self._lock = threading.Lock()
+
+    def _build_taps(self, resolution):
+        return np.stack([filter_taps(filter_, self.window, resolution) for filter_ in self.filter_obj])
+
+    def _block(self, start, end):
+        key = (start, end)
+        with self._lock:
+            last = self._last
+        if last is not None and last[0] == key:
+            return last[1]
+        block = filter_bank_calculate(self.input_signal, self.window, start, end+self.window-1, self.taps(start))
+        with self._lock:
+            self._last = (key, block)
+        return block
+
+    def request_single(self,i:int):
+        if i < 0:
+            i += self.shape()[0]
+        return self._block(i, i+1)[0].copy()
+
+    def request_slice(self, interesting_slice):
+        start, end, step = normalize_slice(self.shape()[0], interesting_slice)
+        return self._block(start, end)[::step].copy()
+
+    def request_tuple(self, s:tuple):
+        x0 = s[0]
+        if isinstance(x0, slice) and len(s) > 1:
+            # Pick requested filters before copying
+            start, end, step = normalize_slice(self.shape()[0], x0)
+            return self._block(start, end)[(slice(None, None, step),)+s[1:]].copy()
+        return super().request_tuple(s)
+
+    def shape(self):
+        src_shape = super().shape()
+        return src_shape[:1]+(len(self.filter_obj),)+src_shape[1:]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_last"] = None
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+class LazyIIRFilter(LazyArrayOperation):
+    '''
+    Causal IIR filter given by second-order sections applied along time.
+    Filter state after last request is kept, so sequential requests only filter new samples.
+    States are also saved every checkpoint_interval samples (rounded to source chunks);
+    random access filters from the nearest preceding checkpoint.
+    At most max_checkpoints least recently used states are kept, so they take at most
+    max_checkpoints*(number of sections)*2*(pixels in frame)*8 bytes.
+    Filter starts in steady state for the first sample.
+    '''
+    def __init__(self, source:LazyArrayOperation, sos, checkpoint_interval=65536, max_checkpoints=256):
+        self.source = source
+        self.sos = np.asarray(sos, dtype=float)
+        self.checkpoint_interval = checkpoint_interval
+        self.max_checkpoints = max_checkpoints
+        self.precision = get_compute_precision()
+        self._checkpoints = OrderedDict()
+        self._stream = None
+        self._lock = threading.Lock()
+
+    def shape(self):
+        return self.source.shape()
+
+    def dtype(self):
+        return compute_dtype(self.source.dtype(), self.precision)
+
+    def dependencies(self, interesting_slices):
+        # Output depends on the whole history of the source
+        return None
+
+    def _layout(self):
+        chunk_len, _ = self.source.chunk_layout()
+        chunk_len, _ = self.source.chunk_layout(min(chunk_len, self.checkpoint_interval))
+        return chunk_len, max(self.checkpoint_interval//chunk_len, 1)*chunk_len
+
+    def _initial_state(self):
+        x0 = np.asarray(self.source.request_data(0), dtype=float)
+        zi = sosfilt_zi(self.sos)
+        return zi.reshape(zi.shape+(1,)*x0.ndim)*x0
+
+    def _state_before(self, i):
+        '''
+        Closest position not after i where filter state is known and the state
+        '''
+        with self._lock:
+            pos, zi = 0, None
+            if self._stream is not None and self._stream[0] <= i:
+                pos, zi = self._stream
+            known = [k for k in self._checkpoints.keys() if pos < k <= i]
+            if known:
+                pos = max(known)
+                zi = self._checkpoints[pos]
+                self._checkpoints.move_to_end(pos)
+        if zi is None:
+            zi = self._initial_state()
+        return pos, zi
+
+    def _run(self, start, end):
+        res = np.empty((max(end-start, 0),)+self.shape()[1:], dtype=self.dtype())
+        if end <= start:
+            return res
+        chunk_len, interval = self._layout()
+        pos, zi = self._state_before(start)
+        for index_range, data in self.source.iter_chunks(pos, end, chunk_len):
+            filtered, zi = sosfilt(self.sos, np.asarray(data, dtype=float), axis=0, zi=zi)
+            a = max(start, index_range.start)
+            if a < index_range.stop:
+                res[a-start:index_range.stop-start] = filtered[a-index_range.start:]
+            if index_range.stop % interval == 0:
+                with self._lock:
+                    self._checkpoints[index_range.stop] = zi
+                    self._checkpoints.move_to_end(index_range.stop)
+                    while len(self._checkpoints) > self.max_checkpoints:
+                        self._checkpoints.popitem(last=False)
+        with self._lock:
+            self._stream = (end, zi)
+        return res
+
+    def request_single(self, i:int):
+        if i < 0:
+            i += self.shape()[0]
+        return self._run(i, i+1)[0]
+
+    def request_slice(self, s:slice):
+        start, end, step = normalize_slice(self.shape()[0], s)
+        return self._run(start, end)[::step]
+
+    def with_operands(self, replace):
+        res = super().with_operands(replace)
+        if res is not self:
+            res._checkpoints = OrderedDict()
+            res._stream = None
+            res._lock = threading.Lock()
+        return res
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_checkpoints"] = OrderedDict()
+        state["_stream"] = None
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
 class LazyFilterPlotter(LazyPlotter):
     def __init__(self, filter_:LazyFilter, window:int, resolution:float):
         self.filter_ = filter_
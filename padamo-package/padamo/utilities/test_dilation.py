@@ -0,0 +1,64 @@
+import unittest
+import numpy as np
+from .dilation import window_any, dilate_runs
+from .run_trigger import find_runs
+from padamo.node_lib.node_signal_manipulation import expand_runs, deconvolve
+
+
+def centered_deconvolve(x, window):
+    # Former kernel of node_signal_manipulation.deconvolve
+    res = np.full(shape=x.shape, fill_value=False)
+    for i in range(x.shape[0]):
+        start = max(i-window//2, 0)
+        end = min(start+window, x.shape[0])
+        res[i] = x[start:end].any()
+    return res
+
+
+def trailing_deconvolve(x, window):
+    # Former kernel of node_simple_triggers.deconvolve
+    res = np.full(shape=(x.shape[0]+window-1,), fill_value=False)
+    for i in range(x.shape[0]):
+        for j in range(window):
+            res[i+j] |= x[i]
+    return res
+
+
+def dense_dilation(x, left, right):
+    res = np.zeros_like(x)
+    for i in np.flatnonzero(x):
+        res[max(i-left, 0):i+right+1] = True
+    return res
+
+
+class TestDilation(unittest.TestCase):
+    def cases(self):
+        rng = np.random.default_rng(5)
+        for length in (1, 2, 7, 50, 300):
+            for density in (0.0, 0.02, 0.3, 1.0):
+                for window in (1, 2, 3, 8, 51, 400):
+                    yield rng.random(length) < density, window
+
+    def test_centered(self):
+        for x, window in self.cases():
+            res = window_any(x, window//2, window, True, np.zeros(x.shape, dtype=np.bool_))
+            np.testing.assert_array_equal(res, centered_deconvolve(x, window), err_msg=f"window {window}")
+
+    def test_trailing(self):
+        for x, window in self.cases():
+            res = window_any(x, window-1, window, False, np.zeros(x.shape[0]+window-1, dtype=np.bool_))
+            np.testing.assert_array_equal(res, trailing_deconvolve(x, window), err_msg=f"window {window}")
+
+    def test_runs(self):
+        for x, window in self.cases():
+            for left, right in ((0, 0), (window, 0), (0, window), (window//2, window-window//2-1)):
+                starts, ends = dilate_runs(*find_runs(x), left, right, x.shape[0])
+                np.testing.assert_array_equal(starts, find_runs(dense_dilation(x, left, right))[0])
+                np.testing.assert_array_equal(ends, find_runs(dense_dilation(x, left, right))[1])
+
+    def test_expand_runs(self):
+        for x, window in self.cases():
+            starts, ends = expand_runs(*find_runs(x), window, x.shape[0])
+            expected = find_runs(deconvolve(x, window))
+            np.testing.assert_array_equal(starts, expected[0])
+            np.testing.assert_array_equal(ends, expected[1])
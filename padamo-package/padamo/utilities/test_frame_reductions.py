@@ -0,0 +1,53 @@
+import unittest
+import numpy as np
+from .frame_reductions import frame_sum, frame_max, frame_quantile, frame_median, frame_any_above, frame_any, \
+    single_frame
+
+
+class TestFrameReductions(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        self.x = rng.normal(0.0, 1.0, (50, 6, 7))
+        self.x[3, 2, 2] = np.nan
+        self.pixelmap = rng.random((6, 7)) > 0.3
+        self.ints = rng.integers(0, 10, (50, 6, 7))
+
+    def test_sum(self):
+        np.testing.assert_allclose(frame_sum(self.x), np.sum(self.x, axis=(1, 2)))
+        np.testing.assert_allclose(frame_sum(self.x, self.pixelmap), np.sum(self.x[:, self.pixelmap], axis=1))
+        np.testing.assert_array_equal(frame_sum(self.ints), np.sum(self.ints, axis=(1, 2)))
+
+    def test_max(self):
+        np.testing.assert_array_equal(frame_max(self.x), np.max(self.x, axis=(1, 2)))
+        np.testing.assert_array_equal(frame_max(self.x, self.pixelmap), np.max(self.x[:, self.pixelmap], axis=1))
+        np.testing.assert_array_equal(frame_max(self.ints), np.max(self.ints, axis=(1, 2)))
+
+    def test_quantile(self):
+        # Interpolation of numba may differ from numpy in last bit
+        for q in (0.0, 0.1, 0.5, 0.9, 1.0):
+            np.testing.assert_allclose(frame_quantile(self.x, q), np.quantile(self.x, q, axis=(1, 2)), atol=1e-14)
+            np.testing.assert_allclose(frame_quantile(self.x, q, self.pixelmap),
+                                       np.quantile(self.x[:, self.pixelmap], q, axis=1), atol=1e-14)
+        np.testing.assert_array_equal(frame_median(self.ints), np.median(self.ints, axis=(1, 2)))
+        self.assertTrue(np.isnan(frame_median(self.x, np.zeros((6, 7), dtype=bool))).all())
+
+    def test_any(self):
+        for threshold in (0.0, 2.0, 5.0):
+            np.testing.assert_array_equal(frame_any_above(self.x, threshold), (self.x > threshold).any(axis=(1, 2)))
+            np.testing.assert_array_equal(frame_any_above(self.x, threshold, self.pixelmap),
+                                          (self.x[:, self.pixelmap] > threshold).any(axis=1))
+        mask = self.x > 2.0
+        np.testing.assert_array_equal(frame_any(mask), np.logical_or.reduce(mask, axis=(1, 2)))
+        np.testing.assert_array_equal(frame_any(self.ints % 2), np.logical_or.reduce(self.ints % 2, axis=(1, 2)))
+
+    def test_single_frame(self):
+        frame = self.x[7]
+        self.assertAlmostEqual(single_frame(frame_sum, frame), np.sum(frame))
+        self.assertEqual(single_frame(frame_max, frame), np.max(frame))
+        self.assertAlmostEqual(single_frame(frame_quantile, frame, 0.9), np.quantile(frame, 0.9), places=14)
+        self.assertEqual(single_frame(frame_median, frame, pixelmap=self.pixelmap), np.median(frame[self.pixelmap]))
+        self.assertTrue(np.isnan(single_frame(frame_sum, self.x[3])))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+import numpy as np
+from padamo.lazy_array_operations.basic_operations import ConstantArray
+from .run_trigger import RunTrigger, find_runs
+
+
+def encoded(x):
+    return RunTrigger(*find_runs(x), x.shape[0])
+
+
+class TestRunTrigger(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(6)
+        self.frames = [rng.random(200) < density for density in (0.0, 0.05, 0.5, 1.0)]
+        self.pixels = rng.random((200, 3, 4)) < 0.02
+
+    def test_algebra(self):
+        for a in self.frames:
+            ta = encoded(a)
+            np.testing.assert_array_equal(ta.complement().request_all_data(), ~a)
+            for b in self.frames:
+                tb = encoded(b)
+                np.testing.assert_array_equal(ta.intersection(tb).request_all_data(), a & b)
+                np.testing.assert_array_equal(ta.union(tb).request_all_data(), a | b)
+
+    def test_dilated(self):
+        for a in self.frames:
+            res = np.zeros_like(a)
+            for i in np.flatnonzero(a):
+                res[max(i-2, 0):i+4] = True
+            np.testing.assert_array_equal(encoded(a).dilated(2, 3).request_all_data(), res)
+
+    def test_length_mismatch(self):
+        with self.assertRaises(ValueError):
+            encoded(self.frames[1]).union(encoded(self.frames[1][:100]))
+
+    def test_from_lazy(self):
+        trigger = RunTrigger.from_lazy(ConstantArray(self.pixels), chunk_len=16)
+        np.testing.assert_array_equal(trigger.request_all_data(), self.pixels)
+        np.testing.assert_array_equal(trigger.request_data(slice(10, 150, 3)), self.pixels[10:150:3])
+        for i in (0, 17, -1, -50):
+            np.testing.assert_array_equal(trigger.request_data(i), self.pixels[i])
+        marginal = RunTrigger.from_lazy(ConstantArray(self.pixels), per_pixel=False, chunk_len=16)
+        np.testing.assert_array_equal(marginal.request_all_data(), self.pixels.any(axis=(1, 2)))
+        np.testing.assert_array_equal(trigger.marginalized().request_all_data(), self.pixels.any(axis=(1, 2)))
+        # Complement of per-pixel trigger is taken for frames
+        np.testing.assert_array_equal(trigger.complement().request_all_data(), ~self.pixels.any(axis=(1, 2)))
+
+    def test_slicing_and_extend(self):
+        x = self.pixels.copy()
+        # Event crossing the junction of two parts
+        x[99:102, 1, 1] = True
+        trigger = RunTrigger.from_lazy(ConstantArray(x))
+        for a, b in ((0, 100), (37, 163), (100, 200), (50, 50)):
+            np.testing.assert_array_equal(trigger[a:b].request_all_data(), x[a:b])
+        joined = trigger[:100].extend(trigger[100:])
+        self.assertIsInstance(joined, RunTrigger)
+        np.testing.assert_array_equal(joined.starts, trigger.starts)
+        np.testing.assert_array_equal(joined.ends, trigger.ends)
+        np.testing.assert_array_equal(joined.request_all_data(), x)
+
+    def test_next_run_start(self):
+        x = self.frames[1]
+        trigger = encoded(x)
+        rising = np.flatnonzero(x & ~np.concatenate([[False], x[:-1]]))
+        for i in range(-1, 200):
+            following = rising[rising > i]
+            expected = int(following[0]) if following.shape[0] > 0 else None
+            self.assertEqual(trigger.next_run_start(i), expected)
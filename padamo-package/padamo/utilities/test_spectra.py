@@ -0,0 +1,61 @@
+import unittest
+import numpy as np
+from numpy.fft import fft, ifft, fftfreq
+from padamo.lazy_array_operations.basic_operations import ConstantArray
+from .dual_signal import Signal
+from .spectra import LazyFilter, LazyFilterBank, ButterworthFilter, HardBandPassFilter, DualButterworthBandFilter
+
+
+def window_fft_filter(x, time, filter_, window):
+    # Former LazyFilter: spectral mask applied to every window, centre sample is kept
+    res = np.empty((x.shape[0]-window+1,)+x.shape[1:])
+    for i in range(res.shape[0]):
+        modulator = filter_.build(fftfreq(window, time[i+1]-time[i]))
+        spectrum = fft(x[i:i+window], axis=0)
+        mod_spectrum = spectrum*modulator.reshape((window,)+(1,)*(x.ndim-1))
+        res[i] = np.real(ifft(mod_spectrum, axis=0)[window//2])
+    return res
+
+
+class TestLazyFilter(unittest.TestCase):
+    WINDOW = 64
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.x = rng.normal(0.0, 1.0, (500, 3, 4))
+        self.time = np.arange(500)*1e-3
+        self.signal = Signal(ConstantArray(self.x), ConstantArray(self.time), None)
+        self.filters = [
+            ButterworthFilter(50.0, 2),
+            HardBandPassFilter.band(100.0, 40.0),
+            DualButterworthBandFilter.symmetrical_band_filter(150.0, 60.0, 3),
+        ]
+
+    def check(self, op, expected):
+        length = expected.shape[0]
+        requests = [slice(None), slice(100, 300), slice(0, 5), slice(length-5, length), slice(-7, None),
+                    slice(3, 200, 7), 0, 250, length-1, -1]
+        for request in requests:
+            np.testing.assert_allclose(op.request_data(request), expected[request], atol=1e-12,
+                                       err_msg=str(request))
+
+    def test_single_filter(self):
+        for filter_ in self.filters:
+            expected = window_fft_filter(self.x, self.time, filter_, self.WINDOW)
+            self.check(LazyFilter(self.signal, filter_, self.WINDOW), expected)
+
+    def test_odd_window(self):
+        filter_ = self.filters[0]
+        expected = window_fft_filter(self.x, self.time, filter_, self.WINDOW+1)
+        self.check(LazyFilter(self.signal, filter_, self.WINDOW+1), expected)
+
+    def test_filter_bank(self):
+        bank = LazyFilterBank(self.signal, self.filters, self.WINDOW)
+        expected = np.stack([window_fft_filter(self.x, self.time, filter_, self.WINDOW)
+                             for filter_ in self.filters], axis=1)
+        self.check(bank, expected)
+        np.testing.assert_allclose(bank.request_data((slice(100, 300), 1)), expected[100:300, 1], atol=1e-12)
+
+
+if __name__ == '__main__':
+    unittest.main()